@@ -6,13 +6,68 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
 
-def create_app(test_config=None):
+def create_app(test_config=None, instance_path=None):
     # create and configure the app
-    app = Flask(__name__, instance_relative_config=True)
+    app = Flask(__name__, instance_path=instance_path, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY='dev',
-        SQLALCHEMY_DATABASE_URI=f'sqlite:///{os.path.join(app.instance_path, "spartantrack.sqlite")}',
+        SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL')
+        or f'sqlite:///{os.path.join(app.instance_path, "spartantrack.sqlite")}',
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Connection pool for server databases such as PostgreSQL (not SQLite)
+        DB_POOL_SIZE=5,
+        DB_MAX_OVERFLOW=10,
+        DB_POOL_RECYCLE=1800,
+        DB_POOL_PRE_PING=True,
+        # Create missing tables at startup; turn off when using `flask db upgrade`
+        DB_AUTO_CREATE=True,
+        # Trust the X-Team header to pick the team database (multi-team only);
+        # otherwise requests are routed by host name alone
+        TEAM_HEADER_ENABLED=False,
+        # Repeat badge scans of the same idhash within this window are ignored
+        CHECKIN_DEBOUNCE_SECONDS=2.0,
+        CHECKIN_DEBOUNCE_SIZE=1024,
+        # In-memory rejection of unknown badge idhashes (see flaskr/badges.py)
+        BADGE_FILTER_ENABLED=True,
+        BADGE_FILTER_MAX_AGE=60,
+        # Seconds between checks for cache changes made by other workers
+        # (0: every request; on SQLite files an unchanged database costs one PRAGMA)
+        CACHE_CHECK_INTERVAL=0,
+        # Seconds between rebuilds of the shared presence snapshot file from the
+        # members table, catching up after a worker died mid-update (0: never)
+        PRESENCE_RECONCILE_INTERVAL=60,
+        # Stored outcomes of requests sent with an Idempotency-Key header
+        IDEMPOTENCY_TTL=86400,
+        IDEMPOTENCY_MAX_KEYS=10000,
+        # Claims per worker between prunes of expired and excess keys
+        IDEMPOTENCY_PRUNE_EVERY=100,
+        # Kiosk scan batches (POST /api/scans): size limit and oldest scan applied
+        SCAN_BATCH_MAX=500,
+        SCAN_MAX_AGE=86400,
+        # Local time at which stragglers are checked out automatically
+        AUTO_CHECKOUT_TIME='22:00',
+        AUTO_CHECKOUT_SCHEDULER=False,
+        # Local time of the daily `flask db-maintain` run by the in-process scheduler
+        DB_MAINTENANCE_TIME='03:30',
+        DB_MAINTENANCE_SCHEDULER=False,
+        # Negotiated gzip/brotli compression of dynamic responses
+        COMPRESS_ENABLED=True,
+        COMPRESS_MIN_SIZE=500,
+        COMPRESS_GZIP_LEVEL=6,
+        COMPRESS_BR_LEVEL=4,
+        # Retries of writes that hit "database is locked"
+        WRITE_RETRIES=5,
+        WRITE_RETRY_BASE_DELAY=0.05,
+        WRITE_RETRY_MAX_DELAY=1.0,
+        # Opt-in request profiling (see flaskr/profiling.py)
+        PROFILE_ENABLED=False,
+        PROFILE_SAMPLE_RATE=0,
+        PROFILE_ENDPOINTS=None,
+        PROFILE_HEADER='X-Profile',
+        # Season hours target used by the attendance reports (None to omit)
+        REQUIRED_HOURS=None,
+        # Processes used by `flask reports build` (None: one per CPU)
+        REPORTS_WORKERS=None,
     )
 
     if test_config is None:
@@ -29,8 +84,16 @@ def create_app(test_config=None):
         pass
 
     # Initialize extensions
-    from . import db, models
+    from . import db, metrics, models, positions, teams
+    metrics.init_app(app)
+    positions.init_app(app)
+    teams.configure_binds(app)
     db.init_app(app)
+    teams.init_app(app)
+
+    # Drop in-process caches that other workers made stale
+    from . import coherence
+    coherence.init_app(app)
     
     # Initialize Flask-Migrate
     from flask_migrate import Migrate
@@ -44,6 +107,59 @@ def create_app(test_config=None):
     from . import routes
     routes.init_app(app)
 
+    # Shared presence snapshot for the dashboard counters
+    from . import presence
+    presence.init_app(app)
+
+    # Request profiling
+    from . import profiling
+    profiling.init_app(app)
+
+    # Response compression
+    from . import compression
+    compression.init_app(app)
+
+    # Fingerprinted static assets
+    from . import assets
+    assets.init_app(app)
+
+    # Archived attendance segments
+    from . import archive
+    archive.init_app(app)
+
+    # Vectorized attendance reports (flask reports ...)
+    from . import analytics, season_reports
+    analytics.init_app(app)
+    season_reports.init_app(app)
+
+    # Bulk roster changes (flask update-members)
+    from . import roster
+    roster.init_app(app)
+
+    # Weekday x hour occupancy heatmap
+    from . import occupancy
+    occupancy.init_app(app)
+
+    # Unknown badges are rejected before any database access
+    from . import badges
+    badges.init_app(app)
+
+    # Headless kiosk client (flask kiosk)
+    from . import kiosk
+    kiosk.init_app(app)
+
+    # Prebuilt hot-path statements (flask benchmark-queries)
+    from . import statements
+    statements.init_app(app)
+
+    # Optional in-process scheduler for batch jobs
+    from . import jobs
+    jobs.init_app(app)
+
+    # Database maintenance (flask db-maintain)
+    from . import maintenance
+    maintenance.init_app(app)
+
     # a simple page that says hello
     @app.route('/hello')
     def hello():
@@ -0,0 +1,336 @@
+"""Vectorized attendance analytics.
+
+Visits for a date range (live and archived, see :func:`archive.load_visits`)
+are loaded in bulk into NumPy arrays, and every metric is computed with
+whole-array operations (``bincount``, ``unique``) instead of a Python loop
+per row:
+
+* per member: total hours, visits, meetings attended (distinct days),
+  average visit length and percent of ``REQUIRED_HOURS``;
+* per position: total hours and distinct members;
+* per week (starting Monday): total hours and distinct members.
+
+NumPy is an optional dependency (the ``reports`` extra). The reports are
+served under ``/api/reports/`` and by ``flask reports``. ``flask reports
+benchmark`` times them against :func:`naive_member_stats`, a plain loop
+over ORM rows and archived visits that is also used as the reference
+implementation in the tests.
+"""
+
+import itertools
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .archive import EPOCH, archived_visits, load_visits, season_bounds
+from .db import db
+from .models import Attendance, AttendanceBitmap, Member
+from .positions import get_registry
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+MICROS_PER_HOUR = 3600 * 10 ** 6
+MICROS_PER_DAY = 24 * MICROS_PER_HOUR
+
+reports_cli = AppGroup('reports', help='Attendance reports.')
+
+
+class AnalyticsUnavailable(RuntimeError):
+    """Raised when NumPy is not installed."""
+
+
+def require_numpy():
+    if np is None:
+        raise AnalyticsUnavailable(
+            'Attendance analytics need NumPy: pip install ".[reports]"')
+
+
+def current_season_range():
+    """Return the ``[start, end)`` of the current season."""
+    season, _ = AttendanceBitmap.season_of(date.today())
+    return season_bounds(season)
+
+
+class Intervals:
+    """Visits for a range as parallel NumPy arrays.
+
+    The visits are loaded with :func:`archive.load_visits` unless given as
+    ``visits``, rows starting with ``(member_id, checked_in_at, checked_out_at)``.
+    """
+
+    # Per-visit columns; members and member_index are derived from member_id
+    COLUMNS = ('member_id', 'checked_in', 'checked_out', 'hours', 'day')
+
+    def __init__(self, start, end, now=None, visits=None):
+        require_numpy()
+        if visits is None:
+            visits = load_visits(start, end)
+        now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+        now = np.datetime64(now, 'us')
+        columns = list(zip(*visits)) or [(), (), ()]
+
+        self.member_id = np.array(columns[0], dtype=np.int64)
+        self.checked_in = np.array(columns[1], dtype='datetime64[us]').astype(np.int64)
+        # Open visits count up to now (NaT marks a missing check-out)
+        checked_out = np.array(columns[2], dtype='datetime64[us]')
+        checked_out = np.where(np.isnat(checked_out), now, checked_out)
+        self.checked_out = checked_out.astype(np.int64)
+        elapsed = np.clip(self.checked_out - self.checked_in, 0, None)
+        self.hours = elapsed / MICROS_PER_HOUR
+
+        # Local calendar day of each check-in (using the current UTC offset)
+        offset = int(datetime.now().astimezone().utcoffset().total_seconds()) * 10 ** 6
+        self.day = (self.checked_in + offset) // MICROS_PER_DAY
+
+        self._index()
+
+    def _index(self):
+        # Dense member index so results can be built with bincount
+        self.members, self.member_index = np.unique(self.member_id, return_inverse=True)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Combine the intervals of several ranges into one."""
+        if not parts:
+            return cls(None, None, visits=[])
+        merged = cls.__new__(cls)
+        for name in cls.COLUMNS:
+            setattr(merged, name,
+                    np.concatenate([getattr(part, name) for part in parts]))
+        merged._index()
+        return merged
+
+    def __len__(self):
+        return len(self.member_id)
+
+
+def _distinct_per_group(group_index, values, groups):
+    """Count distinct ``values`` within each of ``groups`` groups."""
+    if len(values) == 0:
+        return np.zeros(groups, dtype=np.int64)
+    pairs = np.unique(np.stack([group_index, values]), axis=1)
+    return np.bincount(pairs[0], minlength=groups)
+
+
+# Additive per-member sums behind member_stats: sorted member ids, their
+# hours and visits, and the distinct (member id, day) pairs as a 2 x N array
+MemberTotals = namedtuple('MemberTotals', 'members hours visits member_days')
+
+
+def _unique_pairs(first, second):
+    if len(first) == 0:
+        return np.zeros((2, 0), dtype=np.int64)
+    return np.unique(np.stack([first, second]), axis=1)
+
+
+def member_totals(intervals):
+    """Return the :class:`MemberTotals` of a set of intervals."""
+    n = len(intervals.members)
+    return MemberTotals(
+        intervals.members,
+        np.bincount(intervals.member_index, weights=intervals.hours, minlength=n),
+        np.bincount(intervals.member_index, minlength=n),
+        _unique_pairs(intervals.member_id, intervals.day),
+    )
+
+
+def merge_member_totals(parts):
+    """Combine the :class:`MemberTotals` of several ranges into one."""
+    if not parts:
+        return member_totals(Intervals(None, None, visits=[]))
+    members, index = np.unique(np.concatenate([part.members for part in parts]),
+                               return_inverse=True)
+    pairs = np.concatenate([part.member_days for part in parts], axis=1)
+    return MemberTotals(
+        members,
+        np.bincount(index, weights=np.concatenate([part.hours for part in parts]),
+                    minlength=len(members)),
+        np.bincount(index, weights=np.concatenate([part.visits for part in parts]),
+                    minlength=len(members)).astype(np.int64),
+        _unique_pairs(*pairs),
+    )
+
+
+def member_stats(intervals):
+    """Return per-member totals for a set of intervals."""
+    return stats_from_totals(member_totals(intervals))
+
+
+def stats_from_totals(totals):
+    """Return the :func:`member_stats` rows for :class:`MemberTotals`."""
+    members, hours, visits, member_days = totals
+    n = len(members)
+    meetings = np.bincount(np.searchsorted(members, member_days[0]), minlength=n)
+    required = current_app.config.get('REQUIRED_HOURS')
+
+    return [{
+        'member_id': int(members[i]),
+        'total_hours': round(float(hours[i]), 2),
+        'visits': int(visits[i]),
+        'meetings_attended': int(meetings[i]),
+        'average_visit_hours': round(float(hours[i] / visits[i]), 2),
+        'percent_required': (round(float(hours[i] / required * 100), 1)
+                             if required else None)
+    } for i in range(n)]
+
+
+def position_stats(intervals):
+    """Return total hours and distinct members per position."""
+    rows = db.session.query(Member.id, Member.position_id).filter(
+        Member.id.in_(intervals.members.tolist())
+    ).all()
+    position_of = dict(rows)
+    member_position = np.array([position_of.get(int(m), 0) for m in intervals.members],
+                               dtype=np.int64)
+    positions, position_index = np.unique(member_position, return_inverse=True)
+
+    visit_position = position_index[intervals.member_index]
+    hours = np.bincount(visit_position, weights=intervals.hours,
+                        minlength=len(positions))
+    members = np.bincount(position_index, minlength=len(positions))
+    registry = get_registry()
+
+    return [{
+        'position_id': int(position_id),
+        'position': registry.name_of(int(position_id)),
+        'total_hours': round(float(hours[i]), 2),
+        'members': int(members[i])
+    } for i, position_id in enumerate(positions)]
+
+
+def week_stats(intervals):
+    """Return total hours and distinct members per week (weeks start Monday)."""
+    # 1970-01-01 was a Thursday, so shift by three days to start weeks on Monday
+    week = (intervals.day + 3) // 7
+    weeks, week_index = np.unique(week, return_inverse=True)
+    hours = np.bincount(week_index, weights=intervals.hours, minlength=len(weeks))
+    members = _distinct_per_group(week_index, intervals.member_id, len(weeks))
+
+    return [{
+        'week_start': (EPOCH + timedelta(days=int(w) * 7 - 3)).date().isoformat(),
+        'total_hours': round(float(hours[i]), 2),
+        'members': int(members[i])
+    } for i, w in enumerate(weeks)]
+
+
+def naive_member_stats(start, end, now=None):
+    """Per-member totals computed row by row (the baseline).
+
+    Reads the same visits as :class:`Intervals`: live ORM objects and the
+    archived seasons.
+    """
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    offset = datetime.now().astimezone().utcoffset()
+    required = current_app.config.get('REQUIRED_HOURS')
+    live = Attendance.query.filter(Attendance.checked_in_at >= start,
+                                   Attendance.checked_in_at < end)
+    visits = itertools.chain(
+        ((visit.member_id, visit.checked_in_at, visit.checked_out_at)
+         for visit in live),
+        (visit[:3] for visit in archived_visits(start, end)),
+    )
+    totals = {}
+    for member_id, checked_in_at, checked_out_at in visits:
+        entry = totals.setdefault(member_id, {'hours': 0.0, 'visits': 0, 'days': set()})
+        checked_out = checked_out_at or now
+        entry['hours'] += max((checked_out - checked_in_at).total_seconds(), 0) / 3600
+        entry['visits'] += 1
+        entry['days'].add((checked_in_at + offset).date())
+
+    return [{
+        'member_id': member_id,
+        'total_hours': round(entry['hours'], 2),
+        'visits': entry['visits'],
+        'meetings_attended': len(entry['days']),
+        'average_visit_hours': round(entry['hours'] / entry['visits'], 2),
+        'percent_required': (round(entry['hours'] / required * 100, 1)
+                             if required else None)
+    } for member_id, entry in sorted(totals.items())]
+
+
+REPORTS = {
+    'members': member_stats,
+    'positions': position_stats,
+    'weeks': week_stats,
+}
+
+
+def build_report(kind, start=None, end=None):
+    """Compute one of the ``REPORTS`` for a range (default: current season)."""
+    if start is None or end is None:
+        start, end = current_season_range()
+    return REPORTS[kind](Intervals(start, end))
+
+
+def naive_utc(value):
+    """Return a datetime as naive UTC, the form timestamps are stored in.
+
+    Naive values are taken to be UTC already.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _parse_range(start, end):
+    if start is None or end is None:
+        return current_season_range()
+    try:
+        return tuple(naive_utc(datetime.fromisoformat(value)) for value in (start, end))
+    except ValueError as exc:
+        raise click.BadParameter(str(exc))
+
+
+@reports_cli.command('show')
+@click.argument('kind', type=click.Choice(sorted(REPORTS)))
+@click.option('--start', default=None, help='Start date (ISO); default: season start.')
+@click.option('--end', default=None, help='End date (ISO); default: season end.')
+def show_report_command(kind, start, end):
+    """Print a report as a table."""
+    rows = build_report(kind, *_parse_range(start, end))
+    if not rows:
+        click.echo('No attendance in range.')
+        return
+    headers = list(rows[0])
+    click.echo('\t'.join(headers))
+    for row in rows:
+        click.echo('\t'.join('' if row[h] is None else str(row[h]) for h in headers))
+
+
+@reports_cli.command('benchmark')
+@click.option('--start', default=None, help='Start date (ISO); default: season start.')
+@click.option('--end', default=None, help='End date (ISO); default: season end.')
+@click.option('--repeat', default=5, help='Timing repetitions.')
+def benchmark_command(start, end, repeat):
+    """Time the vectorized member report against the naive ORM loop."""
+    start, end = _parse_range(start, end)
+
+    def best_of(func):
+        best = float('inf')
+        for _ in range(repeat):
+            db.session.expunge_all()
+            began = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - began)
+        return best
+
+    naive = best_of(lambda: naive_member_stats(start, end))
+    vectorized = best_of(lambda: member_stats(Intervals(start, end)))
+    visits = len(Intervals(start, end))
+    click.echo(f'{visits} visit(s)')
+    click.echo(f'naive ORM loop: {naive * 1000:.2f} ms')
+    click.echo(f'vectorized:     {vectorized * 1000:.2f} ms')
+    if vectorized:
+        click.echo(f'speed-up:       {naive / vectorized:.1f}x')
+
+
+def init_app(app):
+    """Register the reports command group."""
+    app.cli.add_command(reports_cli)
@@ -0,0 +1,306 @@
+"""Archival of closed seasons' attendance visits into immutable segments.
+
+``flask archive`` moves the ``Attendance`` rows of closed seasons out of
+the live database into segment files under ``instance/archive/`` (one
+directory per team). A segment is a packed, column-oriented binary file:
+
+    header   magic, row count, season
+    columns  member_id int32[n], checked_in int64[n], checked_out int64[n],
+             auto_checkout uint8[n]
+
+Timestamps are microseconds since the Unix epoch (UTC) and rows are
+sorted by check-in time, so a date range is found by binary search over
+the memory-mapped check-in column without reading the rest of the file.
+``index.json`` lists every segment with its season, row count and time
+range. Segments are never modified; archiving more rows for a season
+writes an additional segment.
+
+Archiving is idempotent. Each index entry also records the range of
+``Attendance`` ids it covers and the ids in that range that were still
+open, and so left out. A run that finds rows already covered by a
+segment, because an earlier run stopped before deleting them, only
+deletes them. Runs take a lock on the archive directory, so overlapping
+runs take turns.
+
+The per-season attendance bitmaps are tiny and stay in the database.
+:func:`load_visits` returns visits for a date range from the database and
+from any archived segments that overlap it.
+"""
+
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .cli import for_each_team, team_echo, team_options
+from .db import db
+from .models import Attendance, AttendanceBitmap
+from .teams import current_team
+from .writes import run_write
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+MAGIC = b'TLSEG001'
+HEADER = struct.Struct('<8sQI')
+INDEX = 'index.json'
+LOCK = 'index.lock'
+# Ids deleted per statement, well below SQLite's bound parameter limit
+DELETE_BATCH = 500
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_micros(value):
+    """Convert a naive UTC datetime to epoch microseconds."""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    """Convert epoch microseconds back to a naive UTC datetime."""
+    return EPOCH + timedelta(microseconds=value)
+
+
+def archive_dir(app=None):
+    """Return the archive directory of the current team."""
+    app = app or current_app
+    root = app.config.get('ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+    return os.path.join(root, current_team() or 'default')
+
+
+def season_bounds(season):
+    """Return the ``[start, end)`` of a season as naive UTC datetimes."""
+    def local_midnight_utc(day):
+        midnight = datetime.combine(day, datetime.min.time()).astimezone(timezone.utc)
+        return midnight.replace(tzinfo=None)
+
+    return (local_midnight_utc(AttendanceBitmap.season_start(season)),
+            local_midnight_utc(AttendanceBitmap.season_start(season + 1)))
+
+
+def read_index(directory):
+    """Return the segment index of an archive directory."""
+    try:
+        with open(os.path.join(directory, INDEX)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+@contextmanager
+def archive_lock(directory):
+    """Hold an exclusive lock on an archive directory, across processes."""
+    os.makedirs(directory, exist_ok=True)
+    fd = os.open(os.path.join(directory, LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_segment(directory, season, rows, coverage=None):
+    """Write rows of ``(member_id, in_us, out_us, auto)`` as a new segment.
+
+    ``coverage`` holds the ``first_id``, ``last_id`` and ``open_ids`` recorded
+    in the index. Call with :func:`archive_lock` held.
+    """
+    rows = sorted(rows, key=lambda row: row[1])
+    columns = [
+        array('i', (row[0] for row in rows)),
+        array('q', (row[1] for row in rows)),
+        array('q', (row[2] for row in rows)),
+        array('B', (row[3] for row in rows)),
+    ]
+    data = (HEADER.pack(MAGIC, len(rows), season)
+            + b''.join(c.tobytes() for c in columns))
+
+    index = read_index(directory)
+    number = sum(1 for entry in index if entry['season'] == season) + 1
+    name = f'attendance-{season}-{number}.seg'
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(os.path.join(directory, name), data)
+
+    index.append({
+        'season': season,
+        'file': name,
+        'rows': len(rows),
+        'start': rows[0][1] if rows else None,
+        'end': rows[-1][1] if rows else None,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        **(coverage or {}),
+    })
+    _write_atomic(os.path.join(directory, INDEX), json.dumps(index, indent=2).encode())
+    return name
+
+
+class Segment:
+    """Read-only, memory-mapped view of a segment file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, self.season = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not an attendance segment')
+        view = memoryview(self._map)[HEADER.size:]
+        n = self.rows
+        self.member_id = view[:4 * n].cast('i')
+        self.checked_in = view[4 * n:12 * n].cast('q')
+        self.checked_out = view[12 * n:20 * n].cast('q')
+        self.auto_checkout = view[20 * n:21 * n]
+
+    def between(self, start_us, end_us):
+        """Yield rows whose check-in falls in ``[start_us, end_us)``."""
+        lo = bisect.bisect_left(self.checked_in, start_us)
+        hi = bisect.bisect_left(self.checked_in, end_us, lo)
+        for i in range(lo, hi):
+            yield (self.member_id[i], self.checked_in[i], self.checked_out[i],
+                   bool(self.auto_checkout[i]))
+
+    def close(self):
+        for column in (self.member_id, self.checked_in, self.checked_out,
+                       self.auto_checkout):
+            column.release()
+        self._map.close()
+
+
+def archived_visits(start, end, directory=None):
+    """Yield archived ``(member_id, checked_in_at, checked_out_at, auto)`` rows.
+
+    Only visits checked in within ``[start, end)`` are yielded.
+    """
+    directory = directory or archive_dir()
+    start_us, end_us = to_micros(start), to_micros(end)
+    for entry in read_index(directory):
+        if entry['rows'] == 0 or entry['end'] < start_us or entry['start'] >= end_us:
+            continue
+        segment = Segment(os.path.join(directory, entry['file']))
+        try:
+            for member_id, in_us, out_us, auto in segment.between(start_us, end_us):
+                yield member_id, from_micros(in_us), from_micros(out_us), auto
+        finally:
+            segment.close()
+
+
+def load_visits(start, end):
+    """Return visits checked in during ``[start, end)`` from the database and archive.
+
+    ``start`` and ``end`` are naive UTC datetimes. Rows are
+    ``(member_id, checked_in_at, checked_out_at, auto_checkout)``.
+    """
+    rows = db.session.query(
+        Attendance.member_id, Attendance.checked_in_at, Attendance.checked_out_at,
+        Attendance.auto_checkout
+    ).filter(Attendance.checked_in_at >= start, Attendance.checked_in_at < end)
+    visits = [tuple(row) for row in rows]
+    visits.extend(archived_visits(start, end))
+    visits.sort(key=lambda visit: visit[1])
+    return visits
+
+
+def closed_seasons():
+    """Return the seasons with visits in the database that have ended."""
+    current, _ = AttendanceBitmap.season_of(datetime.now().date())
+    first = db.session.query(db.func.min(Attendance.checked_in_at)).scalar()
+    if first is None:
+        return []
+    oldest, _ = AttendanceBitmap.season_of(first.date())
+    return list(range(oldest, current))
+
+
+def _covered(entry, visit_id):
+    """Return True if an index entry's segment holds the visit with ``visit_id``."""
+    if entry.get('first_id') is None:
+        return False
+    return (entry['first_id'] <= visit_id <= entry['last_id']
+            and visit_id not in entry['open_ids'])
+
+
+def archive_season(season):
+    """Move a closed season's finished visits into a segment. Returns the row count."""
+    start, end = season_bounds(season)
+    in_season = (Attendance.checked_in_at >= start, Attendance.checked_in_at < end)
+    directory = archive_dir()
+
+    with archive_lock(directory):
+        segments = [entry for entry in read_index(directory)
+                    if entry['season'] == season]
+        visits = db.session.query(
+            Attendance.id, Attendance.member_id, Attendance.checked_in_at,
+            Attendance.checked_out_at, Attendance.auto_checkout
+        ).filter(*in_season, Attendance.checked_out_at.isnot(None)).all()
+        if not visits:
+            return 0
+
+        # Rows an interrupted run already archived are only deleted
+        new = [visit for visit in visits
+               if not any(_covered(entry, visit.id) for entry in segments)]
+        if new:
+            new_ids = {visit.id for visit in new}
+            first_id, last_id = min(new_ids), max(new_ids)
+            in_span = db.session.query(Attendance.id).filter(
+                *in_season, Attendance.id.between(first_id, last_id))
+            open_ids = [visit_id for visit_id, in in_span if visit_id not in new_ids]
+            rows = [(visit.member_id, to_micros(visit.checked_in_at),
+                     to_micros(visit.checked_out_at), int(visit.auto_checkout))
+                    for visit in new]
+            # The segment is durable before the rows leave the database
+            write_segment(directory, season, rows, {
+                'first_id': first_id, 'last_id': last_id, 'open_ids': open_ids})
+
+        ids = [visit.id for visit in visits]
+
+        def delete():
+            for i in range(0, len(ids), DELETE_BATCH):
+                batch = ids[i:i + DELETE_BATCH]
+                Attendance.query.filter(Attendance.id.in_(batch)).delete(
+                    synchronize_session=False)
+            db.session.commit()
+
+        run_write(delete)
+    return len(new)
+
+
+@click.command()
+@click.option('--season', type=int, default=None,
+              help='Archive a single season (default: every closed season).')
+@team_options
+@with_appcontext
+def archive_command(season, team, all_teams):
+    """Move closed seasons' attendance visits into archive segments."""
+    current, _ = AttendanceBitmap.season_of(datetime.now().date())
+    if season is not None and season >= current:
+        raise click.BadParameter('Only closed seasons can be archived.',
+                                 param_hint='--season')
+
+    for name in for_each_team(team, all_teams):
+        for closed in [season] if season is not None else closed_seasons():
+            count = archive_season(closed)
+            team_echo(name, f'Archived {count} visit(s) from season {closed}.')
+
+
+def init_app(app):
+    """Register the archive command."""
+    app.cli.add_command(archive_command, name='archive')
@@ -0,0 +1,151 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask build-assets`` copies every file in the static folder to the
+asset build directory (``instance/assets`` by default) under a name that
+includes a hash of its contents, writes gzip and (when the ``brotli``
+package is installed) brotli variants of the text files next to it, and
+records the mapping in ``manifest.json``.
+
+Templates call ``asset_url('css/styles.css')``. Once the assets are built
+this points at the fingerprinted copy under ``/assets/``, which is served
+with a one-year immutable cache lifetime and the best precompressed
+variant the client accepts. Before a build it falls back to the normal
+static URL.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt', '.html'}
+
+# (Accept-Encoding token, file suffix) in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+bp = Blueprint('assets', __name__)
+
+
+def build_dir(app):
+    """Return the directory the fingerprinted assets are written to."""
+    return (app.config.get('ASSETS_BUILD_DIR')
+            or os.path.join(app.instance_path, 'assets'))
+
+
+def fingerprint(path, length=12):
+    """Return a short content hash for a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_assets(app):
+    """Fingerprint and precompress the static folder. Returns the manifest."""
+    source = app.static_folder
+    target = build_dir(app)
+    manifest = {}
+
+    for root, _, files in os.walk(source):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            logical = os.path.relpath(path, source).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f'{stem}.{fingerprint(path)}{ext}'
+            manifest[logical] = hashed
+
+            out = os.path.join(target, *hashed.split('/'))
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(path, 'rb') as f:
+                data = f.read()
+            _write_atomic(out, data)
+
+            if ext.lower() in COMPRESSIBLE:
+                _write_atomic(out + '.gz',
+                              gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write_atomic(out + '.br', brotli.compress(data))
+
+    os.makedirs(target, exist_ok=True)
+    _write_atomic(os.path.join(target, MANIFEST),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode())
+    app.extensions['asset_manifest'] = manifest
+    return manifest
+
+
+def load_manifest(app):
+    """Load the asset manifest, if the assets have been built."""
+    try:
+        with open(os.path.join(build_dir(app), MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def asset_url(filename):
+    """Template helper returning the fingerprinted URL for a static file."""
+    hashed = current_app.extensions.get('asset_manifest', {}).get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=hashed)
+
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted asset with immutable caching."""
+    directory = build_dir(current_app)
+    if not os.path.isfile(os.path.join(directory, *filename.split('/'))):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding, suffix = None, ''
+    for token, ext in ENCODINGS:
+        if request.accept_encodings[token] and os.path.isfile(
+                os.path.join(directory, *(filename + ext).split('/'))):
+            encoding, suffix = token, ext
+            break
+
+    response = send_from_directory(directory, filename + suffix, mimetype=mimetype,
+                                   max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
+
+@click.command()
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the static assets."""
+    manifest = build_assets(current_app)
+    click.echo(f'Built {len(manifest)} asset(s) into {build_dir(current_app)}.')
+
+
+def init_app(app):
+    """Register the asset route, template helper and build command."""
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.register_blueprint(bp)
+    app.add_template_global(asset_url)
+    app.cli.add_command(build_assets_command, name='build-assets')
@@ -0,0 +1,129 @@
+"""In-memory filter of known badge idhashes.
+
+Misreads and visitor badges send a steady stream of idhashes that belong
+to no member. Each of them used to cost a database query in the quick
+check-in. Each worker instead keeps the idhashes of a team's active
+members as a sorted array of 64-bit integers (8 bytes per member) and
+answers "could this be a member?" with a binary search. Unknown badges
+are rejected in memory before any database access.
+
+The array is exact, so it never lets through an idhash that was unknown
+when it was built. It is dropped when a transaction that adds, removes,
+deactivates or re-badges a member commits. Other workers drop theirs at
+their next request (see :mod:`flaskr.coherence`). As a backstop, it is
+also reloaded once it is older than ``BADGE_FILTER_MAX_AGE`` seconds.
+
+Counters in ``/api/metrics``:
+
+* ``badge_filter.rejected``: scans answered from memory;
+* ``badge_filter.passed``: scans sent on to the database;
+* ``badge_filter.false_positives``: passed scans that matched no active
+  member, because the array was stale. The false-positive rate is
+  ``false_positives / passed``;
+* ``badge_filter.rebuilds``.
+"""
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from . import coherence
+from .db import TeamSession, get_engine
+from .metrics import incr
+from .teams import current_team
+
+
+class BadgeFilter:
+    """Sorted active idhashes, cached per team."""
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._teams = {}
+        self._lock = threading.Lock()
+
+    def _idhashes(self):
+        team = current_team()
+        entry = self._teams.get(team)
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            entry = (time.monotonic(), self._load())
+            with self._lock:
+                self._teams[team] = entry
+            incr('badge_filter.rebuilds')
+        return entry[1]
+
+    @staticmethod
+    def _load():
+        from .statements import ACTIVE_IDHASHES
+
+        with get_engine().connect() as conn:
+            return array('q', conn.execute(ACTIVE_IDHASHES).scalars())
+
+    def __contains__(self, idhash):
+        idhashes = self._idhashes()
+        index = bisect_left(idhashes, idhash)
+        return index < len(idhashes) and idhashes[index] == idhash
+
+    def admits(self, idhash):
+        """Return False if ``idhash`` is certainly not an active member's badge."""
+        if idhash in self:
+            incr('badge_filter.passed')
+            return True
+        incr('badge_filter.rejected')
+        return False
+
+    def invalidate(self, team=None):
+        """Forget the idhashes of one team."""
+        with self._lock:
+            self._teams.pop(team, None)
+
+    def clear(self):
+        """Forget the idhashes of every team."""
+        with self._lock:
+            self._teams.clear()
+
+
+def get_filter():
+    """Return the badge filter for the current app, or None if it is disabled."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('badge_filter')
+
+
+def _changes_badges(obj):
+    state = inspect(obj)
+    return (state.attrs.idhash.history.has_changes()
+            or state.attrs.active.history.has_changes())
+
+
+@event.listens_for(TeamSession, 'after_flush')
+def _stage_badge_changes(session, flush_context):
+    from .models import Member
+
+    added_or_deleted = list(session.new) + list(session.deleted)
+    if (any(isinstance(obj, Member) for obj in added_or_deleted)
+            or any(isinstance(obj, Member) and _changes_badges(obj)
+                   for obj in session.dirty)):
+        coherence.touch(session, 'members')
+
+
+@event.listens_for(TeamSession, 'after_bulk_update')
+@event.listens_for(TeamSession, 'after_bulk_delete')
+def _stage_bulk_badge_change(context):
+    from .models import Member
+
+    if context.mapper.class_ is Member:
+        coherence.touch(context.session, 'members')
+
+
+def init_app(app):
+    """Attach the badge filter to the app unless ``BADGE_FILTER_ENABLED`` is off."""
+    if not app.config['BADGE_FILTER_ENABLED']:
+        app.extensions['badge_filter'] = None
+        return
+    badges = BadgeFilter(app.config['BADGE_FILTER_MAX_AGE'])
+    app.extensions['badge_filter'] = badges
+    coherence.register(app, 'members', badges.invalidate)
@@ -0,0 +1,77 @@
+"""Small in-process caches shared by the request hot paths."""
+
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """A bounded mapping whose entries expire ``ttl`` seconds after being set.
+
+    Entries are kept in expiry order, so eviction only ever looks at the
+    oldest end. When the cache is full the oldest entry is dropped.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._data:
+            key, (expires, _) = next(iter(self._data.items()))
+            if expires > now:
+                break
+            del self._data[key]
+
+    def get(self, key, default=None):
+        """Return the value for ``key`` if it has not expired."""
+        with self._lock:
+            self._expire(self.timer())
+            entry = self._data.get(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``, restarting its time to live."""
+        with self._lock:
+            now = self.timer()
+            self._expire(now)
+            self._data.pop(key, None)
+            self._data[key] = (now + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def add(self, key, value):
+        """Store ``value`` only if ``key`` is absent. Returns True if stored."""
+        with self._lock:
+            now = self.timer()
+            self._expire(now)
+            if key in self._data:
+                return False
+            self._data[key] = (now + self.ttl, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return True
+
+    def pop(self, key, default=None):
+        """Remove ``key`` and return its value."""
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self.timer())
+            return len(self._data)
@@ -1,33 +1,93 @@
 """CLI commands for database management."""
 
 import click
+from flask import current_app
 from flask.cli import with_appcontext
+from . import jobs, presence
 from .db import db, init_db
 from .models import Member, Position
+from .positions import get_registry
+from .teams import get_teams, team_context, team_databases
+
+
+def team_options(f):
+    """Add ``--team`` / ``--all-teams`` options to a command."""
+    f = click.option('--all-teams', is_flag=True,
+                     help='Run the command against every configured team.')(f)
+    f = click.option('--team', default=None,
+                     help='Run the command against a single team database.')(f)
+    return f
+
+
+def select_teams(team=None, all_teams=False):
+    """Return the teams picked by ``--team`` / ``--all-teams``."""
+    if all_teams:
+        return team_databases()
+    if team is not None and team not in get_teams():
+        raise click.BadParameter(f'Unknown team: {team}', param_hint='--team')
+    return [team]
+
+
+def for_each_team(team=None, all_teams=False):
+    """Yield each selected team with its database active."""
+    for name in select_teams(team, all_teams):
+        with team_context(name):
+            yield name
+
+
+def team_echo(team, message):
+    """Echo a message, prefixed with the team name when one is selected."""
+    click.echo(f'[{team}] {message}' if team else message)
 
 
 @click.command()
+@team_options
 @with_appcontext
-def init_db_command():
+def init_db_command(team, all_teams):
     """Clear existing data and create new tables."""
-    init_db()
-    # Create default positions
-    Position.create_default_positions()
-    click.echo('Initialized the database with default positions.')
+    for name in for_each_team(team, all_teams):
+        init_db()
+        presence.rebuild()
+        # Create default positions
+        Position.create_default_positions()
+        team_echo(name, 'Initialized the database with default positions.')
 
 
 @click.command()
+@team_options
 @with_appcontext
-def seed_db_command():
+def seed_db_command(team, all_teams):
     """Seed the database with sample data."""
+    for name in for_each_team(team, all_teams):
+        count = seed_db()
+        team_echo(name, f'Added {count} sample members to the database.')
+
+
+@click.command()
+@click.option('--at', 'at_time', default=None,
+              help='Cut-off time (HH:MM); defaults to AUTO_CHECKOUT_TIME.')
+@with_appcontext
+def auto_checkout_command(at_time):
+    """Check out everyone still checked in after the end of the day."""
+    app = current_app._get_current_object()
+    cutoff, counts = jobs.auto_checkout(app, at_time)
+    local_cutoff = cutoff.astimezone()
+    for name, count in counts.items():
+        team_echo(name, f'Checked out {count} member(s) as of '
+                        f'{local_cutoff:%Y-%m-%d %H:%M}.')
+
+
+def seed_db():
+    """Add the sample members to the current database."""
     # Ensure positions exist
     Position.create_default_positions()
     
-    # Get position objects
-    lead_pos = Position.query.filter_by(name='lead').first()
-    member_pos = Position.query.filter_by(name='member').first()
-    mentor_pos = Position.query.filter_by(name='mentor').first()
-    coach_pos = Position.query.filter_by(name='coach').first()
+    # Get positions from the registry
+    registry = get_registry()
+    lead_pos = registry.by_name('lead')
+    member_pos = registry.by_name('member')
+    mentor_pos = registry.by_name('mentor')
+    coach_pos = registry.by_name('coach')
     
     # Create 10 sample members with diverse roles
     sample_members = [
@@ -54,10 +114,11 @@ def seed_db_command():
         db.session.add(member)
     
     db.session.commit()
-    click.echo(f'Added {len(sample_members)} sample members to the database.')
+    return len(sample_members)
 
 
 def init_app(app):
     """Register CLI commands with the Flask app."""
     app.cli.add_command(init_db_command, name='init-db')
-    app.cli.add_command(seed_db_command, name='seed-db')
\ No newline at end of file
+    app.cli.add_command(seed_db_command, name='seed-db')
+    app.cli.add_command(auto_checkout_command, name='auto-checkout')
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""Cross-worker invalidation of in-process caches.
+
+Workers keep some slowly changing data in memory: the position registry
+(``positions``) and the badge filter (``members``). Each worker used to
+drop its copy only when it committed a change itself, so under gunicorn
+the other workers kept serving stale data.
+
+Every cached data set now has a change counter in the ``cache_versions``
+table. :func:`touch` bumps a counter in the same transaction as the
+change. At the start of each request, a worker compares the counters with
+the values it saw last. It then invalidates only the caches whose data
+changed, through the callbacks registered with :func:`register`.
+
+On SQLite files the check is nearly free. The worker keeps one private
+read-only connection per database and asks it for ``PRAGMA data_version``,
+which only moves when another connection commits. The counters are read
+only when it has moved. Other databases read the counters directly, at
+most once per ``CACHE_CHECK_INTERVAL`` seconds.
+
+The presence snapshot and the status document built from it need none of
+this, because the snapshot is already shared between workers.
+"""
+
+import sqlite3
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from .db import TeamSession, get_engine
+from .dialects import upsert_increment
+from .metrics import incr
+from .teams import current_team
+
+
+class CacheRegistry:
+    """Invalidation callbacks for named caches, and the versions seen per team."""
+
+    def __init__(self):
+        self._callbacks = {}
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, invalidate):
+        """Call ``invalidate(team)`` whenever the data named ``name`` changes."""
+        self._callbacks.setdefault(name, []).append(invalidate)
+
+    def invalidate(self, name, team=None):
+        """Run the callbacks registered for ``name``."""
+        for invalidate in self._callbacks.get(name, ()):
+            invalidate(team)
+
+    def _watch(self, team):
+        watch = self._watches.get(team)
+        if watch is None:
+            with self._lock:
+                watch = self._watches.get(team)
+                if watch is None:
+                    watch = self._watches[team] = _Watch(get_engine())
+        return watch
+
+    def check(self, interval=0):
+        """Invalidate the current team's caches changed by other workers.
+
+        Returns the names of the invalidated caches.
+        """
+        team = current_team()
+        versions = self._watch(team).poll(interval)
+        if versions is None:
+            return []
+        changed = sorted(self._callbacks) if versions is _FIRST else versions
+        for name in changed:
+            self.invalidate(name, team)
+        if changed:
+            incr('caches.invalidations', len(changed))
+        return changed
+
+    def close(self):
+        """Close the private connections."""
+        with self._lock:
+            for watch in self._watches.values():
+                watch.close()
+            self._watches.clear()
+
+
+# Returned by the first poll: nothing is known about the caches yet
+_FIRST = object()
+
+
+class _Watch:
+    """Change counters of one database, as last seen by this worker."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.versions = None
+        self.checked_at = None
+        self._data_version = None
+        self._connection = None
+        self._lock = threading.Lock()
+        # An in-memory database cannot be shared, so there are no other workers to watch
+        self.shared = True
+        if engine.dialect.name == 'sqlite':
+            path = engine.url.database
+            self.shared = path not in (None, '', ':memory:')
+            if self.shared:
+                self._connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True,
+                                                   check_same_thread=False)
+
+    def _read(self):
+        from .models import CacheVersion
+
+        table = CacheVersion.__table__
+        if self._connection is None:
+            with self.engine.connect() as conn:
+                return dict(conn.execute(select(table.c.name, table.c.version)).all())
+        return dict(self._connection.execute(f'SELECT name, version FROM {table.name}'))
+
+    def poll(self, interval):
+        """Return the names whose counter moved since the last poll.
+
+        Returns None if the counters were not read this time.
+        """
+        if not self.shared:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            if self.checked_at is not None and now - self.checked_at < interval:
+                return None
+            self.checked_at = now
+
+            if self._connection is not None:
+                data_version = self._connection.execute(
+                    'PRAGMA data_version').fetchone()[0]
+                if data_version == self._data_version:
+                    return None
+                self._data_version = data_version
+
+            versions = self._read()
+            seen, self.versions = self.versions, versions
+            if seen is None:
+                return _FIRST
+            return [name for name, version in versions.items()
+                    if seen.get(name) != version]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def get_caches():
+    """Return the cache registry of the current app."""
+    return current_app.extensions['caches']
+
+
+def register(app, name, invalidate):
+    """Register a cache of ``app`` to invalidate when the data ``name`` changes."""
+    app.extensions.setdefault('caches', CacheRegistry()).register(name, invalidate)
+
+
+def touch(session, *names):
+    """Bump the change counters of ``names`` in the session's current transaction."""
+    from .models import CacheVersion
+
+    touched = session.info.setdefault('touched_caches', set())
+    for name in names:
+        if name not in touched:
+            touched.add(name)
+            upsert_increment(session, CacheVersion.__table__, {'name': name},
+                             {'version': 1})
+
+
+@event.listens_for(TeamSession, 'after_commit')
+def _invalidate_touched(session):
+    touched = session.info.pop('touched_caches', None)
+    if touched and has_app_context() and 'caches' in current_app.extensions:
+        for name in touched:
+            get_caches().invalidate(name, current_team())
+
+
+@event.listens_for(TeamSession, 'after_rollback')
+def _discard_touched(session):
+    session.info.pop('touched_caches', None)
+
+
+def check_caches():
+    """Request hook: drop caches that other workers made stale."""
+    get_caches().check(current_app.config['CACHE_CHECK_INTERVAL'])
+
+
+def init_app(app):
+    """Check the cache versions at the start of every request.
+
+    The hook runs after the team is selected.
+    """
+    app.extensions.setdefault('caches', CacheRegistry())
+    app.before_request(check_caches)
@@ -0,0 +1,136 @@
+"""Negotiated gzip/brotli compression for dynamic responses.
+
+Responses larger than ``COMPRESS_MIN_SIZE`` with a compressible mimetype
+are encoded with the best encoding the client accepts (brotli when the
+``brotli`` package is installed, otherwise gzip). Streamed responses are
+compressed chunk by chunk as they are produced. The bytes saved and time
+spent compressing are added to the app metrics.
+"""
+
+import time
+import zlib
+
+from flask import current_app, request
+
+from .metrics import get_metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'application/x-ndjson',
+}
+
+
+def _gzip_compressor(level):
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def _brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+    return _BrotliAdapter(compressor)
+
+
+class _BrotliAdapter:
+    """Give a brotli compressor the ``compress``/``flush`` interface of zlib."""
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self, mode=None):
+        if mode == zlib.Z_SYNC_FLUSH:
+            return self._compressor.flush()
+        return self._compressor.finish()
+
+
+def choose_encoding(app):
+    """Return ``(token, compressor_factory, level)`` for the current request."""
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br', _brotli_compressor, app.config['COMPRESS_BR_LEVEL']
+    if request.accept_encodings['gzip']:
+        return 'gzip', _gzip_compressor, app.config['COMPRESS_GZIP_LEVEL']
+    return None
+
+
+def _compress_stream(chunks, compressor, metrics):
+    """Compress an iterable of chunks, flushing after each one."""
+    raw = sent = 0
+    elapsed = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            start = time.perf_counter()
+            out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            elapsed += time.perf_counter() - start
+            raw += len(chunk)
+            sent += len(out)
+            if out:
+                yield out
+        start = time.perf_counter()
+        out = compressor.flush()
+        elapsed += time.perf_counter() - start
+        sent += len(out)
+        if out:
+            yield out
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        metrics.incr('compression.bytes_saved', raw - sent)
+        metrics.incr('compression.time_ms', elapsed * 1000)
+
+
+def compress_response(response):
+    """``after_request`` hook that compresses eligible responses."""
+    app = current_app
+    if (
+        not app.config['COMPRESS_ENABLED']
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or 'Content-Encoding' in response.headers
+        or request.method == 'HEAD'
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    negotiated = choose_encoding(app)
+    if negotiated is None:
+        return response
+    token, factory, level = negotiated
+    metrics = get_metrics()
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, factory(level), metrics)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        start = time.perf_counter()
+        compressor = factory(level)
+        body = compressor.compress(data) + compressor.flush()
+        metrics.incr('compression.time_ms', (time.perf_counter() - start) * 1000)
+        metrics.incr('compression.bytes_saved', len(data) - len(body))
+        response.set_data(body)
+
+    response.content_encoding = token
+    response.headers.pop('Accept-Ranges', None)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    metrics.incr(f'compression.responses.{token}')
+    return response
+
+
+def init_app(app):
+    """Register the compression hook with the Flask app."""
+    app.after_request(compress_response)
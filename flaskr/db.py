@@ -1,26 +1,124 @@
 """Database configuration and utilities for Spartan Teamlog."""
 
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+# Prefix for the SQLALCHEMY_BINDS keys that hold per-team databases
+TEAM_BIND_PREFIX = 'team:'
+
+
+def team_bind_key(team):
+    """Return the bind key used for a team's database."""
+    return f'{TEAM_BIND_PREFIX}{team}'
+
+
+class TeamSession(Session):
+    """Session that routes queries to the database of the selected team.
+
+    When a team has been selected for the current app context (``g.team``),
+    every statement is sent to that team's engine. Otherwise the normal
+    Flask-SQLAlchemy bind resolution is used.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            team = g.get('team')
+            if team is not None:
+                return self._db.engines[team_bind_key(team)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
 
 # Initialize SQLAlchemy instance
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': TeamSession})
+
+
+# URL schemes without a driver; hosting providers often hand out postgres://
+POSTGRES_SCHEMES = ('postgres://', 'postgresql://')
+
+
+def normalize_url(uri):
+    """Point PostgreSQL URLs without a driver at psycopg (the ``postgres`` extra)."""
+    if isinstance(uri, str):
+        for scheme in POSTGRES_SCHEMES:
+            if uri.startswith(scheme):
+                return 'postgresql+psycopg://' + uri[len(scheme):]
+    return uri
+
+
+def is_sqlite(uri):
+    """Return True if a database URI points at SQLite."""
+    return make_url(uri).get_backend_name() == 'sqlite'
+
+
+def pool_options(config):
+    """Return the connection pool settings for server databases."""
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def configure_engines(app):
+    """Apply the ``DB_POOL_*`` settings to every server (non-SQLite) database.
+
+    SQLite engines keep SQLAlchemy's defaults, which suit a local file.
+    Options already present in the config take precedence.
+    """
+    config = app.config
+    config['SQLALCHEMY_DATABASE_URI'] = normalize_url(config['SQLALCHEMY_DATABASE_URI'])
+    if not is_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            **pool_options(config), **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        }
+
+    binds = {}
+    for key, value in (config.get('SQLALCHEMY_BINDS') or {}).items():
+        if not isinstance(value, dict):
+            value = {'url': value}
+        value = {**value, 'url': normalize_url(value['url'])}
+        if not is_sqlite(value['url']):
+            value = {**pool_options(config), **value}
+        binds[key] = value
+    config['SQLALCHEMY_BINDS'] = binds
 
 
 def init_app(app):
     """Initialize the database with the Flask app."""
+    configure_engines(app)
     db.init_app(app)
-    
-    # Create tables if they don't exist
+
+    # Create tables if they don't exist (unless the schema is managed with
+    # migrations). Team binds share the default metadata, so only the
+    # default bind key is passed to create_all().
+    if not app.config['DB_AUTO_CREATE']:
+        return
     with app.app_context():
-        db.create_all()
+        db.create_all(bind_key=None)
+        for team in app.config.get('TEAMS', {}):
+            db.metadata.create_all(bind=db.engines[team_bind_key(team)])
+
+
+def get_engine():
+    """Get the engine for the currently selected team (or the default one)."""
+    return db.session.get_bind()
 
 
 def init_db():
     """Clear existing data and create new tables."""
-    db.drop_all()
-    db.create_all()
+    if g.get('team') is None:
+        db.drop_all(bind_key=None)
+        db.create_all(bind_key=None)
+    else:
+        engine = get_engine()
+        db.session.remove()
+        db.metadata.drop_all(bind=engine)
+        db.metadata.create_all(bind=engine)
 
 
 def get_db():
     """Get the database instance (for compatibility with existing patterns)."""
-    return db
\ No newline at end of file
+    return db
@@ -0,0 +1,68 @@
+"""Dialect-aware fast paths for statements the app runs in bulk.
+
+SQLite and PostgreSQL both support ``INSERT ... ON CONFLICT DO UPDATE``,
+so counters are bumped with a single upsert there. PostgreSQL can also
+apply many per-row updates in one ``UPDATE ... FROM (VALUES ...)``
+statement instead of an executemany round trip per row. Other backends
+get portable equivalents. (``UPDATE ... RETURNING`` support is read from
+``dialect.update_returning`` where it is used.)
+"""
+
+from sqlalchemy import column, insert, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def dialect_name(session):
+    """Return the name of the dialect the session is bound to."""
+    return session.get_bind().dialect.name
+
+
+def upsert_increment(session, table, keys, increments):
+    """Add ``increments`` (``{column: amount}``) to the row with ``keys``.
+
+    The row is created if it does not exist yet.
+    """
+    insert_ = UPSERT_INSERTS.get(dialect_name(session))
+    if insert_ is not None:
+        stmt = insert_(table).values(**keys, **increments)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        ))
+        return
+
+    criteria = [table.c[name] == value for name, value in keys.items()]
+    result = session.execute(update(table).where(*criteria).values(
+        {name: table.c[name] + amount for name, amount in increments.items()}
+    ))
+    if result.rowcount == 0:
+        session.execute(insert(table).values(**keys, **increments))
+
+
+def values_update(table, names, rows):
+    """Build ``UPDATE table ... FROM (VALUES ...)`` for rows with the same ``names``."""
+    source = values(*(column(name, table.c[name].type) for name in names),
+                    name='changes')
+    source = source.data([tuple(row[name] for name in names) for row in rows])
+    return update(table).where(table.c.id == source.c.id).values(
+        {name: source.c[name] for name in names if name != 'id'}
+    )
+
+
+def bulk_update_by_id(session, model, rows):
+    """Apply ``rows`` (dicts of ``id`` and new column values) to ``model``'s table."""
+    if dialect_name(session) != 'postgresql':
+        # ORM bulk UPDATE by primary key: one executemany per set of columns
+        session.execute(update(model), rows)
+        return
+
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for names, group in groups.items():
+        session.execute(values_update(model.__table__, names, group))
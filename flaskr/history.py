@@ -0,0 +1,138 @@
+"""Season-wide attendance analytics over the per-member bitmaps.
+
+Each member's season is a single integer bitset (see ``AttendanceBitmap``),
+so the roster-wide questions are answered with whole-integer operations:
+a meeting day is any day someone attended (the OR of every bitmap),
+attendance is a popcount, and co-attendance is a popcount of an AND.
+
+Streaks are found for the whole roster at once. The stored bitmaps are
+laid end to end in one integer, one lane per member, and the classic
+``x & (x >> 1)`` loop is run on it, with the shift made to skip the days
+between meetings (see :func:`longest_streaks`).
+"""
+
+from datetime import timedelta
+
+from .db import db
+from .models import AttendanceBitmap
+
+
+def popcount(bits):
+    """Return the number of set bits in an integer bitset."""
+    return bin(bits).count('1')
+
+
+# Bytes and bits per member lane: a stored bitmap plus a spare byte. The
+# bits above SEASON_DAYS are never set, which keeps carries in their lane
+LANE_BYTES = (AttendanceBitmap.SEASON_DAYS + 7) // 8 + 1
+LANE_BITS = 8 * LANE_BYTES
+SEASON_MASK = (1 << AttendanceBitmap.SEASON_DAYS) - 1
+
+
+def _season_rows(season):
+    return db.session.query(AttendanceBitmap.member_id, AttendanceBitmap.days).filter(
+        AttendanceBitmap.season == season
+    ).all()
+
+
+def load_season(season):
+    """Return ``{member_id: bits}`` for every member with attendance in a season."""
+    return {member_id: int.from_bytes(days, 'little')
+            for member_id, days in _season_rows(season)}
+
+
+def meeting_days(bitmaps):
+    """Return the bitset of days on which anyone attended."""
+    meetings = 0
+    for bits in bitmaps.values():
+        meetings |= bits
+    return meetings
+
+
+def longest_streaks(packed, lanes, meetings):
+    """Return the longest run of consecutive meetings attended in each lane.
+
+    ``packed`` holds ``lanes`` bitmaps of ``LANE_BITS`` bits each, lowest
+    lane first; ``meetings`` is the bitset of meeting days. After ``n``
+    rounds, a bit is left set on each meeting that ends a streak of ``n``
+    meetings; a lane's streak is the round in which its last bit clears.
+    """
+    repeat = int.from_bytes((b'\x01' + bytes(LANE_BYTES - 1)) * lanes, 'little')
+    attended = packed & meetings * repeat
+    # Days between meetings, which a streak steps over
+    gaps = (SEASON_MASK & ~meetings) * repeat
+    # Adding ``ones`` carries into a lane's top bit exactly when the lane is non-zero
+    ones = ((1 << (LANE_BITS - 1)) - 1) * repeat
+    top = 1 << (LANE_BITS - 1)
+
+    streaks = [0] * lanes
+    ends = attended
+    alive = (ends + ones) & top * repeat
+    rounds = 0
+    while alive:
+        rounds += 1
+        # Move each bit to the next meeting: one step left, then carried
+        # through the run of gap days above it
+        ends = attended & (((ends << 1) + gaps) & ~gaps)
+        still = (ends + ones) & top * repeat
+        for bit in bit_indexes(alive & ~still):
+            streaks[bit // LANE_BITS] = rounds
+        alive = still
+    return streaks
+
+
+def longest_streak(bits, meetings):
+    """Return the longest run of consecutive ``meetings`` (a bitset) attended."""
+    return longest_streaks(bits, 1, meetings)[0]
+
+
+def bit_indexes(bits):
+    """Return the positions of the set bits, lowest first."""
+    indexes = []
+    while bits:
+        low = bits & -bits
+        indexes.append(low.bit_length() - 1)
+        bits ^= low
+    return indexes
+
+
+def season_stats(season):
+    """Return per-member attendance counts, rates and streaks for a season."""
+    rows = _season_rows(season)
+    bitmaps = {member_id: int.from_bytes(days, 'little') for member_id, days in rows}
+    meetings = meeting_days(bitmaps)
+    total_meetings = popcount(meetings)
+    lanes = b''.join(days.ljust(LANE_BYTES, b'\0')[:LANE_BYTES] for _, days in rows)
+    packed = int.from_bytes(lanes, 'little')
+    streaks = longest_streaks(packed, len(rows), meetings)
+
+    stats = []
+    for (member_id, _), streak in zip(rows, streaks):
+        attended = popcount(bitmaps[member_id])
+        stats.append({
+            'member_id': member_id,
+            'meetings_attended': attended,
+            'attendance_rate': attended / total_meetings if total_meetings else 0.0,
+            'longest_streak': streak
+        })
+    return {
+        'season': season,
+        'meetings': total_meetings,
+        'members': sorted(stats, key=lambda s: s['member_id'])
+    }
+
+
+def co_attendance(member_id, season):
+    """Return ``{other_member_id: shared_meetings}`` for one member in a season."""
+    bitmaps = load_season(season)
+    bits = bitmaps.pop(member_id, 0)
+    return {other: popcount(bits & other_bits) for other, other_bits in bitmaps.items()
+            if bits & other_bits}
+
+
+def meeting_dates(season):
+    """Return the dates of every meeting held in a season."""
+    start = AttendanceBitmap.season_start(season)
+    days = bit_indexes(meeting_days(load_season(season)))
+    return [start + timedelta(days=day) for day in days]
+
@@ -0,0 +1,211 @@
+"""Idempotency keys for check-in requests.
+
+Kiosks on flaky networks retry requests whose response they never saw. A
+client that sends an ``Idempotency-Key`` header (any unique string, e.g. a
+UUID per scan) with a request to a view wrapped in :func:`idempotent` gets
+the original response back on every retry, and the write runs only once:
+
+* the first request claims the key in the ``idempotency_keys`` table, runs
+  the view and stores its status, headers and body;
+* a retry with the same key replays the stored response;
+* a retry that arrives while the first request is still running gets
+  ``409 Conflict``, and one that reuses a key for a different endpoint or
+  a different body gets ``422``.
+
+The table is shared by all workers. Keys expire after ``IDEMPOTENCY_TTL``
+seconds and at most ``IDEMPOTENCY_MAX_KEYS`` are kept (oldest dropped
+first). Expired and excess keys are pruned by every worker once per
+``IDEMPOTENCY_PRUNE_EVERY`` claims, after the response is stored, so a
+keyed check-in costs only the claim and the completion writes. Errors
+raised by the view (including ``abort()``) and 5xx responses are not
+stored, so those requests can simply be retried.
+"""
+
+import functools
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, jsonify, make_response, request
+from sqlalchemy import and_, delete, select
+from sqlalchemy.exc import IntegrityError
+
+from .db import db
+from .metrics import incr
+from .models import IdempotencyKey
+from .writes import run_write
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Response headers worth replaying
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+FORM_MIMETYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+_claims = itertools.count(1)
+_claims_lock = threading.Lock()
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _expired_before():
+    return _now() - timedelta(seconds=current_app.config['IDEMPOTENCY_TTL'])
+
+
+def lookup(key):
+    """Return the live stored entry for a key, or None."""
+    return db.session.execute(
+        select(IdempotencyKey).where(IdempotencyKey.key == key,
+                                     IdempotencyKey.created_at >= _expired_before())
+    ).scalar_one_or_none()
+
+
+def request_fingerprint():
+    """Return the method, path and a hash of the query and body of the request."""
+    if request.mimetype in FORM_MIMETYPES:
+        # The raw body is gone once the form is parsed (e.g. by CSRF checks)
+        body = repr(sorted(request.form.items(multi=True))).encode()
+    else:
+        body = request.get_data()
+    digest = hashlib.sha256(request.query_string + b'?' + body).hexdigest()
+    return f'{digest} {request.method} {request.path}'[:255]
+
+
+def claim(key, fingerprint):
+    """Reserve a key for a request about to run. Returns False if already taken."""
+    table = IdempotencyKey.__table__
+
+    def insert():
+        db.session.add(IdempotencyKey(key=key, fingerprint=fingerprint,
+                                      created_at=_now()))
+        db.session.commit()
+
+    def drop_expired():
+        result = db.session.execute(delete(table).where(
+            and_(table.c.key == key, table.c.created_at < _expired_before())))
+        db.session.commit()
+        return result.rowcount
+
+    try:
+        run_write(insert)
+    except IntegrityError:
+        db.session.rollback()
+        # An expired key may be claimed again
+        if not run_write(drop_expired):
+            return False
+        try:
+            run_write(insert)
+        except IntegrityError:
+            db.session.rollback()
+            return False
+    return True
+
+
+def prune():
+    """Drop expired keys and the oldest keys beyond ``IDEMPOTENCY_MAX_KEYS``."""
+    table = IdempotencyKey.__table__
+
+    def remove():
+        db.session.execute(delete(table).where(table.c.created_at < _expired_before()))
+        limit = current_app.config['IDEMPOTENCY_MAX_KEYS']
+        oldest = (select(table.c.key)
+                  .order_by(table.c.created_at.desc()).offset(limit).scalar_subquery())
+        db.session.execute(delete(table).where(table.c.key.in_(oldest)))
+        db.session.commit()
+
+    run_write(remove)
+
+
+def _prune_due():
+    every = current_app.config['IDEMPOTENCY_PRUNE_EVERY']
+    if not every:
+        return False
+    with _claims_lock:
+        return next(_claims) % every == 0
+
+
+def complete(key, response):
+    """Store the response for a claimed key (or release it after a server error)."""
+    def save():
+        entry = db.session.get(IdempotencyKey, key)
+        if entry is None:
+            return
+        if response.status_code >= 500:
+            db.session.delete(entry)
+        else:
+            entry.status = response.status_code
+            entry.headers = {name: response.headers[name]
+                             for name in REPLAYED_HEADERS if name in response.headers}
+            entry.body = response.get_data()
+        db.session.commit()
+
+    run_write(save)
+
+
+def release(key):
+    """Forget a claimed key whose request failed."""
+    def remove():
+        db.session.execute(delete(IdempotencyKey.__table__).where(
+            IdempotencyKey.__table__.c.key == key))
+        db.session.commit()
+
+    run_write(remove)
+
+
+def replay(entry):
+    """Rebuild the stored response."""
+    response = current_app.response_class(entry.body, status=entry.status)
+    for name, value in (entry.headers or {}).items():
+        response.headers[name] = value
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _run_claimed(key, view, args, kwargs):
+    try:
+        response = make_response(view(*args, **kwargs))
+    except Exception:
+        db.session.rollback()
+        release(key)
+        raise
+    complete(key, response)
+    return response
+
+
+def idempotent(view):
+    """Decorator honouring the ``Idempotency-Key`` header on a view."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            message = f'{HEADER} is longer than {MAX_KEY_LENGTH} characters'
+            return jsonify({'error': message}), 400
+
+        fingerprint = request_fingerprint()
+        entry = lookup(key)
+        if entry is None:
+            if claim(key, fingerprint):
+                response = _run_claimed(key, view, args, kwargs)
+                if _prune_due():
+                    prune()
+                return response
+            # Another worker claimed the key since the lookup
+            entry = lookup(key)
+
+        if entry is not None and entry.fingerprint != fingerprint:
+            message = f'{HEADER} was already used for another request'
+            return jsonify({'error': message}), 422
+        if entry is None or entry.status is None:
+            incr('idempotency.conflicts')
+            message = 'A request with this key is still in progress'
+            return jsonify({'error': message}), 409
+        incr('idempotency.replays')
+        return replay(entry)
+
+    return wrapper
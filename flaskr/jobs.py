@@ -0,0 +1,70 @@
+"""Scheduled batch jobs and the optional in-process scheduler.
+
+Jobs can be run from cron through their CLI commands, or by the daemon
+thread started here when the matching ``*_SCHEDULER`` option is set. Every
+job is safe to run on several workers at once, so each gunicorn worker may
+run its own scheduler.
+"""
+
+import threading
+import time as _time
+from datetime import datetime, timedelta, timezone
+
+from .models import Member
+from .teams import team_context, team_databases
+
+
+def parse_time_of_day(value):
+    """Parse an ``HH:MM`` string into a :class:`datetime.time`."""
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def last_occurrence(time_of_day, now=None):
+    """Return the most recent local ``time_of_day`` at or before ``now``, in UTC."""
+    now = (now or datetime.now(timezone.utc)).astimezone()
+    candidate = now.replace(hour=time_of_day.hour, minute=time_of_day.minute,
+                            second=0, microsecond=0)
+    if candidate > now:
+        candidate -= timedelta(days=1)
+    return candidate.astimezone(timezone.utc)
+
+
+def auto_checkout(app, time_of_day=None, now=None):
+    """Check out the stragglers from the last meeting in every team.
+
+    The synthetic check-out time is the most recent ``AUTO_CHECKOUT_TIME``.
+    Returns ``(cutoff, {team: count})``.
+    """
+    time_of_day = parse_time_of_day(time_of_day or app.config['AUTO_CHECKOUT_TIME'])
+    cutoff = last_occurrence(time_of_day, now)
+    counts = {}
+    with app.app_context():
+        for team in team_databases(app):
+            with team_context(team):
+                counts[team] = Member.check_out_all(at=cutoff, auto=True)
+    return cutoff, counts
+
+
+def run_daily(app, time_of_day, job, name):
+    """Run ``job(app)`` every day at a local ``HH:MM`` time in a daemon thread."""
+    at = parse_time_of_day(time_of_day)
+
+    def loop():
+        while True:
+            now = datetime.now(timezone.utc)
+            next_run = last_occurrence(at, now) + timedelta(days=1)
+            _time.sleep(max((next_run - now).total_seconds(), 0))
+            try:
+                job(app)
+            except Exception:
+                app.logger.exception('Scheduled job %s failed', name)
+
+    thread = threading.Thread(target=loop, name=f'teamlog-{name}', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app):
+    """Start the in-process scheduler for the enabled jobs."""
+    if app.config.get('AUTO_CHECKOUT_SCHEDULER') and not app.testing:
+        run_daily(app, app.config['AUTO_CHECKOUT_TIME'], auto_checkout, 'auto-checkout')
@@ -0,0 +1,377 @@
+"""Headless kiosk client for badge readers.
+
+Runs on the small boxes next to the doors, in place of a browser driving
+the quick check-in form. Scans are read one per line from stdin or a
+device that delivers lines, such as a serial-mode scanner or the tty a
+keyboard-wedge scanner types into. Each scan is saved to a local SQLite
+buffer before anything else happens. A background thread sends buffered
+scans to the server's ``POST /api/scans`` in batches (see
+:mod:`flaskr.scans`). A burst of students at the door therefore costs a
+few requests rather than one round trip each.
+
+When the server is unreachable, scans keep accumulating in the buffer and
+are sent with backoff once it is back, including after a restart of the
+kiosk. Every batch carries an ``Idempotency-Key`` that is stored with it
+in the buffer, so a batch whose response was lost is not applied twice
+when it is retried.
+
+A batch the server refuses as a whole is never dropped. A wrong
+``--server`` or ``--team`` (404) or a proxy asking for credentials (401,
+403) is treated like an outage: the scans stay buffered and are retried
+with backoff until the configuration is fixed. If the server takes fewer
+scans per batch than ``--batch-size``, the kiosk sends smaller batches.
+Only scans the server flags one by one as invalid leave the queue. They
+move to a ``rejected`` table in the buffer file, for someone to inspect.
+
+Run it as ``spartan-kiosk --server https://teamlog.example.org`` (or
+``flask kiosk``, ``python -m flaskr.kiosk``). On a multi-team server, point
+``--server`` at the team's host name; ``--team`` sends the ``X-Team``
+header, which the server only honours with ``TEAM_HEADER_ENABLED``.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+import click
+
+from .idempotency import HEADER as IDEMPOTENCY_HEADER
+from .teams import TEAM_HEADER
+from .writes import backoff_delays
+
+DEFAULT_BUFFER = 'kiosk-scans.sqlite'
+
+# The server's default SCAN_BATCH_MAX; larger batches would be refused
+MAX_BATCH = 500
+
+# Responses that mean "not now"; other 4xx mean the server refuses the batch as sent
+RETRY_STATUSES = (408, 409, 425, 429)
+
+MESSAGES = {
+    'checked_in': 'Checked in {name}',
+    'already_checked_in': 'Already checked in: {name}',
+    'unknown': 'Unknown badge {idhash}',
+    'expired': 'Scan of {idhash} is too old and was not recorded',
+}
+
+
+class RetryLater(Exception):
+    """The server could not take a batch now; it stays buffered."""
+
+
+class Rejected(RetryLater):
+    """The server refused a batch; ``errors`` holds its explanation, if any."""
+
+    def __init__(self, status, errors=()):
+        super().__init__(f'server refused the batch with {status}')
+        self.status = status
+        self.errors = list(errors)
+
+
+class ScanBuffer:
+    """Scans waiting to be sent, kept in a local SQLite file.
+
+    Scans are taken into a batch by stamping them with a batch key. Until
+    the server acknowledges the batch, :meth:`next_batch` returns the same
+    scans under the same key.
+    """
+
+    def __init__(self, path=DEFAULT_BUFFER):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Scans must survive the kiosk being unplugged
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS scans ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' idhash INTEGER NOT NULL,'
+            ' scanned_at TEXT NOT NULL,'
+            ' batch TEXT)'
+        )
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS rejected ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' idhash INTEGER NOT NULL,'
+            ' scanned_at TEXT NOT NULL,'
+            ' error TEXT NOT NULL,'
+            ' rejected_at TEXT NOT NULL)'
+        )
+
+    def add(self, idhash, scanned_at):
+        """Save a scan."""
+        with self._lock:
+            self._conn.execute('INSERT INTO scans (idhash, scanned_at) VALUES (?, ?)',
+                               (idhash, scanned_at.isoformat()))
+
+    def next_batch(self, size):
+        """Return ``(key, scans)`` for the next batch to send, or None if none wait."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT batch FROM scans WHERE batch IS NOT NULL ORDER BY id LIMIT 1'
+            ).fetchone()
+            if row is not None:
+                key = row[0]
+            else:
+                key = uuid.uuid4().hex
+                self._conn.execute(
+                    'UPDATE scans SET batch = ? WHERE id IN'
+                    ' (SELECT id FROM scans ORDER BY id LIMIT ?)', (key, size))
+            rows = self._conn.execute(
+                'SELECT idhash, scanned_at FROM scans WHERE batch = ? ORDER BY id',
+                (key,))
+            scans = [{'idhash': idhash, 'scanned_at': scanned_at}
+                     for idhash, scanned_at in rows]
+        return (key, scans) if scans else None
+
+    def acknowledge(self, key):
+        """Drop a batch the server has answered."""
+        with self._lock:
+            self._conn.execute('DELETE FROM scans WHERE batch = ?', (key,))
+
+    def release(self, key):
+        """Put the scans of a batch the server did not apply back in the queue."""
+        with self._lock:
+            self._conn.execute('UPDATE scans SET batch = NULL WHERE batch = ?', (key,))
+
+    def reject(self, key, errors):
+        """Move scans of a batch to the ``rejected`` table and release the rest.
+
+        ``errors`` maps a scan's position in the batch to the server's reason.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(
+                'SELECT id FROM scans WHERE batch = ? ORDER BY id', (key,))]
+            bad = [(ids[index], error) for index, error in errors.items()
+                   if index < len(ids)]
+            self._conn.execute('BEGIN')
+            for scan_id, error in bad:
+                self._conn.execute(
+                    'INSERT INTO rejected (idhash, scanned_at, error, rejected_at)'
+                    ' SELECT idhash, scanned_at, ?, ? FROM scans WHERE id = ?',
+                    (error, now, scan_id))
+                self._conn.execute('DELETE FROM scans WHERE id = ?', (scan_id,))
+            self._conn.execute('UPDATE scans SET batch = NULL WHERE batch = ?', (key,))
+            self._conn.execute('COMMIT')
+        return len(bad)
+
+    def pending(self):
+        """Return the number of buffered scans."""
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM scans').fetchone()[0]
+
+    def rejected(self):
+        """Return the number of scans the server refused as invalid."""
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM rejected').fetchone()[0]
+
+    def close(self):
+        """Close the buffer file."""
+        with self._lock:
+            self._conn.close()
+
+
+def send_batch(server, key, scans, team=None, timeout=10):
+    """POST a batch to ``server``. Returns the per-scan results.
+
+    Raises :class:`RetryLater` if the server is unreachable or asks for a
+    retry, and :class:`Rejected` if it refuses the batch.
+    """
+    headers = {'Content-Type': 'application/json', IDEMPOTENCY_HEADER: key}
+    if team:
+        headers[TEAM_HEADER] = team
+    request = urllib.request.Request(f'{server.rstrip("/")}/api/scans', method='POST',
+                                     data=json.dumps({'scans': scans}).encode(),
+                                     headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)['results']
+    except urllib.error.HTTPError as exc:
+        if exc.code >= 500 or exc.code in RETRY_STATUSES:
+            raise RetryLater(f'server answered {exc.code}') from exc
+        try:
+            body = json.load(exc)
+        except (OSError, ValueError):
+            body = None
+        errors = body.get('errors', ()) if isinstance(body, dict) else ()
+        raise Rejected(exc.code, errors) from exc
+    except (OSError, ValueError) as exc:
+        # URLError, timeouts and refused connections are OSErrors
+        raise RetryLater(str(exc)) from exc
+
+
+class Kiosk:
+    """Reads scans into a :class:`ScanBuffer` and sends them in the background."""
+
+    def __init__(self, buffer, server, team=None, batch_size=50, linger=0.5, timeout=10,
+                 debounce=2.0, retry_base=0.5, retry_max=30.0, echo=click.echo):
+        self.buffer = buffer
+        self.server = server
+        self.team = team
+        self.batch_size = max(1, min(batch_size, MAX_BATCH))
+        self.linger = linger
+        self.timeout = timeout
+        self.debounce = debounce
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.echo = echo
+        self._last_seen = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def scan(self, line):
+        """Buffer one line of scanner input. Returns True if it was a new scan."""
+        text = line.strip()
+        if not text:
+            return False
+        if not text.isdigit():
+            self.echo(f'Ignoring unreadable scan {text!r}')
+            return False
+        idhash = int(text)
+
+        # Scanners often repeat a read; the server would ignore the repeat anyway
+        now = time.monotonic()
+        if now - self._last_seen.get(idhash, -self.debounce) < self.debounce:
+            return False
+        self._last_seen[idhash] = now
+
+        self.buffer.add(idhash, datetime.now(timezone.utc))
+        self._wake.set()
+        return True
+
+    def send_pending(self):
+        """Send batches until the buffer is empty. Returns the number of scans sent."""
+        sent = 0
+        while True:
+            batch = self.buffer.next_batch(self.batch_size)
+            if batch is None:
+                return sent
+            key, scans = batch
+            try:
+                results = send_batch(self.server, key, scans, self.team, self.timeout)
+            except Rejected as exc:
+                if not self._handle_rejection(key, exc):
+                    raise
+                continue
+            self.buffer.acknowledge(key)
+            sent += len(scans)
+            for result in results:
+                message = MESSAGES.get(result['status'], '{status}: {idhash}')
+                self.echo(message.format_map({'name': None, **result}))
+
+    def _handle_rejection(self, key, exc):
+        """Deal with a refused batch if the server said why. Returns True if handled."""
+        limits = [error['limit'] for error in exc.errors if error.get('limit')]
+        if limits and limits[0] < self.batch_size:
+            self.batch_size = limits[0]
+            self.buffer.release(key)
+            self.echo(f'Server takes at most {self.batch_size} scans per batch')
+            return True
+
+        invalid = {error['index']: error.get('error', 'invalid')
+                   for error in exc.errors if isinstance(error.get('index'), int)}
+        if invalid:
+            count = self.buffer.reject(key, invalid)
+            self.echo(f'Server refused {count} invalid scan(s); '
+                      'moved them to the rejected table')
+            return True
+        return False
+
+    def _push_loop(self):
+        delays = None
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            # Let a burst of scans gather into one batch
+            self._stop.wait(self.linger)
+            try:
+                self.send_pending()
+                delays = None
+            except Exception as exc:
+                # Keep the scans and the thread alive, whatever went wrong
+                if delays is None:
+                    delays = backoff_delays(32, self.retry_base, self.retry_max)
+                if isinstance(exc, Rejected):
+                    reason = 'Server refused scans, check --server and --team'
+                elif isinstance(exc, RetryLater):
+                    reason = 'Server unavailable'
+                else:
+                    reason = 'Sending failed'
+                self.echo(f'{reason} ({exc}); {self.buffer.pending()} scan(s) buffered')
+                self._stop.wait(next(delays, self.retry_max))
+                self._wake.set()
+
+    def run(self, lines):
+        """Read scans from ``lines`` until it ends, sending them in the background."""
+        # Send whatever an earlier run left behind
+        self._wake.set()
+        pusher = threading.Thread(target=self._push_loop, name='kiosk-push',
+                                  daemon=True)
+        pusher.start()
+        try:
+            for line in lines:
+                self.scan(line)
+        finally:
+            self._stop.set()
+            self._wake.set()
+            pusher.join()
+        # One last attempt; anything unsent stays buffered for the next run
+        try:
+            self.send_pending()
+        except RetryLater:
+            pass
+        return self.buffer.pending()
+
+
+@click.command('kiosk')
+@click.option('--server', envvar='KIOSK_SERVER', required=True,
+              help='Base URL of the Teamlog server.')
+@click.option('--team', envvar='KIOSK_TEAM',
+              help='Team to check members in to (needs TEAM_HEADER_ENABLED).')
+@click.option('--input', 'source', type=click.File('r'), default='-',
+              help='Device or file to read scans from (default: stdin).')
+@click.option('--buffer', 'buffer_path', envvar='KIOSK_BUFFER', default=DEFAULT_BUFFER,
+              show_default=True, help='Local SQLite file holding unsent scans.')
+@click.option('--batch-size', default=50, show_default=True,
+              help=f'Most scans per request (at most {MAX_BATCH}).')
+@click.option('--linger', default=0.5, show_default=True,
+              help='Seconds to wait for more scans before sending.')
+@click.option('--timeout', default=10.0, show_default=True,
+              help='HTTP timeout in seconds.')
+@click.option('--debounce', default=2.0, show_default=True,
+              help='Ignore repeat scans of a badge within this many seconds.')
+def kiosk_command(server, team, source, buffer_path, batch_size, linger, timeout,
+                  debounce):
+    """Read badge scans and send them to the server in batches."""
+    buffer = ScanBuffer(buffer_path)
+    kiosk = Kiosk(buffer, server, team=team, batch_size=batch_size, linger=linger,
+                  timeout=timeout, debounce=debounce)
+    try:
+        left = kiosk.run(source)
+        rejected = buffer.rejected()
+    finally:
+        buffer.close()
+    if left:
+        click.echo(f'{left} scan(s) left in {buffer_path}; '
+                   'they are sent on the next run')
+    if rejected:
+        click.echo(f'{rejected} invalid scan(s) kept in the rejected table '
+                   f'of {buffer_path}')
+
+
+def init_app(app):
+    """Register ``flask kiosk``."""
+    app.cli.add_command(kiosk_command)
+
+
+if __name__ == '__main__':
+    kiosk_command()
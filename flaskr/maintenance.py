@@ -0,0 +1,317 @@
+"""Database maintenance: statistics, free space, WAL and integrity.
+
+``flask db-maintain`` runs these steps against each selected team
+database and reports how long each took and the file size before and
+after:
+
+* ``analyze``: ``ANALYZE`` with a bounded ``analysis_limit``, then
+  ``PRAGMA optimize``, so the query planner has fresh statistics;
+* ``vacuum``: ``PRAGMA incremental_vacuum`` in small steps, giving free
+  pages back to the file system;
+* ``checkpoint``: a ``PASSIVE`` WAL checkpoint, which never waits for
+  readers or writers (``--truncate-wal`` waits and truncates the log);
+* ``check``: ``PRAGMA quick_check`` (``--full-check`` runs the slower
+  ``integrity_check``).
+
+Live check-ins are not blocked. Writing steps are short, and the command
+takes the writer lock (see :mod:`flaskr.writes`) around each of
+them. The incremental vacuum releases the database between steps. The
+checkpoint does not wait unless asked to. On a database in WAL mode the
+integrity check runs alongside writers.
+
+Incremental vacuum needs ``auto_vacuum=INCREMENTAL``, and checkpoints
+need WAL mode. Neither is the SQLite default. ``--enable-incremental-vacuum``
+(one full ``VACUUM``) and ``--enable-wal`` convert a database once. Do this
+outside meeting hours.
+
+On PostgreSQL, the command runs ``ANALYZE`` and ``VACUUM``. The other
+steps only apply to SQLite.
+
+With ``DB_MAINTENANCE_SCHEDULER = True``, every worker schedules the
+steps daily at ``DB_MAINTENANCE_TIME``. Only one of them does the work:
+the first to take ``instance/db-maintain.lock`` writes the date into it,
+and the others find the lock held or the date taken and skip that day. A
+team is skipped while anyone is checked in.
+"""
+
+import os
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import date
+
+import click
+from flask.cli import with_appcontext
+
+from . import jobs
+from .cli import for_each_team, team_echo, team_options
+from .db import get_engine
+from .presence import get_snapshot
+from .teams import team_context, team_databases
+from .writes import writer_lock
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+STEPS = ('analyze', 'vacuum', 'checkpoint', 'check')
+
+# Rows sampled per index by ANALYZE; keeps it to milliseconds on any size of table
+ANALYSIS_LIMIT = 1000
+
+Step = namedtuple('Step', ['name', 'seconds', 'result'])
+Report = namedtuple('Report', ['steps', 'size_before', 'size_after', 'ok'])
+
+
+def format_size(size):
+    """Format a byte count for humans."""
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+class _Writing:
+    """Hold the writer lock (if any) around a writing step."""
+
+    def __init__(self, engine):
+        self.lock = writer_lock(engine)
+
+    def __enter__(self):
+        if self.lock is not None:
+            self.lock.acquire()
+
+    def __exit__(self, *exc):
+        if self.lock is not None:
+            self.lock.release()
+
+
+class SQLiteMaintenance:
+    """Maintenance steps on a raw ``sqlite3`` connection."""
+
+    def __init__(self, engine, connection):
+        self.engine = engine
+        self.connection = connection
+        self.path = engine.url.database
+
+    def _value(self, sql):
+        return self.connection.execute(sql).fetchone()[0]
+
+    def size(self):
+        """Return the size of the database file and its WAL in bytes."""
+        size = self._value('PRAGMA page_count') * self._value('PRAGMA page_size')
+        wal = f'{self.path}-wal'
+        if self.path not in (None, '', ':memory:') and os.path.exists(wal):
+            size += os.path.getsize(wal)
+        return size
+
+    def enable_wal(self):
+        with _Writing(self.engine):
+            return f'journal_mode={self._value("PRAGMA journal_mode=WAL")}'
+
+    def enable_incremental_vacuum(self):
+        with _Writing(self.engine):
+            self.connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self.connection.execute('VACUUM')
+        return 'auto_vacuum=INCREMENTAL (full VACUUM done)'
+
+    def analyze(self):
+        with _Writing(self.engine):
+            self.connection.execute(f'PRAGMA analysis_limit={ANALYSIS_LIMIT}')
+            self.connection.execute('ANALYZE')
+            self.connection.execute('PRAGMA optimize')
+        return 'statistics updated'
+
+    def vacuum(self, pages=500):
+        free = self._value('PRAGMA freelist_count')
+        if self._value('PRAGMA auto_vacuum') != 2:
+            return f'skipped: auto_vacuum is not INCREMENTAL ({free} free page(s))'
+        released = 0
+        while free:
+            with _Writing(self.engine):
+                # execute() steps a pragma without result columns only once, freeing a
+                # single page; executescript() runs it to completion
+                self.connection.executescript(f'PRAGMA incremental_vacuum({pages});')
+            remaining = self._value('PRAGMA freelist_count')
+            if remaining >= free:
+                break
+            released, free = released + free - remaining, remaining
+        return f'released {released} page(s)'
+
+    def checkpoint(self, truncate=False):
+        if self._value('PRAGMA journal_mode') != 'wal':
+            return 'skipped: not in WAL mode'
+        mode = 'TRUNCATE' if truncate else 'PASSIVE'
+        with _Writing(self.engine):
+            busy, frames, done = self.connection.execute(
+                f'PRAGMA wal_checkpoint({mode})').fetchone()
+        return f'{done} of {frames} frame(s) checkpointed' + (' (busy)' if busy else '')
+
+    def check(self, full=False):
+        pragma = 'integrity_check' if full else 'quick_check'
+        problems = [row[0] for row in self.connection.execute(f'PRAGMA {pragma}')]
+        return problems == ['ok'], '; '.join(problems)
+
+
+class ServerMaintenance:
+    """Maintenance steps for server databases (PostgreSQL)."""
+
+    def __init__(self, engine, connection):
+        self.engine = engine
+        self.connection = connection
+
+    def size(self):
+        return self.connection.exec_driver_sql(
+            'SELECT pg_database_size(current_database())').scalar()
+
+    def analyze(self):
+        self.connection.exec_driver_sql('ANALYZE')
+        return 'statistics updated'
+
+    def vacuum(self, pages=None):
+        self.connection.exec_driver_sql('VACUUM')
+        return 'dead rows reclaimed'
+
+    def checkpoint(self, truncate=False):
+        return 'skipped: SQLite only'
+
+    def check(self, full=False):
+        return True, 'skipped: SQLite only'
+
+
+def maintain(steps=STEPS, full_check=False, vacuum_pages=500, truncate_wal=False,
+             enable_wal=False, enable_incremental_vacuum=False):
+    """Run maintenance ``steps`` on the current team's database.
+
+    Returns a :class:`Report`.
+    """
+    engine = get_engine()
+    if engine.dialect.name == 'sqlite':
+        raw = engine.raw_connection()
+        close = raw.close
+        db = SQLiteMaintenance(engine, raw.driver_connection)
+    else:
+        connection = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        close = connection.close
+        db = ServerMaintenance(engine, connection)
+
+    results = []
+    ok = True
+
+    def run(name, step, *args):
+        start = time.perf_counter()
+        result = step(*args)
+        results.append(Step(name, time.perf_counter() - start, result))
+        return result
+
+    try:
+        size_before = db.size()
+        if enable_wal and isinstance(db, SQLiteMaintenance):
+            run('wal', db.enable_wal)
+        if enable_incremental_vacuum and isinstance(db, SQLiteMaintenance):
+            run('autovacuum', db.enable_incremental_vacuum)
+        if 'analyze' in steps:
+            run('analyze', db.analyze)
+        if 'vacuum' in steps:
+            run('vacuum', db.vacuum, vacuum_pages)
+        if 'checkpoint' in steps:
+            run('checkpoint', db.checkpoint, truncate_wal)
+        if 'check' in steps:
+            ok, detail = run('check', db.check, full_check)
+            results[-1] = results[-1]._replace(result=detail)
+        return Report(results, size_before, db.size(), ok)
+    finally:
+        close()
+
+
+@contextmanager
+def claim_scheduled_run(app, day):
+    """Yield True in the one process that claims the scheduled run for ``day``."""
+    path = os.path.join(app.instance_path, 'db-maintain.lock')
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another worker is running it right now
+                yield False
+                return
+        if os.pread(fd, 64, 0).decode() == day.isoformat():
+            # Another worker has already run it today
+            yield False
+            return
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, day.isoformat().encode(), 0)
+        yield True
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def maintain_idle_teams(app):
+    """Scheduled job: maintain every team database nobody is checked in to."""
+    with claim_scheduled_run(app, date.today()) as claimed:
+        if not claimed:
+            app.logger.info('Skipping scheduled maintenance: another worker has it')
+            return
+        _maintain_idle_teams(app)
+
+
+def _maintain_idle_teams(app):
+    with app.app_context():
+        for team in team_databases(app):
+            label = team or 'the default database'
+            with team_context(team):
+                if get_snapshot().summary()['checked_in']:
+                    app.logger.info(
+                        'Skipping maintenance of %s: members are checked in', label)
+                    continue
+                report = maintain()
+                if not report.ok:
+                    app.logger.error('Integrity check of %s failed: %s', label,
+                                     report.steps[-1].result)
+
+
+@click.command('db-maintain')
+@team_options
+@click.option('--skip', multiple=True, type=click.Choice(STEPS),
+              help='Leave out a step.')
+@click.option('--full-check', is_flag=True,
+              help='Run integrity_check instead of quick_check.')
+@click.option('--vacuum-pages', default=500, show_default=True,
+              help='Pages freed per incremental vacuum step.')
+@click.option('--truncate-wal', is_flag=True,
+              help='Wait for readers and truncate the WAL file.')
+@click.option('--enable-wal', is_flag=True,
+              help='Switch the database to WAL mode first.')
+@click.option('--enable-incremental-vacuum', is_flag=True,
+              help='Switch to auto_vacuum=INCREMENTAL first (runs one full VACUUM).')
+@with_appcontext
+def db_maintain_command(team, all_teams, skip, full_check, vacuum_pages, truncate_wal,
+                        enable_wal, enable_incremental_vacuum):
+    """Refresh statistics, free space, checkpoint the WAL and check integrity."""
+    steps = [step for step in STEPS if step not in skip]
+    failed = []
+    for name in for_each_team(team, all_teams):
+        report = maintain(steps, full_check, vacuum_pages, truncate_wal, enable_wal,
+                          enable_incremental_vacuum)
+        for step in report.steps:
+            team_echo(name, f'{step.name:<11}{step.seconds * 1000:9.1f} ms  '
+                            f'{step.result}')
+        team_echo(name, f'Size: {format_size(report.size_before)} -> '
+                        f'{format_size(report.size_after)}')
+        if not report.ok:
+            failed.append(name or 'default')
+    if failed:
+        raise click.ClickException(f'Integrity check failed: {", ".join(failed)}')
+
+
+def init_app(app):
+    """Register ``flask db-maintain`` and start the idle-time scheduler if enabled."""
+    app.cli.add_command(db_maintain_command)
+    if app.config.get('DB_MAINTENANCE_SCHEDULER') and not app.testing:
+        jobs.run_daily(app, app.config['DB_MAINTENANCE_TIME'], maintain_idle_teams,
+                       'db-maintain')
@@ -0,0 +1,46 @@
+"""Process-local counters for operational metrics.
+
+Counters are kept per worker process and exposed as JSON at
+``/api/metrics``; a scraper should sum them across workers.
+"""
+
+import threading
+
+from flask import current_app
+
+
+class Metrics:
+    """A thread-safe set of named counters."""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        """Add ``value`` to a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name):
+        """Return the current value of a counter."""
+        return self._counters.get(name, 0)
+
+    def snapshot(self):
+        """Return a copy of all counters."""
+        with self._lock:
+            return dict(self._counters)
+
+
+def get_metrics():
+    """Return the metrics registry for the current app."""
+    return current_app.extensions['metrics']
+
+
+def incr(name, value=1):
+    """Add ``value`` to a counter of the current app."""
+    get_metrics().incr(name, value)
+
+
+def init_app(app):
+    """Attach a metrics registry to the Flask app."""
+    app.extensions['metrics'] = Metrics()
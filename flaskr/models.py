@@ -1,7 +1,22 @@
 """Database models for Spartan Teamlog."""
 
-from datetime import datetime, timezone
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import select, update
 from .db import db
+from .dialects import upsert_increment
+from .positions import get_registry
+from . import presence
+from .writes import write_transaction
+
+# Outcome of a conditional check-in/out: ``changed`` is False when the member
+# was already in the requested state
+StateChange = namedtuple('StateChange', ['id', 'full_name', 'active', 'changed'])
+
+
+def _state_change(row, changed):
+    return StateChange(row.id, f'{row.first_name} {row.last_name}', row.active, changed)
 
 
 class Position(db.Model):
@@ -22,7 +37,15 @@ class Position(db.Model):
     def __str__(self):
         return self.name
     
+    @staticmethod
+    def member_counts():
+        """Return ``{position_id: member_count}`` in a single grouped query."""
+        from .statements import MEMBER_COUNTS
+        
+        return dict(db.session.execute(MEMBER_COUNTS).all())
+    
     @classmethod
+    @write_transaction
     def create_default_positions(cls):
         """Create the default positions if they don't exist."""
         default_positions = [
@@ -55,6 +78,14 @@ class Member(db.Model):
     checked_in = db.Column(db.Boolean, default=False, nullable=False)
     last_updated = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
     
+    # Relationship to attendance visits
+    visits = db.relationship('Attendance', backref='member', lazy=True,
+                             cascade='all, delete-orphan')
+    
+    # Relationship to per-season attendance bitmaps
+    attendance_bitmaps = db.relationship('AttendanceBitmap', backref='member',
+                                         lazy=True, cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<Member {self.first_name} {self.last_name}>'
     
@@ -69,20 +100,141 @@ class Member(db.Model):
     @property
     def position(self):
         """Return the position name for backward compatibility."""
+        registry = get_registry()
+        if registry is not None:
+            return registry.name_of(self.position_id)
         return self.position_obj.name if self.position_obj else None
     
+    @write_transaction
     def check_in(self):
         """Mark member as checked in and update timestamp."""
+        now = datetime.now(timezone.utc)
+        if not self.checked_in:
+            db.session.add(Attendance(member_id=self.id, checked_in_at=now))
+            OccupancyCount.record_checkin(now)
         self.checked_in = True
-        self.last_updated = datetime.now(timezone.utc)
+        self.last_updated = now
+        AttendanceBitmap.mark(self.id, date.today())
         db.session.commit()
     
+    @write_transaction
     def check_out(self):
         """Mark member as checked out and update timestamp."""
+        now = datetime.now(timezone.utc)
+        Attendance.close_open_visits(now, member_ids=[self.id])
         self.checked_in = False
-        self.last_updated = datetime.now(timezone.utc)
+        self.last_updated = now
+        db.session.commit()
+    
+    @classmethod
+    def check_in_by_id(cls, member_id):
+        """Check a member in by id without loading it. Returns a StateChange or None."""
+        return cls._set_checked_in(True, 'id', member_id)
+    
+    @classmethod
+    def check_in_by_idhash(cls, idhash):
+        """Check an active member in by idhash. Returns a StateChange or None."""
+        return cls._set_checked_in(True, 'idhash', idhash)
+    
+    @classmethod
+    def check_out_by_id(cls, member_id):
+        """Check a member out by id without loading. Returns a StateChange or None."""
+        return cls._set_checked_in(False, 'id', member_id)
+    
+    @classmethod
+    @write_transaction
+    def _set_checked_in(cls, checked_in, by, key):
+        """Flip ``checked_in`` for the member whose ``by`` column equals ``key``.
+        
+        On backends that support it this is a single ``UPDATE ... RETURNING``
+        that only matches when the state actually changes; elsewhere the row
+        is selected first and updated by id. Nothing is written when the
+        member is already in that state. The statements are prebuilt in
+        :mod:`flaskr.statements`. Returns None if no member matches.
+        """
+        from . import statements
+        
+        now = datetime.now(timezone.utc)
+        params = {'key': key, 'state': checked_in, 'now': now}
+        
+        if db.session.get_bind().dialect.update_returning:
+            row = db.session.execute(statements.SET_STATE_RETURNING[by], params).first()
+        else:
+            row = db.session.execute(statements.PENDING_STATE[by], params).first()
+            if row is not None:
+                result = db.session.execute(statements.SET_STATE_BY_ID,
+                                            {**params, 'key': row.id})
+                if result.rowcount == 0:
+                    row = None
+        
+        if row is None:
+            # Nothing changed: report the current state, or that there is no member
+            row = db.session.execute(statements.CURRENT_STATE[by], params).first()
+            # End the transaction so the no-op UPDATE does not hold the write lock
+            db.session.commit()
+            if row is None:
+                return None
+            return _state_change(row, False)
+        
+        if checked_in:
+            db.session.add(Attendance(member_id=row.id, checked_in_at=now))
+            OccupancyCount.record_checkin(now)
+            AttendanceBitmap.mark(row.id, date.today())
+        else:
+            Attendance.close_open_visits(now, member_ids=[row.id])
+        presence.stage(db.session, row.id)
+        db.session.commit()
+        return _state_change(row, True)
+    
+    @classmethod
+    @write_transaction
+    def check_in_by_idhashes(cls, arrivals):
+        """Check in many active members at once, each at its own time.
+        
+        ``arrivals`` maps idhashes to check-in times. Members who are not
+        checked in yet are flipped with one conditional ``UPDATE`` and get an
+        attendance row at their arrival time; everything commits together.
+        Returns ``{idhash: StateChange}``; unknown and inactive idhashes are
+        left out.
+        """
+        table = cls.__table__
+        now = datetime.now(timezone.utc)
+        columns = (table.c.id, table.c.idhash, table.c.first_name, table.c.last_name,
+                   table.c.active)
+        pending = (table.c.idhash.in_(list(arrivals)), table.c.active == True,
+                   table.c.checked_in == False)
+        stmt = update(table).values(checked_in=True, last_updated=now)
+    
+        if db.session.get_bind().dialect.update_returning:
+            changed = db.session.execute(stmt.where(*pending).returning(*columns)).all()
+        else:
+            changed = db.session.execute(select(*columns).where(*pending)).all()
+            if changed:
+                ids = [row.id for row in changed]
+                db.session.execute(stmt.where(table.c.id.in_(ids),
+                                              table.c.checked_in == False))
+    
+        results = {}
+        visits = []
+        for row in changed:
+            at = arrivals[row.idhash]
+            db.session.add(Attendance(member_id=row.id, checked_in_at=at))
+            AttendanceBitmap.mark(row.id, OccupancyCount.local(at).date())
+            presence.stage(db.session, row.id)
+            visits.append((at, None))
+            results[row.idhash] = _state_change(row, True)
+        OccupancyCount.add(OccupancyCount.tally(visits, count_checkins=True))
+    
+        unchanged = [idhash for idhash in arrivals if idhash not in results]
+        if unchanged:
+            rows = db.session.execute(select(*columns).where(
+                table.c.idhash.in_(unchanged), table.c.active == True)).all()
+            for row in rows:
+                results[row.idhash] = _state_change(row, False)
         db.session.commit()
+        return results
     
+    @write_transaction
     def toggle_active_status(self):
         """Toggle the active status of the member."""
         self.active = not self.active
@@ -99,6 +251,34 @@ class Member(db.Model):
         """Get all currently checked-in members."""
         return cls.query.filter_by(checked_in=True, active=True).all()
     
+    @classmethod
+    @write_transaction
+    def check_out_all(cls, at=None, auto=False):
+        """Check out every checked-in active member in a single transaction.
+        
+        With ``at`` given, only visits that began before that time are closed
+        and ``at`` is recorded as the check-out time. The statements are
+        conditional, so running this again (or on another worker at the same
+        time) simply finds nothing left to do. Returns the number of members
+        checked out.
+        """
+        at = at or datetime.now(timezone.utc)
+        
+        # Visits opened after the cut-off belong to a later meeting
+        later_visits = db.session.query(Attendance.member_id).filter(
+            Attendance.checked_out_at.is_(None),
+            Attendance.checked_in_at > at
+        )
+        count = cls.query.filter(
+            cls.checked_in == True,
+            cls.active == True,
+            cls.id.not_in(later_visits)
+        ).update({'checked_in': False, 'last_updated': at}, synchronize_session=False)
+        active = db.session.query(cls.id).filter(cls.active == True)
+        Attendance.close_open_visits(at, member_ids=active, auto=auto)
+        db.session.commit()
+        return count
+    
     def to_dict(self):
         """Convert member to dictionary representation."""
         return {
@@ -114,4 +294,219 @@ class Member(db.Model):
             'last_updated': self.last_updated.isoformat() if self.last_updated else None
         }
 
-        
\ No newline at end of file
+
+class Attendance(db.Model):
+    """A single visit: when a member checked in and when they left."""
+    
+    __tablename__ = 'attendance'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('members.id'), nullable=False,
+                          index=True)
+    checked_in_at = db.Column(db.DateTime, nullable=False, index=True)
+    checked_out_at = db.Column(db.DateTime, nullable=True)
+    # True when the check-out time was filled in by the auto-checkout job
+    auto_checkout = db.Column(db.Boolean, default=False, nullable=False)
+    
+    def __repr__(self):
+        return f'<Attendance member={self.member_id} in={self.checked_in_at}>'
+    
+    @classmethod
+    def close_open_visits(cls, at, member_ids=None, auto=False):
+        """Record ``at`` as the check-out time of open visits that began before it.
+        
+        The closed visits' time is added to the occupancy counters. Returns
+        the number of visits closed.
+        """
+        table = cls.__table__
+        criteria = [table.c.checked_out_at.is_(None), table.c.checked_in_at <= at]
+        if member_ids is not None:
+            criteria.append(table.c.member_id.in_(member_ids))
+        stmt = update(table).where(*criteria).values(checked_out_at=at,
+                                                     auto_checkout=auto)
+        
+        if db.session.get_bind().dialect.update_returning:
+            opened = db.session.execute(
+                stmt.returning(table.c.checked_in_at)).scalars().all()
+        else:
+            opened = db.session.execute(
+                select(table.c.checked_in_at).where(*criteria)).scalars().all()
+            db.session.execute(stmt)
+        OccupancyCount.record_visits((checked_in_at, at) for checked_in_at in opened)
+        return len(opened)
+
+
+class OccupancyCount(db.Model):
+    """Running occupancy totals for one local weekday and hour of the day.
+
+    ``checkins`` counts arrivals during the hour and ``seconds`` the time
+    members spent in the shop during it. Both are updated as visits open and
+    close, so the occupancy heatmap never has to scan the visit history.
+    """
+    
+    __tablename__ = 'occupancy'
+    
+    # Monday is 0, as in ``date.weekday()``
+    weekday = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    hour = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    checkins = db.Column(db.Integer, default=0, nullable=False)
+    seconds = db.Column(db.Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<OccupancyCount weekday={self.weekday} hour={self.hour}>'
+    
+    @staticmethod
+    def local(value):
+        """Convert a UTC datetime (naive values are assumed UTC) to local time."""
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone()
+    
+    @classmethod
+    def buckets(cls, checked_in_at, checked_out_at):
+        """Yield ``(weekday, hour, seconds)`` for each local hour a visit spans."""
+        start, end = cls.local(checked_in_at), cls.local(checked_out_at)
+        while start < end:
+            hour = start.replace(minute=0, second=0, microsecond=0)
+            stop = min(hour + timedelta(hours=1), end)
+            yield start.weekday(), start.hour, (stop - start).total_seconds()
+            start = stop
+    
+    @classmethod
+    def add(cls, counts):
+        """Add ``{(weekday, hour): (checkins, seconds)}`` to the counters.
+
+        The caller commits the changes.
+        """
+        for (weekday, hour), (checkins, seconds) in counts.items():
+            upsert_increment(db.session, cls.__table__,
+                             {'weekday': weekday, 'hour': hour},
+                             {'checkins': checkins, 'seconds': round(seconds)})
+    
+    @classmethod
+    def record_checkin(cls, at):
+        """Count an arrival at ``at``."""
+        at = cls.local(at)
+        cls.add({(at.weekday(), at.hour): (1, 0)})
+    
+    @classmethod
+    def tally(cls, visits, count_checkins=False):
+        """Return per-bucket ``(checkins, seconds)`` for a run of visits.
+
+        ``visits`` are ``(checked_in_at, checked_out_at)`` pairs.
+        """
+        counts = {}
+        for checked_in_at, checked_out_at in visits:
+            if count_checkins:
+                arrival = cls.local(checked_in_at)
+                bucket = arrival.weekday(), arrival.hour
+                checkins, seconds = counts.get(bucket, (0, 0))
+                counts[bucket] = (checkins + 1, seconds)
+            if checked_out_at is None:
+                continue
+            for weekday, hour, spent in cls.buckets(checked_in_at, checked_out_at):
+                checkins, seconds = counts.get((weekday, hour), (0, 0))
+                counts[weekday, hour] = (checkins, seconds + spent)
+        return counts
+    
+    @classmethod
+    def record_visits(cls, visits):
+        """Add the time of finished ``(checked_in_at, checked_out_at)`` visits."""
+        cls.add(cls.tally(visits))
+
+
+class AttendanceBitmap(db.Model):
+    """Compact attendance history: one bit per day of a season for a member.
+
+    Bit ``n`` is set when the member checked in on day ``n`` of the season,
+    counted from the season start. The bits are stored as a little-endian
+    packed blob so whole-season questions become integer bit operations.
+    """
+    
+    __tablename__ = 'attendance_bitmaps'
+    __table_args__ = (db.UniqueConstraint('member_id', 'season'),)
+    
+    # Enough bits for any season (366 days)
+    SEASON_DAYS = 366
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    member_id = db.Column(db.Integer, db.ForeignKey('members.id'), nullable=False,
+                          index=True)
+    season = db.Column(db.Integer, nullable=False, index=True)
+    days = db.Column(db.LargeBinary, nullable=False,
+                     default=bytes((SEASON_DAYS + 7) // 8))
+    
+    def __repr__(self):
+        return f'<AttendanceBitmap member={self.member_id} season={self.season}>'
+    
+    @property
+    def bits(self):
+        """Return the attendance days as an integer bitset."""
+        return int.from_bytes(self.days, 'little')
+    
+    @bits.setter
+    def bits(self, value):
+        self.days = value.to_bytes((self.SEASON_DAYS + 7) // 8, 'little')
+    
+    @staticmethod
+    def season_start(season):
+        """Return the first day of a season (``SEASON_START_MONTH``, or January)."""
+        return date(season, current_app.config.get('SEASON_START_MONTH', 1), 1)
+    
+    @classmethod
+    def season_of(cls, day):
+        """Return the season a day belongs to and its index within that season."""
+        season = day.year if day >= cls.season_start(day.year) else day.year - 1
+        return season, (day - cls.season_start(season)).days
+    
+    @classmethod
+    def mark(cls, member_id, day):
+        """Set the attendance bit for a member on a day (committed by the caller)."""
+        season, index = cls.season_of(day)
+        bitmap = cls.query.filter_by(member_id=member_id, season=season).first()
+        if bitmap is None:
+            bitmap = cls(member_id=member_id, season=season)
+            bitmap.bits = 0
+            db.session.add(bitmap)
+        if not bitmap.bits >> index & 1:
+            bitmap.bits = bitmap.bits | 1 << index
+        return bitmap
+
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a request sent with an ``Idempotency-Key`` header.
+
+    The row is claimed (with ``status`` unset) before the request runs and
+    completed with the response afterwards, so a retry is answered from
+    here instead of repeating the write.
+    """
+    
+    __tablename__ = 'idempotency_keys'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    # Body hash, method and path of the original request; a key may not
+    # be reused for another request
+    fingerprint = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.Integer, nullable=True)
+    headers = db.Column(db.JSON, nullable=True)
+    body = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<IdempotencyKey {self.key} status={self.status}>'
+
+
+class CacheVersion(db.Model):
+    """Change counter for data that workers cache in memory.
+
+    Bumped in the same transaction as the change, so a worker that sees a
+    new version knows its cached copy is stale (see flaskr/coherence.py).
+    """
+    
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
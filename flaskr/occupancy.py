@@ -0,0 +1,73 @@
+"""Occupancy heatmap: when the shop is busiest, by weekday and hour.
+
+The heatmap is read from the ``occupancy`` counter table
+(:class:`~flaskr.models.OccupancyCount`), which holds at most 7 x 24 rows
+and is updated as members check in and out. Serving it costs the same
+however many seasons of history exist. Time spent is counted when a visit
+closes, so members who are still checked in only show up as arrivals.
+
+``flask rebuild-occupancy`` recomputes the counters from the visit history
+(including archived seasons), e.g. after importing old data or changing
+the server's time zone.
+"""
+
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from .archive import load_visits
+from .cli import for_each_team, team_echo, team_options
+from .db import db
+from .models import OccupancyCount
+from .writes import run_write
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday',
+            'Sunday')
+
+
+def occupancy_grid():
+    """Return the heatmap as 7 x 24 grids of arrivals and person-hours."""
+    checkins = [[0] * 24 for _ in WEEKDAYS]
+    person_hours = [[0.0] * 24 for _ in WEEKDAYS]
+    for row in db.session.query(OccupancyCount.weekday, OccupancyCount.hour,
+                                OccupancyCount.checkins, OccupancyCount.seconds):
+        checkins[row.weekday][row.hour] = row.checkins
+        person_hours[row.weekday][row.hour] = round(row.seconds / 3600, 2)
+    return {
+        'weekdays': list(WEEKDAYS),
+        'hours': list(range(24)),
+        'checkins': checkins,
+        'person_hours': person_hours,
+    }
+
+
+def rebuild_occupancy():
+    """Recompute the counters from every visit. Returns the number of visits."""
+    def rebuild():
+        visits = load_visits(datetime.min, datetime.max)
+        db.session.query(OccupancyCount).delete()
+        OccupancyCount.add(OccupancyCount.tally(
+            ((checked_in_at, checked_out_at)
+             for _, checked_in_at, checked_out_at, _ in visits),
+            count_checkins=True
+        ))
+        db.session.commit()
+        return len(visits)
+
+    return run_write(rebuild)
+
+
+@click.command()
+@team_options
+@with_appcontext
+def rebuild_occupancy_command(team, all_teams):
+    """Recompute the occupancy heatmap from the visit history."""
+    for name in for_each_team(team, all_teams):
+        count = rebuild_occupancy()
+        team_echo(name, f'Rebuilt occupancy from {count} visit(s).')
+
+
+def init_app(app):
+    """Register the rebuild command."""
+    app.cli.add_command(rebuild_occupancy_command, name='rebuild-occupancy')
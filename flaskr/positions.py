@@ -0,0 +1,108 @@
+"""Process-wide registry of team positions.
+
+Positions almost never change, so each worker loads them once per team
+and answers id/name lookups from memory. The registry is invalidated when
+a transaction that inserted, updated or deleted a ``Position`` commits,
+in other workers at their next request (see :mod:`flaskr.coherence`), and
+reloads lazily on the next lookup.
+"""
+
+import threading
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from . import coherence
+from .db import TeamSession, get_engine
+from .teams import current_team
+
+PositionInfo = namedtuple('PositionInfo', ['id', 'name', 'description'])
+
+
+class PositionRegistry:
+    """Positions keyed by id and by name, cached per team."""
+
+    def __init__(self):
+        self._teams = {}
+        self._lock = threading.Lock()
+
+    def _entry(self):
+        team = current_team()
+        entry = self._teams.get(team)
+        if entry is None:
+            entry = self._load()
+            with self._lock:
+                self._teams[team] = entry
+        return entry
+
+    @staticmethod
+    def _load():
+        from .statements import POSITIONS
+
+        with get_engine().connect() as conn:
+            rows = conn.execute(POSITIONS).all()
+        positions = [PositionInfo(*row) for row in rows]
+        return (
+            positions,
+            {p.id: p for p in positions},
+            {p.name: p for p in positions},
+        )
+
+    def all(self):
+        """Return every position, ordered by id."""
+        return list(self._entry()[0])
+
+    def get(self, position_id):
+        """Return the position with an id, or None."""
+        return self._entry()[1].get(position_id)
+
+    def by_name(self, name):
+        """Return the position with a name, or None."""
+        return self._entry()[2].get(name)
+
+    def name_of(self, position_id):
+        """Return the name of a position id, or None."""
+        position = self.get(position_id)
+        return position.name if position else None
+
+    def invalidate(self, team=None):
+        """Forget the cached positions of one team."""
+        with self._lock:
+            self._teams.pop(team, None)
+
+    def clear(self):
+        """Forget the cached positions of every team."""
+        with self._lock:
+            self._teams.clear()
+
+
+def get_registry():
+    """Return the position registry for the current app, if one is set up."""
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('positions')
+
+
+@event.listens_for(TeamSession, 'after_flush')
+def _stage_position_changes(session, flush_context):
+    from .models import Position
+
+    if any(isinstance(obj, Position)
+           for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        coherence.touch(session, 'positions')
+
+
+@event.listens_for(TeamSession, 'after_bulk_update')
+@event.listens_for(TeamSession, 'after_bulk_delete')
+def _stage_bulk_position_change(context):
+    from .models import Position
+
+    if context.mapper.class_ is Position:
+        coherence.touch(context.session, 'positions')
+
+
+def init_app(app):
+    """Attach the position registry to the Flask app."""
+    app.extensions['positions'] = registry = PositionRegistry()
+    coherence.register(app, 'positions', registry.invalidate)
@@ -0,0 +1,516 @@
+"""Shared presence snapshot for multi-worker deployments.
+
+Every worker process maps the same small file holding three bitsets
+indexed by member id: known members, active members and checked-in members. The
+header carries a version stamp and precomputed counts, so "how many are
+here" is answered from memory without a database query.
+
+The snapshot is kept current from SQLAlchemy session events: the ids of
+changed members are staged when the session flushes and, once the
+transaction commits, their rows are read back from the database and
+written to the bitsets. Writers take a file lock and bump the version to
+an odd number while they work (a seqlock), so readers never see a
+half-written update. The rows are read while the lock is held, so when
+two workers change one member the worker that writes last also read
+last, and the snapshot ends up matching the database whatever order
+their commits and updates ran in. A worker that dies between its commit
+and its update leaves the snapshot behind, so each worker also rebuilds
+it from the members table every ``PRESENCE_RECONCILE_INTERVAL`` seconds.
+
+The file sits next to the database it mirrors (``<database>.presence``),
+so each team database, and each deployment, has its own. An in-memory
+SQLite database cannot be shared between processes, so for those the
+snapshot lives in anonymous memory instead of a file.
+
+Server databases (PostgreSQL) may be shared by workers on several hosts,
+which a local file cannot reach. There each worker keeps the snapshot in
+anonymous memory and loads it from the members table. Every member
+change bumps the ``presence`` counter of :mod:`flaskr.coherence`, so
+other workers reload at their next request. The snapshot version is
+derived from that counter, so every host gives the same status document
+the same version.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import partial
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from . import coherence
+from .db import TeamSession, get_engine
+from .teams import current_team, team_databases
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# version, nbits, checked-in count, active count, total count
+HEADER = struct.Struct('<QIIII')
+MIN_BITS = 4096
+
+# Bitset slots following the header
+KNOWN, ACTIVE, PRESENT = range(3)
+
+
+def _popcount(data):
+    return bin(int.from_bytes(data, 'little')).count('1')
+
+
+def _ids(data):
+    value = int.from_bytes(data, 'little')
+    ids = []
+    while value:
+        low = value & -value
+        ids.append(low.bit_length() - 1)
+        value ^= low
+    return ids
+
+
+class PresenceSnapshot:
+    """Memory-mapped presence bitsets with a version stamp."""
+
+    def __init__(self, path=None, nbits=MIN_BITS):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = None
+        self._map = None
+        self._nbits = 0
+
+        if path is None:
+            self._map = mmap.mmap(-1, self._size(nbits))
+            self._map[:HEADER.size] = HEADER.pack(0, nbits, 0, 0, 0)
+            self._nbits = nbits
+        else:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            with self._file_lock():
+                if os.fstat(self._fd).st_size < HEADER.size:
+                    os.ftruncate(self._fd, self._size(nbits))
+                    os.pwrite(self._fd, HEADER.pack(0, nbits, 0, 0, 0), 0)
+            self._remap()
+
+    @staticmethod
+    def _size(nbits):
+        return HEADER.size + 3 * (nbits // 8)
+
+    def _remap(self):
+        # Old mappings are left to the garbage collector, since another
+        # thread may still be reading from them
+        self._map = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+        self._nbits = HEADER.unpack_from(self._map)[1]
+
+    def _file_lock(self):
+        return _FileLock(self._fd)
+
+    def _slot(self, slot):
+        width = self._nbits // 8
+        start = HEADER.size + slot * width
+        return start, start + width
+
+    def _read(self, reader, spins=1000):
+        """Run ``reader`` against a consistent view of the snapshot."""
+        for _ in range(spins):
+            version, nbits = HEADER.unpack_from(self._map)[:2]
+            if version % 2:
+                continue
+            if nbits != self._nbits:
+                with self._lock:
+                    self._remap()
+                continue
+            result = reader()
+            if HEADER.unpack_from(self._map)[0] == version:
+                return result
+
+        # A writer is slow (or died mid-update): read under the lock instead
+        with self._lock, self._file_lock():
+            if self._fd is not None:
+                self._remap()
+            return reader()
+
+    @property
+    def version(self):
+        """Version stamp, bumped by two on every update."""
+        return self._read(lambda: HEADER.unpack_from(self._map)[0])
+
+    def summary(self):
+        """Return the attendance counts used by the dashboard."""
+        checked_in, active, total = self._read(
+            lambda: HEADER.unpack_from(self._map)[2:])
+        return {
+            'checked_in': checked_in,
+            'total_active': active,
+            'total_members': total
+        }
+
+    def is_present(self, member_id):
+        """Return True if the member is active and checked in."""
+        def reader():
+            if member_id >= self._nbits:
+                return False
+            byte, bit = divmod(member_id, 8)
+            mask = 1 << bit
+            return all(self._map[self._slot(slot)[0] + byte] & mask
+                       for slot in (ACTIVE, PRESENT))
+        return self._read(reader)
+
+    def present_ids(self):
+        """Return the ids of all active, checked-in members."""
+        def reader():
+            start, end = self._slot(ACTIVE)
+            active = int.from_bytes(self._map[start:end], 'little')
+            start, end = self._slot(PRESENT)
+            present = int.from_bytes(self._map[start:end], 'little')
+            return (active & present).to_bytes(end - start, 'little')
+        return _ids(self._read(reader))
+
+    def state(self):
+        """Return ``(version, summary, present_ids)`` from one consistent read."""
+        def reader():
+            version, _, checked_in, active, total = HEADER.unpack_from(self._map)
+            start, end = self._slot(ACTIVE)
+            active_bits = int.from_bytes(self._map[start:end], 'little')
+            start, end = self._slot(PRESENT)
+            present = int.from_bytes(self._map[start:end], 'little')
+            summary = {'checked_in': checked_in, 'total_active': active,
+                       'total_members': total}
+            present = (active_bits & present).to_bytes(end - start, 'little')
+            return version, summary, present
+        version, summary, present = self._read(reader)
+        return version, summary, _ids(present)
+
+    def _write(self, writer, nbits, version=None):
+        """Apply ``writer`` to the bitsets under the seqlock.
+
+        The version ends up as ``version + 2`` when given.
+        """
+        with self._lock, self._file_lock():
+            self._write_locked(writer, nbits, version)
+
+    def _write_locked(self, writer, nbits, version=None):
+        if self._fd is not None and HEADER.unpack_from(self._map)[1] != self._nbits:
+            self._remap()
+
+        # An odd stamp left behind by a crashed writer is simply reused
+        if version is None:
+            version = HEADER.unpack_from(self._map)[0]
+        version |= 1
+        struct.pack_into('<Q', self._map, 0, version)
+        if nbits > self._nbits:
+            self._grow(nbits)
+
+        writer()
+
+        known, active, present = (
+            self._map[slice(*self._slot(slot))] for slot in (KNOWN, ACTIVE, PRESENT)
+        )
+        checked_in = _popcount(bytes(
+            a & p for a, p in zip(active, present)
+        ))
+        HEADER.pack_into(self._map, 0, version, self._nbits, checked_in,
+                         _popcount(active), _popcount(known))
+        struct.pack_into('<Q', self._map, 0, version + 1)
+
+    def _grow(self, nbits):
+        """Resize the bitsets so ids below ``nbits`` fit."""
+        new_bits = self._nbits
+        while new_bits < nbits:
+            new_bits *= 2
+        slots = [bytes(self._map[slice(*self._slot(slot))])
+                 for slot in (KNOWN, ACTIVE, PRESENT)]
+
+        if self._fd is None:
+            header = self._map[:HEADER.size]
+            self._map = mmap.mmap(-1, self._size(new_bits))
+            self._map[:HEADER.size] = header
+        else:
+            os.ftruncate(self._fd, self._size(new_bits))
+            self._map = mmap.mmap(self._fd, self._size(new_bits))
+
+        self._nbits = new_bits
+        struct.pack_into('<I', self._map, 8, new_bits)
+        for slot, data in zip((KNOWN, ACTIVE, PRESENT), slots):
+            start, end = self._slot(slot)
+            self._map[start:end] = data.ljust(end - start, b'\0')
+
+    def _set_bits(self, changes):
+        for member_id, state in changes.items():
+            byte, bit = divmod(member_id, 8)
+            mask = 1 << bit
+            flags = (True, *state) if state is not None else (False, False, False)
+            for slot, flag in zip((KNOWN, ACTIVE, PRESENT), flags):
+                offset = self._slot(slot)[0] + byte
+                if flag:
+                    self._map[offset] |= mask
+                else:
+                    self._map[offset] &= ~mask & 0xFF
+
+    def apply(self, changes):
+        """Apply ``{member_id: (active, checked_in) or None}`` changes."""
+        if changes:
+            self._write(lambda: self._set_bits(changes), max(changes) + 1)
+
+    def rebuild(self, rows, version=None):
+        """Replace the snapshot with ``(member_id, active, checked_in)`` rows."""
+        changes = {member_id: (bool(active), bool(checked_in))
+                   for member_id, active, checked_in in rows}
+
+        def writer():
+            self._map[HEADER.size:] = bytes(len(self._map) - HEADER.size)
+            self._set_bits(changes)
+
+        self._write(writer, max(changes, default=0) + 1, version)
+
+    def sync(self, load, member_ids=None):
+        """Copy ``load(member_ids)`` rows into the snapshot under the write lock.
+
+        ``load`` returns ``(member_id, active, checked_in)`` rows for the
+        given ids, or for every member when ``member_ids`` is None, in
+        which case the snapshot is replaced. Ids without a row have been
+        deleted.
+        """
+        with self._lock, self._file_lock():
+            changes = {member_id: (bool(active), bool(checked_in))
+                       for member_id, active, checked_in in load(member_ids)}
+            if member_ids is None:
+                def writer():
+                    self._map[HEADER.size:] = bytes(len(self._map) - HEADER.size)
+                    self._set_bits(changes)
+            else:
+                changes.update({member_id: None for member_id in member_ids
+                                if member_id not in changes})
+
+                def writer():
+                    self._set_bits(changes)
+            self._write_locked(writer, max(changes, default=0) + 1)
+
+    def close(self):
+        """Release the mapping and file handle."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _FileLock:
+    """Exclusive ``flock`` on the snapshot file, a no-op without a file."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if self.fd is not None and fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc):
+        if self.fd is not None and fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def _in_database(engine):
+    """Return True if the snapshot is kept current through the database.
+
+    SQLite databases share a snapshot file between workers instead.
+    """
+    return engine.dialect.name != 'sqlite'
+
+
+def _snapshot_path(engine):
+    """Return the snapshot file of a database, or None to use anonymous memory."""
+    database = engine.url.database
+    if _in_database(engine) or database in (None, '', ':memory:'):
+        return None
+    return f'{database}.presence'
+
+
+def _member_rows(engine, member_ids=None):
+    """Read ``(id, active, checked_in)`` rows of some or all members."""
+    from .models import Member
+
+    query = select(Member.id, Member.active, Member.checked_in)
+    if member_ids is not None:
+        query = query.where(Member.id.in_(member_ids))
+    # Use a separate connection so this is safe from session commit hooks
+    with engine.connect() as conn:
+        return conn.execute(query).all()
+
+
+def _load(engine, snapshot):
+    """Fill ``snapshot`` from the members table."""
+    from .models import CacheVersion, Member
+
+    if not _in_database(engine):
+        snapshot.sync(partial(_member_rows, engine))
+        return
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Both queries see the same database state
+            conn.execution_options(isolation_level='REPEATABLE READ')
+        with conn.begin():
+            counter = conn.execute(select(CacheVersion.version).where(
+                CacheVersion.name == 'presence')).scalar() or 0
+            rows = conn.execute(
+                select(Member.id, Member.active, Member.checked_in)).all()
+    snapshot.rebuild(rows, version=2 * counter)
+
+
+def get_snapshot():
+    """Return the presence snapshot for the current team."""
+    snapshots = current_app.extensions['presence']
+    team = current_team()
+    snapshot = snapshots.get(team)
+    if snapshot is None:
+        engine = get_engine()
+        snapshot = PresenceSnapshot(_snapshot_path(engine))
+        if _in_database(engine):
+            _load(engine, snapshot)
+        snapshots[team] = snapshot
+    return snapshot
+
+
+def rebuild():
+    """Reload the current team's snapshot from the members table."""
+    engine = get_engine()
+    if _in_database(engine):
+        _forget(current_team())
+    else:
+        _load(engine, get_snapshot())
+
+
+def reconcile():
+    """Request hook: rebuild the snapshot file from the database now and then.
+
+    Catches up with updates lost by a worker that died between a commit
+    and its snapshot update. Snapshots kept in the database reload
+    through the coherence counter instead.
+    """
+    interval = current_app.config['PRESENCE_RECONCILE_INTERVAL']
+    engine = get_engine()
+    if not interval or _in_database(engine):
+        return
+    reconciled = current_app.extensions['presence_reconciled']
+    team = current_team()
+    now = time.monotonic()
+    if now - reconciled.setdefault(team, now) >= interval:
+        reconciled[team] = now
+        _load(engine, get_snapshot())
+
+
+def _forget(team):
+    """Drop a team's database-kept snapshot so it is loaded again when next used."""
+    if _in_database(get_engine()):
+        current_app.extensions['presence'].pop(team, None)
+
+
+def _touch(session):
+    if _in_database(session.get_bind()):
+        coherence.touch(session, 'presence')
+
+
+def stage(session, member_id):
+    """Stage a member whose presence is published when ``session`` commits."""
+    session.info.setdefault('presence', set()).add(member_id)
+    _touch(session)
+
+
+def status_json():
+    """Return ``(version, body)``: the JSON status document for displays.
+
+    The document holds the counts and the present members' ids and names.
+    It is built once per snapshot version and cached, so while nothing
+    changes a poll costs one read of the shared header.
+    """
+    from .models import Member
+
+    cache = current_app.extensions['presence_status']
+    team = current_team()
+    version, summary, ids = get_snapshot().state()
+    cached = cache.get(team)
+    if cached is not None and cached[0] == version:
+        return cached
+
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            select(Member.id, Member.first_name, Member.last_name)
+            .where(Member.id.in_(ids))
+            .order_by(Member.last_name, Member.first_name)
+        ).all()
+    body = json.dumps({
+        'version': version,
+        **summary,
+        'present': [{'id': row.id, 'name': f'{row.first_name} {row.last_name}'}
+                    for row in rows]
+    })
+    cache[team] = cached = (version, body)
+    return cached
+
+
+@event.listens_for(TeamSession, 'after_flush')
+def _stage_member_changes(session, flush_context):
+    from .models import Member
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Member) and obj.id is not None:
+            stage(session, obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Member) and obj.id is not None:
+            stage(session, obj.id)
+
+
+@event.listens_for(TeamSession, 'after_bulk_update')
+@event.listens_for(TeamSession, 'after_bulk_delete')
+def _stage_bulk_change(context):
+    from .models import Member
+
+    if context.mapper.class_ is Member:
+        context.session.info['presence_rebuild'] = True
+        _touch(context.session)
+
+
+@event.listens_for(TeamSession, 'after_commit')
+def _publish_member_changes(session):
+    changes = session.info.pop('presence', None)
+    needs_rebuild = session.info.pop('presence_rebuild', False)
+    if 'presence' not in current_app.extensions:
+        return
+    if _in_database(get_engine()):
+        # The touched counter drops the snapshot (see _forget)
+        return
+    if needs_rebuild:
+        rebuild()
+    elif changes:
+        get_snapshot().sync(partial(_member_rows, get_engine()), sorted(changes))
+
+
+@event.listens_for(TeamSession, 'after_rollback')
+def _discard_member_changes(session):
+    session.info.pop('presence', None)
+    session.info.pop('presence_rebuild', None)
+
+
+def attendance_summary():
+    """Template context processor exposing the title-bar counts."""
+    return {'attendance_summary': get_snapshot().summary()}
+
+
+def init_app(app):
+    """Build the presence snapshots and expose them to templates."""
+    from .teams import team_context
+
+    app.extensions['presence'] = {}
+    app.extensions['presence_status'] = {}
+    app.extensions['presence_reconciled'] = {}
+    with app.app_context():
+        for team in team_databases(app):
+            with team_context(team):
+                rebuild()
+    app.before_request(reconcile)
+    app.context_processor(attendance_summary)
+    coherence.register(app, 'presence', _forget)
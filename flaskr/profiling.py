@@ -0,0 +1,181 @@
+"""Opt-in request profiling for production diagnosis.
+
+With ``PROFILE_ENABLED`` set, a request is run under :mod:`cProfile` when
+
+* it is the N-th request of this worker (``PROFILE_SAMPLE_RATE = N``),
+* its endpoint matches the ``PROFILE_ENDPOINTS`` regular expression, or
+* it carries the ``PROFILE_HEADER`` header (``X-Profile: 1``).
+
+Each profile is written to ``instance/profiles/`` as a ``.prof`` file with
+a ``.json`` sidecar holding the endpoint, path, status and latency.
+``flask profile-summary`` merges the collected profiles and prints the
+hottest functions.
+
+Only one request per process is profiled at a time. Python 3.12 refuses
+to enable a second profiler, so a request sampled while another one is
+being profiled runs without a profiler.
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import click
+from flask import current_app, g, request
+from flask.cli import with_appcontext
+
+_counter = itertools.count(1)
+_counter_lock = threading.Lock()
+
+# Held while a request of this process is being profiled
+_profiling = threading.Lock()
+
+
+def profile_dir(app):
+    """Return the directory profiles are written to."""
+    return app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+
+def should_profile(app):
+    """Decide whether to profile the current request."""
+    header = app.config['PROFILE_HEADER']
+    if header and request.headers.get(header):
+        return True
+
+    pattern = app.config['PROFILE_ENDPOINTS']
+    if pattern and request.endpoint and re.search(pattern, request.endpoint):
+        return True
+
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate:
+        with _counter_lock:
+            return next(_counter) % rate == 0
+    return False
+
+
+def start_profile():
+    """``before_request`` hook starting the profiler for sampled requests."""
+    if not should_profile(current_app) or not _profiling.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool (a debugger, coverage) owns the hooks
+        _profiling.release()
+        return
+    g.profiler = profiler
+    g.profile_start = time.perf_counter()
+
+
+def _finish_profile():
+    """Stop the current request's profiler, if any, and return it."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiling.release()
+    return profiler
+
+
+def stop_profile(response):
+    """``after_request`` hook saving the profile of a sampled request."""
+    profiler = _finish_profile()
+    if profiler is None:
+        return response
+    latency_ms = (time.perf_counter() - g.pop('profile_start')) * 1000
+
+    directory = profile_dir(current_app)
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    endpoint = request.endpoint or 'unknown'
+    name = f'{now:%Y%m%dT%H%M%S%f}-{endpoint.replace(".", "_")}-{latency_ms:.0f}ms'
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+    with open(os.path.join(directory, f'{name}.json'), 'w') as f:
+        json.dump({
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(latency_ms, 3),
+            'timestamp': now.isoformat()
+        }, f)
+    return response
+
+
+def discard_profile(exc=None):
+    """``teardown_request`` hook releasing the profiler of a request that failed."""
+    _finish_profile()
+
+
+def load_profiles(directory, endpoint=None):
+    """Return ``[(prof_path, metadata)]`` for the profiles in a directory."""
+    profiles = []
+    if not os.path.isdir(directory):
+        return profiles
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.prof'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path[:-len('.prof')] + '.json') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if endpoint and not re.search(endpoint, meta.get('endpoint', '')):
+            continue
+        profiles.append((path, meta))
+    return profiles
+
+
+def summarize(profiles, limit=20, sort='tottime'):
+    """Return a text report of the hottest functions across profiles."""
+    out = io.StringIO()
+    by_endpoint = {}
+    for _, meta in profiles:
+        latencies = by_endpoint.setdefault(meta.get('endpoint', 'unknown'), [])
+        latencies.append(meta.get('latency_ms', 0))
+
+    out.write(f'{len(profiles)} profile(s)\n')
+    for endpoint, latencies in sorted(by_endpoint.items()):
+        latencies.sort()
+        out.write(f'  {endpoint}: {len(latencies)} request(s), '
+                  f'median {latencies[len(latencies) // 2]:.1f} ms, '
+                  f'max {latencies[-1]:.1f} ms\n')
+    out.write('\n')
+
+    stats = pstats.Stats(*[path for path, _ in profiles], stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+@click.command()
+@click.option('--limit', default=20, help='Number of functions to show.')
+@click.option('--sort', default='tottime',
+              type=click.Choice(['tottime', 'cumulative', 'ncalls']),
+              help='Sort order for functions.')
+@click.option('--endpoint', default=None,
+              help='Only include endpoints matching this pattern.')
+@with_appcontext
+def profile_summary_command(limit, sort, endpoint):
+    """Summarize the hottest functions across collected request profiles."""
+    profiles = load_profiles(profile_dir(current_app), endpoint)
+    if not profiles:
+        click.echo('No profiles found.')
+        return
+    click.echo(summarize(profiles, limit, sort))
+
+
+def init_app(app):
+    """Register the profiling hooks and summary command."""
+    app.cli.add_command(profile_summary_command, name='profile-summary')
+    if app.config['PROFILE_ENABLED']:
+        app.before_request(start_profile)
+        app.after_request(stop_profile)
+        app.teardown_request(discard_profile)
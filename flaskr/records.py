@@ -0,0 +1,105 @@
+"""Read-only member records for GET endpoints.
+
+Page and API reads only display members, so instead of hydrating full
+``Member`` objects (identity map entries, attribute instrumentation and
+change tracking) they select the needed columns into
+:class:`MemberRecord`, a slotted named tuple with the same read interface
+(``full_name``, ``position``, ``to_dict()``) that templates use.
+(Positions are already served from :mod:`flaskr.positions` as named
+tuples.) The statements are prebuilt in :mod:`flaskr.statements`.
+
+The queries bypass the request's session: they run on their own pooled
+connection, outside its transaction and identity map, so nothing is
+flushed or tracked. The connection is read-only (``postgresql_readonly``
+on PostgreSQL, ``PRAGMA query_only`` on SQLite). Reads therefore see
+committed data only, never the session's pending changes.
+"""
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .db import get_engine
+from .positions import get_registry
+from .statements import (ACTIVE_MEMBERS, ALL_MEMBERS, CHECKED_IN_MEMBERS, MEMBER_BY_ID,
+                         MEMBER_BY_IDHASH, MEMBER_COLUMNS)
+
+
+class MemberRecord(namedtuple('MemberRecord', MEMBER_COLUMNS)):
+    """An immutable snapshot of a member row."""
+
+    __slots__ = ()
+
+    @property
+    def full_name(self):
+        """Return the full name of the member."""
+        return f'{self.first_name} {self.last_name}'
+
+    @property
+    def position(self):
+        """Return the position name."""
+        return get_registry().name_of(self.position_id)
+
+    def to_dict(self):
+        """Convert to the same dictionary as ``Member.to_dict()``."""
+        return {
+            'id': self.id,
+            'first_name': self.first_name,
+            'last_name': self.last_name,
+            'full_name': self.full_name,
+            'idhash': self.idhash,
+            'position': self.position,
+            'position_id': self.position_id,
+            'active': self.active,
+            'checked_in': self.checked_in,
+            'last_updated': self.last_updated.isoformat() if self.last_updated else None
+        }
+
+
+@contextmanager
+def read_only_connection():
+    """Yield a connection of the current team's engine that refuses writes."""
+    engine = get_engine()
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            yield conn.execution_options(postgresql_readonly=True)
+        elif engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql('PRAGMA query_only = ON')
+            try:
+                yield conn
+            finally:
+                # The connection goes back to the pool (or is shared, in memory)
+                conn.exec_driver_sql('PRAGMA query_only = OFF')
+        else:
+            yield conn
+
+
+def _records(stmt, **params):
+    with read_only_connection() as conn:
+        return [MemberRecord._make(row) for row in conn.execute(stmt, params)]
+
+
+def all_members():
+    """Return records of all members, in id order."""
+    return _records(ALL_MEMBERS)
+
+
+def active_members():
+    """Return records of active members, in id order."""
+    return _records(ACTIVE_MEMBERS)
+
+
+def checked_in_members():
+    """Return records of active members who are checked in, in id order."""
+    return _records(CHECKED_IN_MEMBERS)
+
+
+def member_record(member_id):
+    """Return the record of one member, or None."""
+    records = _records(MEMBER_BY_ID, member_id=member_id)
+    return records[0] if records else None
+
+
+def member_by_idhash(idhash):
+    """Return the record of the member with ``idhash``, or None."""
+    records = _records(MEMBER_BY_IDHASH, idhash=idhash)
+    return records[0] if records else None
@@ -0,0 +1,217 @@
+"""Bulk roster changes: many member updates in one transaction.
+
+A change is a mapping with the member ``id`` and any of the fields in
+:data:`FIELDS`, e.g. ``{"id": 7, "active": false}``. :func:`bulk_update`
+validates a whole batch with a handful of set-based queries, so the cost
+does not grow with one lookup per member. It then applies the batch with a
+single bulk ``UPDATE`` and one commit. Either every change is applied
+or none is.
+
+An ``idhash`` may only be moved to a member when no other member holds it
+now, so swapping two badges takes two batches.
+
+Used by ``PATCH /api/members`` and ``flask update-members FILE`` (JSON or
+CSV).
+"""
+
+import csv
+import json
+from datetime import datetime, timezone
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from .cli import for_each_team, team_echo, team_options
+from .db import db
+from .dialects import bulk_update_by_id
+from .models import Member, Position
+from . import coherence, presence
+from .writes import run_write
+
+# Editable fields and their types
+FIELDS = {
+    'first_name': str,
+    'last_name': str,
+    'idhash': int,
+    'position_id': int,
+    'active': bool,
+}
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+
+
+class RosterError(ValueError):
+    """A batch of changes failed validation; ``errors`` lists the problems."""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid change(s)')
+        self.errors = errors
+
+
+def _has_type(value, kind):
+    # bool is a subclass of int, but ``"idhash": true`` is not an idhash
+    if kind is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, kind)
+
+
+def validate(changes):
+    """Check a batch of changes, raising :class:`RosterError` listing every problem."""
+    errors = []
+
+    def error(index, message):
+        errors.append({'index': index, 'error': message})
+
+    if not isinstance(changes, list):
+        raise RosterError([{'index': None, 'error': 'expected a list of changes'}])
+
+    by_id = {}
+    for index, change in enumerate(changes):
+        if not isinstance(change, dict) or not _has_type(change.get('id'), int):
+            error(index, 'each change needs an integer "id"')
+            continue
+        unknown = sorted(set(change) - set(FIELDS) - {'id'})
+        if unknown:
+            error(index, f'unknown field(s): {", ".join(unknown)}')
+        for field, kind in FIELDS.items():
+            if field in change and not _has_type(change[field], kind):
+                error(index, f'{field} must be {kind.__name__}')
+        for field in ('first_name', 'last_name'):
+            if isinstance(change.get(field), str) and not change[field].strip():
+                error(index, f'{field} cannot be empty')
+        if change['id'] in by_id:
+            error(index, f'member {change["id"]} is changed more than once')
+        by_id[change['id']] = index
+
+    if errors:
+        raise RosterError(errors)
+
+    # Every member exists (one query)
+    found = set(db.session.execute(
+        select(Member.id).where(Member.id.in_(list(by_id)))
+    ).scalars())
+    for member_id in sorted(set(by_id) - found):
+        error(by_id[member_id], f'member {member_id} does not exist')
+
+    # Every position exists (one query)
+    wanted = {change['position_id'] for change in changes if 'position_id' in change}
+    if wanted:
+        positions = set(db.session.execute(
+            select(Position.id).where(Position.id.in_(list(wanted)))
+        ).scalars())
+        for index, change in enumerate(changes):
+            if change.get('position_id') in wanted - positions:
+                error(index, f'position {change["position_id"]} does not exist')
+
+    # Idhashes are unique within the batch and not held by anyone else (one query)
+    claims = {}
+    for index, change in enumerate(changes):
+        if 'idhash' in change:
+            if change['idhash'] in claims:
+                error(index, f'idhash {change["idhash"]} is used twice in this batch')
+            claims.setdefault(change['idhash'], change['id'])
+    if claims:
+        holders = db.session.execute(
+            select(Member.idhash, Member.id).where(Member.idhash.in_(list(claims)))
+        )
+        for idhash, holder in holders:
+            if holder != claims[idhash]:
+                error(by_id[claims[idhash]],
+                      f'idhash {idhash} already belongs to member {holder}')
+
+    if errors:
+        errors.sort(key=lambda item: item['index'])
+        raise RosterError(errors)
+
+
+def bulk_update(changes):
+    """Validate and apply a batch of member changes atomically. Returns the count."""
+    if changes == []:
+        return 0
+
+    def apply():
+        validate(changes)
+        now = datetime.now(timezone.utc)
+        bulk_update_by_id(db.session, Member, [
+            {**change, 'last_updated': now} for change in changes
+        ])
+
+        # Publish to the presence snapshot (its version also keys the status names)
+        for change in changes:
+            presence.stage(db.session, change['id'])
+        if any('idhash' in change or 'active' in change for change in changes):
+            coherence.touch(db.session, 'members')
+        db.session.commit()
+        return len(changes)
+
+    try:
+        return run_write(apply)
+    except RosterError:
+        db.session.rollback()
+        raise
+
+
+def _parse_cell(field, value):
+    if FIELDS[field] is bool:
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise ValueError(f'{field} must be true or false')
+    if FIELDS[field] is int:
+        return int(value)
+    return value
+
+
+def read_changes(file, filename):
+    """Read changes from a JSON list or a CSV file with an ``id`` column.
+
+    Empty CSV cells leave a field unchanged.
+    """
+    if filename.endswith('.json'):
+        return json.load(file)
+
+    changes = []
+    for line, row in enumerate(csv.DictReader(file), start=2):
+        try:
+            change = {'id': int(row.pop('id'))}
+            for field, value in row.items():
+                if value is None or value.strip() == '':
+                    continue
+                if field not in FIELDS:
+                    raise ValueError(f'unknown column: {field}')
+                change[field] = _parse_cell(field, value.strip())
+        except (KeyError, TypeError, ValueError) as exc:
+            raise click.ClickException(f'{filename}, line {line}: {exc}')
+        changes.append(change)
+    return changes
+
+
+@click.command()
+@click.argument('file', type=click.File('r'))
+@click.option('--dry-run', is_flag=True,
+              help='Validate the changes without applying them.')
+@team_options
+@with_appcontext
+def update_members_command(file, dry_run, team, all_teams):
+    """Apply member changes from a JSON or CSV FILE in one transaction."""
+    changes = read_changes(file, file.name)
+    for name in for_each_team(team, all_teams):
+        try:
+            if dry_run:
+                validate(changes)
+                team_echo(name, f'{len(changes)} change(s) are valid.')
+            else:
+                team_echo(name, f'Updated {bulk_update(changes)} member(s).')
+        except RosterError as exc:
+            for item in exc.errors:
+                where = f'change {item["index"]}: ' if item['index'] is not None else ''
+                team_echo(name, f'{where}{item["error"]}')
+            raise click.ClickException(str(exc))
+
+
+def init_app(app):
+    """Register the bulk update command."""
+    app.cli.add_command(update_members_command, name='update-members')
@@ -1,9 +1,20 @@
 """Routes for the Spartan Teamlog application."""
 
 from datetime import datetime, timezone
-from flask import Blueprint, render_template, jsonify, request, redirect, url_for, flash
+from flask import (Blueprint, abort, current_app, render_template, jsonify, request,
+                   redirect, url_for, flash)
 from .models import Member, Position
 from .db import db
+from .badges import get_filter
+from .cache import TTLCache
+from .idempotency import idempotent
+from .metrics import get_metrics, incr
+from .positions import get_registry
+from .presence import get_snapshot, status_json
+from .records import active_members, all_members, member_by_idhash, member_record
+from .teams import current_team
+from .writes import run_write
+from . import analytics, archive, history, occupancy, roster, scans
 
 # Create blueprint
 main = Blueprint('main', __name__)
@@ -12,22 +23,13 @@ main = Blueprint('main', __name__)
 @main.route('/')
 def index():
     """Main page showing member list and attendance status."""
-    all_members = Member.query.all()
-    active_members = [m for m in all_members if m.active]
-    checked_in_members = [m for m in active_members if m.checked_in]
+    members = active_members()
     
-    checked_in_count = len(checked_in_members)
-    total_active = len(active_members)
-    total_members = len(all_members)
-    
-    attendance_summary = {
-        'checked_in': checked_in_count,
-        'total_active': total_active,
-        'total_members': total_members
-    }
+    # Counts come from the shared presence snapshot rather than the database
+    attendance_summary = get_snapshot().summary()
     
     return render_template('index.html',
-                         members=active_members,
+                         members=members,
                          attendance_summary=attendance_summary,
                          show_quick_checkin=True)
 
@@ -35,8 +37,8 @@ def index():
 @main.route('/members')
 def list_members():
     """List all members with check-in/out actions."""
-    members = Member.query.all()
-    positions = Position.query.all()
+    members = all_members()
+    positions = get_registry().all()
     
     return render_template('members.html', members=members, positions=positions)
 
@@ -51,7 +53,7 @@ def add_member():
     
     if first_name and last_name and idhash and position_id:
         # Check if idhash already exists
-        existing_member = Member.query.filter_by(idhash=int(idhash)).first()
+        existing_member = member_by_idhash(int(idhash))
         if existing_member:
             flash(f'ID Hash {idhash} already exists for {existing_member.full_name}', 'error')
         else:
@@ -61,8 +63,12 @@ def add_member():
                 idhash=int(idhash),
                 position_id=int(position_id)
             )
-            db.session.add(member)
-            db.session.commit()
+            
+            def save():
+                db.session.add(member)
+                db.session.commit()
+            
+            run_write(save)
             flash(f'Successfully added {first_name} {last_name}', 'success')
     else:
         flash('All fields are required', 'error')
@@ -74,7 +80,7 @@ def add_member():
 def edit_member(member_id):
     """Show edit form for a member."""
     member = Member.query.get_or_404(member_id)
-    positions = Position.query.all()
+    positions = get_registry().all()
     
     return render_template('edit_member.html', member=member, positions=positions)
     
@@ -134,14 +140,16 @@ def update_member(member_id):
             flash(f'ID Hash {idhash} already exists for {existing_member.full_name}', 'error')
             return redirect(url_for('main.edit_member', member_id=member_id))
         
-        member.first_name = first_name
-        member.last_name = last_name
-        member.idhash = int(idhash)
-        member.position_id = int(position_id)
-        member.active = active
-        member.last_updated = datetime.now(timezone.utc)
+        def save():
+            member.first_name = first_name
+            member.last_name = last_name
+            member.idhash = int(idhash)
+            member.position_id = int(position_id)
+            member.active = active
+            member.last_updated = datetime.now(timezone.utc)
+            db.session.commit()
         
-        db.session.commit()
+        run_write(save)
         flash(f'Successfully updated {member.full_name}', 'success')
     else:
         flash('All fields are required', 'error')
@@ -156,25 +164,23 @@ def delete_member(member_id):
     member = Member.query.get_or_404(member_id)
     member_name = member.full_name
     
-    db.session.delete(member)
-    db.session.commit()
+    def delete():
+        db.session.delete(member)
+        db.session.commit()
+    
+    run_write(delete)
     
     flash(f'Successfully deleted {member_name}', 'success')
     return redirect(url_for('main.list_members'))
 
 
 @main.route('/members/checkout-all')
+@idempotent
 def checkout_all_members():
     """Check out all currently checked-in members."""
-    checked_in_members = Member.query.filter_by(checked_in=True, active=True).all()
-    checkout_count = 0
-    
-    for member in checked_in_members:
-        member.check_out()
-        checkout_count += 1
+    checkout_count = Member.check_out_all()
     
     if checkout_count > 0:
-        db.session.commit()
         flash(f'Successfully checked out {checkout_count} member(s).', 'success')
     else:
         flash('No members were checked in.', 'info')
@@ -183,6 +189,7 @@ def checkout_all_members():
 
 
 @main.route('/quick-checkin', methods=['POST'])
+@idempotent
 def quick_checkin():
     """Quick check-in by member name or idhash from titlebar form."""
     member_input = request.form.get('member_name', '').strip()
@@ -191,20 +198,41 @@ def quick_checkin():
     if member_input:
         # Check if input is numeric (potential idhash)
         if member_input.isdigit():
-            # Search by idhash
-            member = Member.query.filter_by(
-                idhash=int(member_input),
-                active=True
-            ).first()
+            # Misreads and visitor badges are rejected from memory
+            badges = get_filter()
+            if badges is not None and not badges.admits(int(member_input)):
+                print(f"No active member found with idhash: {member_input}")
+                return redirect(url_for('main.index'))
             
-            if member:
-                if not member.checked_in:
-                    member.check_in()
-                    print(f"Checked in member by idhash: {member.full_name} ({member.idhash})")
+            # Badge readers often repeat a scan; answer repeats without the database
+            debounce = current_app.extensions['scan_debounce']
+            scan = (current_team(), int(member_input))
+            if debounce is not None and not debounce.add(scan, True):
+                incr('quick_checkin.suppressed_scans')
+                return redirect(url_for('main.index'))
+            
+            # Check in by idhash with a single conditional UPDATE; a scan that
+            # checked no one in must not suppress the rescan
+            try:
+                result = Member.check_in_by_idhash(int(member_input))
+            except Exception:
+                if debounce is not None:
+                    debounce.pop(scan)
+                raise
+            if not result and debounce is not None:
+                debounce.pop(scan)
+            
+            if result:
+                if result.changed:
+                    print(f"Checked in member by idhash: "
+                          f"{result.full_name} ({member_input})")
                 else:
-                    print(f"Member already checked in: {member.full_name} ({member.idhash})")
+                    print(f"Member already checked in: "
+                          f"{result.full_name} ({member_input})")
                 return redirect(url_for('main.index'))
             else:
+                if badges is not None:
+                    incr('badge_filter.false_positives')
                 print(f"No active member found with idhash: {member_input}")
                 return redirect(url_for('main.index'))
         else:
@@ -240,18 +268,20 @@ def quick_checkin():
 
 
 @main.route('/members/<int:member_id>/checkin')
+@idempotent
 def checkin_member(member_id):
     """Check in a member."""
-    member = Member.query.get_or_404(member_id)
-    member.check_in()
+    if Member.check_in_by_id(member_id) is None:
+        abort(404)
     return redirect(url_for('main.index'))
 
 
 @main.route('/members/<int:member_id>/checkout')
+@idempotent
 def checkout_member(member_id):
     """Check out a member."""
-    member = Member.query.get_or_404(member_id)
-    member.check_out()
+    if Member.check_out_by_id(member_id) is None:
+        abort(404)
     return redirect(url_for('main.index'))
 
 
@@ -259,8 +289,12 @@ def checkout_member(member_id):
 def activate_member(member_id):
     """Activate a member."""
     member = Member.query.get_or_404(member_id)
-    member.active = True
-    db.session.commit()
+    
+    def activate():
+        member.active = True
+        db.session.commit()
+    
+    run_write(activate)
     return redirect(url_for('main.list_members'))
 
 
@@ -268,8 +302,12 @@ def activate_member(member_id):
 def deactivate_member(member_id):
     """Deactivate a member."""
     member = Member.query.get_or_404(member_id)
-    member.active = False
-    db.session.commit()
+    
+    def deactivate():
+        member.active = False
+        db.session.commit()
+    
+    run_write(deactivate)
     return redirect(url_for('main.list_members'))
 
 
@@ -277,7 +315,8 @@ def deactivate_member(member_id):
 @main.route('/positions')
 def list_positions():
     """List all available positions."""
-    positions = Position.query.all()
+    positions = get_registry().all()
+    member_counts = Position.member_counts()
     
     return f"""
     <h1>Position Management</h1>
@@ -290,7 +329,7 @@ def list_positions():
             <th>Description</th>
             <th>Member Count</th>
         </tr>
-        {''.join([f'<tr><td><strong>{pos.name.title()}</strong></td><td>{pos.description or "No description"}</td><td>{len(pos.members)} members</td></tr>' for pos in positions])}
+        {''.join([f'<tr><td><strong>{pos.name.title()}</strong></td><td>{pos.description or "No description"}</td><td>{member_counts.get(pos.id, 0)} members</td></tr>' for pos in positions])}
     </table>
     """
 
@@ -299,24 +338,144 @@ def list_positions():
 @main.route('/api/members')
 def api_members():
     """API endpoint to get all members as JSON."""
-    members = Member.query.all()
-    return jsonify([member.to_dict() for member in members])
+    return jsonify([member.to_dict() for member in all_members()])
+
+
+@main.route('/api/members', methods=['PATCH'])
+def api_update_members():
+    """API endpoint applying a list of member changes in one transaction."""
+    try:
+        updated = roster.bulk_update(request.get_json(silent=True))
+    except roster.RosterError as exc:
+        return jsonify({'errors': exc.errors}), 400
+    return jsonify({'updated': updated})
+
+
+@main.route('/api/scans', methods=['POST'])
+@idempotent
+def api_scans():
+    """API endpoint checking in a batch of badge scans from a kiosk."""
+    payload = request.get_json(silent=True)
+    try:
+        batch = payload.get('scans') if isinstance(payload, dict) else None
+        results = scans.record_scans(batch)
+    except scans.ScanError as exc:
+        return jsonify({'errors': exc.errors}), 400
+    return jsonify({'results': results})
 
 
 @main.route('/api/positions')
 def api_positions():
     """API endpoint to get all positions as JSON."""
-    positions = Position.query.all()
-    return jsonify([{'id': p.id, 'name': p.name, 'description': p.description, 'member_count': len(p.members)} for p in positions])
+    positions = get_registry().all()
+    member_counts = Position.member_counts()
+    return jsonify([{'id': p.id, 'name': p.name, 'description': p.description,
+                     'member_count': member_counts.get(p.id, 0)} for p in positions])
+
+
+@main.route('/api/status')
+def api_status():
+    """API endpoint with attendance counts and who is here, for polling displays."""
+    version, body = status_json()
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(f'{current_team() or "default"}-{version}')
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 @main.route('/api/members/<int:member_id>')
 def api_member(member_id):
     """API endpoint to get a specific member."""
-    member = Member.query.get_or_404(member_id)
+    member = member_record(member_id)
+    if member is None:
+        abort(404)
     return jsonify(member.to_dict())
 
 
+@main.route('/api/seasons/<int:season>/attendance')
+def api_season_attendance(season):
+    """API endpoint for per-member attendance statistics over a season."""
+    stats = history.season_stats(season)
+    stats['meeting_dates'] = [day.isoformat() for day in history.meeting_dates(season)]
+    return jsonify(stats)
+
+
+@main.route('/api/seasons/<int:season>/co-attendance/<int:member_id>')
+def api_co_attendance(season, member_id):
+    """API endpoint for how often a member attended alongside each other member."""
+    Member.query.get_or_404(member_id)
+    shared = history.co_attendance(member_id, season)
+    return jsonify([{'member_id': other, 'shared_meetings': count}
+                    for other, count in sorted(shared.items())])
+
+
+def _report_range(required=True):
+    """Return the naive UTC ``(start, end)`` from the query string, or None if invalid.
+
+    When ``required`` is False and neither date is given, the current season is used.
+    """
+    if not required and 'start' not in request.args and 'end' not in request.args:
+        return analytics.current_season_range()
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+        end = datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        return None
+    # Stored timestamps are naive UTC
+    return analytics.naive_utc(start), analytics.naive_utc(end)
+
+
+@main.route('/api/reports/visits')
+def api_report_visits():
+    """API endpoint listing visits between two dates, including archived seasons."""
+    date_range = _report_range()
+    if date_range is None:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    
+    visits = archive.load_visits(*date_range)
+    return jsonify([{
+        'member_id': member_id,
+        'checked_in_at': checked_in_at.isoformat(),
+        'checked_out_at': checked_out_at.isoformat() if checked_out_at else None,
+        'auto_checkout': auto_checkout
+    } for member_id, checked_in_at, checked_out_at, auto_checkout in visits])
+
+
+@main.route('/api/reports/<any(members, positions, weeks):kind>')
+def api_report(kind):
+    """API endpoint for the aggregate attendance reports (default: current season)."""
+    date_range = _report_range(required=False)
+    if date_range is None:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
+    try:
+        rows = analytics.build_report(kind, *date_range)
+    except analytics.AnalyticsUnavailable as exc:
+        return jsonify({'error': str(exc)}), 501
+    return jsonify({
+        'start': date_range[0].isoformat(),
+        'end': date_range[1].isoformat(),
+        kind: rows
+    })
+
+
+@main.route('/api/reports/occupancy')
+def api_report_occupancy():
+    """API endpoint with arrivals and person-hours by weekday and hour."""
+    return jsonify(occupancy.occupancy_grid())
+
+
+@main.route('/api/metrics')
+def api_metrics():
+    """API endpoint exposing this worker's operational counters."""
+    return jsonify(get_metrics().snapshot())
+
+
 def init_app(app):
     """Register the blueprint with the Flask app."""
-    app.register_blueprint(main)
\ No newline at end of file
+    app.register_blueprint(main)
+    
+    window = app.config['CHECKIN_DEBOUNCE_SECONDS']
+    app.extensions['scan_debounce'] = (
+        TTLCache(maxsize=app.config['CHECKIN_DEBOUNCE_SIZE'], ttl=window)
+        if window else None
+    )
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Batched badge scans from kiosks.
+
+Kiosks (see :mod:`flaskr.kiosk`) buffer scans locally and send them in
+batches to ``POST /api/scans``::
+
+    {"scans": [{"idhash": 12345, "scanned_at": "2025-01-07T18:02:11+00:00"}, ...]}
+
+All scans of a batch are checked in with one conditional ``UPDATE`` and
+one commit, each at the time it was scanned, so a batch that was held back
+by an outage still records when people arrived. Scans without
+``scanned_at`` (or with a time in the future) count as arriving now. Scans
+older than ``SCAN_MAX_AGE`` seconds are not applied. If an idhash is
+scanned more than once in a batch, its earliest scan counts.
+
+The response lists one result per scan, in order: ``checked_in``,
+``already_checked_in``, ``unknown`` (no active member has the idhash) or
+``expired``. Kiosks send an ``Idempotency-Key`` per batch, so a batch
+retried after a lost response is not applied twice.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+from .metrics import incr
+from .models import Member
+
+
+class ScanError(ValueError):
+    """A batch of scans failed validation; ``errors`` lists the problems."""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} invalid scan(s)')
+        self.errors = errors
+
+
+def parse_time(value):
+    """Parse an ISO 8601 timestamp to an aware UTC datetime (naive values are UTC)."""
+    # fromisoformat() only accepts a trailing "Z" from Python 3.11
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    at = datetime.fromisoformat(value)
+    if at.tzinfo is None:
+        return at.replace(tzinfo=timezone.utc)
+    return at.astimezone(timezone.utc)
+
+
+def validate(scans):
+    """Check the shape of a batch. Returns ``[(idhash, scanned_at or None)]``."""
+    if not isinstance(scans, list):
+        raise ScanError([{'index': None, 'error': 'expected a list of scans'}])
+    limit = current_app.config['SCAN_BATCH_MAX']
+    if len(scans) > limit:
+        raise ScanError([{'index': None, 'error': f'at most {limit} scans per batch',
+                          'limit': limit}])
+
+    parsed = []
+    errors = []
+    for index, scan in enumerate(scans):
+        if not isinstance(scan, dict):
+            errors.append({'index': index, 'error': 'expected an object'})
+            continue
+        idhash = scan.get('idhash')
+        if not isinstance(idhash, int) or isinstance(idhash, bool):
+            errors.append({'index': index, 'error': 'idhash must be an integer'})
+            continue
+        scanned_at = scan.get('scanned_at')
+        if scanned_at is not None:
+            try:
+                scanned_at = parse_time(scanned_at)
+            except (TypeError, ValueError, AttributeError):
+                errors.append({'index': index,
+                               'error': 'scanned_at must be an ISO 8601 timestamp'})
+                continue
+        parsed.append((idhash, scanned_at))
+    if errors:
+        raise ScanError(errors)
+    return parsed
+
+
+def record_scans(scans):
+    """Validate and apply a batch of scans. Returns one result dict per scan."""
+    parsed = validate(scans)
+    now = datetime.now(timezone.utc)
+    oldest = now - timedelta(seconds=current_app.config['SCAN_MAX_AGE'])
+
+    times = [min(scanned_at or now, now) for idhash, scanned_at in parsed]
+    arrivals = {}
+    for (idhash, _), at in zip(parsed, times):
+        if at >= oldest and (idhash not in arrivals or at < arrivals[idhash]):
+            arrivals[idhash] = at
+    changes = Member.check_in_by_idhashes(arrivals) if arrivals else {}
+
+    results = []
+    reported = set()
+    for (idhash, _), at in zip(parsed, times):
+        change = changes.get(idhash)
+        if at < oldest:
+            status = 'expired'
+        elif change is None:
+            status = 'unknown'
+        elif change.changed and idhash not in reported:
+            status = 'checked_in'
+            reported.add(idhash)
+        else:
+            status = 'already_checked_in'
+        result = {'idhash': idhash, 'status': status}
+        if change is not None:
+            result['name'] = change.full_name
+        results.append(result)
+        incr(f'scans.{status}')
+    return results
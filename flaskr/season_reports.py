@@ -0,0 +1,289 @@
+"""End-of-season report generation (``flask reports build``).
+
+For every selected team and season the visit history, live and archived,
+is split into monthly ranges. A process pool works through the ranges in
+parallel: each worker opens its own read-only connection, loads its
+visits as :class:`analytics.Intervals` and sums them per member with
+:func:`analytics.member_totals`. The parent merges the partial totals of
+each season and formats them with :func:`analytics.stats_from_totals`,
+the same code as ``flask reports show``. It then writes, per team and
+season::
+
+    <REPORTS_DIR>/<team>/season-<season>/
+        summary.json        totals and one entry per member
+        summary.csv         the same, one row per member
+        members/<id>.txt    printable summary for school records
+
+``season-<season>`` is a symlink to a versioned directory. A rebuild
+writes a new version and then swaps the link atomically, so readers see
+either the old report or the new one, never a half-written or missing
+one. The previous version is kept until the next rebuild, for readers
+still holding its files. In-memory databases cannot be shared with other
+processes and are aggregated in the current process.
+"""
+
+import csv
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from .analytics import (
+    AnalyticsUnavailable, Intervals, member_totals, merge_member_totals, np,
+    reports_cli, require_numpy, stats_from_totals,
+)
+from .archive import archive_dir, archived_visits, read_index, season_bounds
+from .cli import select_teams, team_echo, team_options
+from .db import db, get_engine
+from .models import Attendance, AttendanceBitmap, Member
+from .positions import get_registry
+from .teams import team_context
+
+
+def reports_dir(app=None):
+    """Return the directory reports are written to."""
+    app = app or current_app
+    return app.config.get('REPORTS_DIR') or os.path.join(app.instance_path, 'reports')
+
+
+def month_ranges(start, end):
+    """Split ``[start, end)`` at the first of each month."""
+    ranges = []
+    while start < end:
+        month = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        stop = min(datetime.combine(month, datetime.min.time()), end)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def load_intervals(connection, directory, start, end, now):
+    """Return the :class:`Intervals` of live and archived visits in ``[start, end)``."""
+    table = Attendance.__table__
+    rows = connection.execute(
+        select(table.c.member_id, table.c.checked_in_at, table.c.checked_out_at)
+        .where(table.c.checked_in_at >= start, table.c.checked_in_at < end)
+    )
+    visits = [tuple(row) for row in rows]
+    visits.extend(archived_visits(start, end, directory))
+    return Intervals(start, end, now, visits=visits)
+
+
+def read_only_engine(url):
+    """Create a single-connection engine that cannot write to the database."""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return create_engine(f'sqlite:///file:{url.database}?mode=ro&uri=true',
+                             poolclass=NullPool)
+    return create_engine(url, poolclass=NullPool,
+                         execution_options={'postgresql_readonly': True})
+
+
+def _totals_in_worker(url, directory, start, end, now):
+    """Process pool entry point: sum one range per member on a private connection."""
+    engine = read_only_engine(url)
+    try:
+        with engine.connect() as connection:
+            return member_totals(load_intervals(connection, directory, start, end, now))
+    finally:
+        engine.dispose()
+
+
+def seasons_with_visits():
+    """Return every season from the oldest recorded visit to the current one."""
+    current, _ = AttendanceBitmap.season_of(date.today())
+    first = db.session.query(db.func.min(Attendance.checked_in_at)).scalar()
+    seasons = {entry['season'] for entry in read_index(archive_dir())}
+    if first is not None:
+        seasons.add(AttendanceBitmap.season_of(first.date())[0])
+    return list(range(min(seasons), current + 1)) if seasons else []
+
+
+def season_report(team, season, totals):
+    """Build the report document for a team's season from its member totals."""
+    start, end = season_bounds(season)
+    registry = get_registry()
+    names = {row.id: row for row in db.session.query(
+        Member.id, Member.first_name, Member.last_name, Member.position_id
+    ).filter(Member.id.in_(totals.members.tolist()))}
+
+    members = []
+    for stats in stats_from_totals(totals):
+        member_id = stats.pop('member_id')
+        member = names.get(member_id)
+        members.append({
+            'member_id': member_id,
+            'name': (f'{member.first_name} {member.last_name}' if member
+                     else f'Member #{member_id}'),
+            'position': registry.name_of(member.position_id) if member else None,
+            **stats,
+        })
+
+    return {
+        'team': team,
+        'season': season,
+        'start': start.date().isoformat(),
+        'end': end.date().isoformat(),
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'meeting_days': len(np.unique(totals.member_days[1])),
+        'total_hours': round(sum(m['total_hours'] for m in members), 2),
+        'members': members,
+    }
+
+
+def printable_summary(report, member):
+    """Return the plain-text summary of one member's season."""
+    lines = [
+        'Spartan Teamlog - Attendance Summary',
+        '',
+        f"Member:            {member['name']}",
+        f"Position:          {member['position'] or '-'}",
+        f"Season:            {report['season']} ({report['start']} to {report['end']})",
+    ]
+    if report['team']:
+        lines.append(f"Team:              {report['team']}")
+    lines += [
+        f"Meetings attended: {member['meetings_attended']} of {report['meeting_days']}",
+        f"Visits:            {member['visits']}",
+        f"Total hours:       {member['total_hours']:.2f}",
+        f"Average visit:     {member['average_visit_hours']:.2f} hours",
+    ]
+    if member['percent_required'] is not None:
+        lines.append(f"Required hours:    {member['percent_required']:.1f}% complete")
+    lines += ['', f"Generated {report['generated_at']}"]
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(directory, report):
+    """Write a season report and point the ``directory`` symlink at it atomically."""
+    # Versions sort by creation time
+    version = f'{directory}.{time.time_ns():020d}'
+    tmp = f'{version}.tmp'
+    os.makedirs(os.path.join(tmp, 'members'))
+
+    with open(os.path.join(tmp, 'summary.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(os.path.join(tmp, 'summary.csv'), 'w', newline='') as f:
+        fields = ['member_id', 'name', 'position', 'total_hours', 'visits',
+                  'meetings_attended', 'average_visit_hours', 'percent_required']
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(report['members'])
+    for member in report['members']:
+        with open(os.path.join(tmp, 'members', f"{member['member_id']}.txt"), 'w') as f:
+            f.write(printable_summary(report, member))
+
+    os.rename(tmp, version)
+    if os.path.isdir(directory) and not os.path.islink(directory):
+        # A report written before reports were versioned
+        shutil.rmtree(directory)
+    link = f'{version}.link'
+    os.symlink(os.path.basename(version), link)
+    os.replace(link, directory)
+
+    # Keep the version just replaced for readers that still have it open
+    parent, name = os.path.split(directory)
+    prefix = f'{name}.'
+    versions = sorted(entry for entry in os.listdir(parent)
+                      if entry.startswith(prefix) and entry[len(prefix):].isdigit())
+    for old in versions[:-2]:
+        shutil.rmtree(os.path.join(parent, old), ignore_errors=True)
+
+
+def build_reports(teams, seasons=None, workers=None, output=None, progress=None):
+    """Build season reports for ``teams``. Returns ``[(team, season, path)]``.
+
+    ``progress(team, message)`` is called as ranges finish.
+    """
+    require_numpy()
+    progress = progress or (lambda team, message: None)
+    workers = workers or current_app.config.get('REPORTS_WORKERS') or os.cpu_count()
+    output = output or reports_dir()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # Plan: one task per team, season and month
+    plan = {}
+    for team in teams:
+        with team_context(team):
+            url = get_engine().url
+            # In-memory databases only exist inside this process
+            shared = (url.get_backend_name() != 'sqlite'
+                      or url.database not in (None, '', ':memory:'))
+            for season in seasons or seasons_with_visits():
+                plan[team, season] = (url.render_as_string(hide_password=False), shared,
+                                      archive_dir(),
+                                      month_ranges(*season_bounds(season)))
+
+    tasks = [(key, url, shared, directory, start, end)
+             for key, (url, shared, directory, ranges) in plan.items()
+             for start, end in ranges]
+    partials = {key: [] for key in plan}
+    done = 0
+
+    def finished(key, totals):
+        nonlocal done
+        done += 1
+        partials[key].append(totals)
+        progress(key[0], f'[{done}/{len(tasks)}] season {key[1]}: '
+                         f'{int(totals.visits.sum())} visit(s)')
+
+    parallel = [task for task in tasks if task[2]] if workers > 1 else []
+    if parallel:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_totals_in_worker, url, directory, start, end, now): key
+                for key, url, _, directory, start, end in parallel
+            }
+            for future in as_completed(futures):
+                finished(futures[future], future.result())
+
+    for key, _, shared, directory, start, end in tasks:
+        if parallel and shared:
+            continue
+        with team_context(key[0]), get_engine().connect() as connection:
+            intervals = load_intervals(connection, directory, start, end, now)
+            finished(key, member_totals(intervals))
+
+    written = []
+    for team, season in plan:
+        with team_context(team):
+            totals = merge_member_totals(partials[team, season])
+            report = season_report(team, season, totals)
+        path = os.path.join(output, team or 'default', f'season-{season}')
+        write_report(path, report)
+        written.append((team, season, path))
+    return written
+
+
+@click.command('build')
+@click.option('--season', 'seasons', type=int, multiple=True,
+              help='Season to build (repeatable; default: every season with visits).')
+@click.option('--workers', type=int, default=None,
+              help='Worker processes (default: REPORTS_WORKERS or the CPU count).')
+@click.option('--output', type=click.Path(file_okay=False), default=None,
+              help='Output directory (default: REPORTS_DIR or instance/reports).')
+@team_options
+@with_appcontext
+def build_reports_command(seasons, workers, output, team, all_teams):
+    """Build end-of-season reports per team, season and member."""
+    teams = select_teams(team, all_teams)
+    try:
+        written = build_reports(teams, list(seasons), workers, output, team_echo)
+    except AnalyticsUnavailable as exc:
+        raise click.ClickException(str(exc))
+    for name, season, path in written:
+        team_echo(name, f'Wrote season {season} report to {path}')
+
+
+def init_app(app):
+    """Add the build command to the reports group."""
+    reports_cli.add_command(build_reports_command)
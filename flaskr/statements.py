@@ -0,0 +1,126 @@
+"""Prebuilt statements for the request hot paths.
+
+Badge scans, the dashboard and the roster run the same few queries
+thousands of times per meeting. Building ``Member.query.filter_by(...)``
+or ``select(...).where(...)`` on every call and then deriving its cache
+key costs more than SQLite takes to run it. The statements here are built
+once, at import, with bound parameters. A call only supplies the values,
+and SQLAlchemy's compiled cache reuses the compiled SQL.
+
+``flask benchmark-queries`` measures the per-call cost of each statement
+against the equivalent statement built on every call.
+"""
+
+import timeit
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, bindparam, func, select, true, update
+
+from .db import db
+from .models import Member, Position
+
+members = Member.__table__
+positions = Position.__table__
+
+# Columns of a MemberRecord (see flaskr.records)
+MEMBER_COLUMNS = ('id', 'idhash', 'first_name', 'last_name', 'position_id', 'active',
+                  'checked_in', 'last_updated')
+_record_columns = tuple(members.c[name] for name in MEMBER_COLUMNS)
+
+ALL_MEMBERS = select(*_record_columns).order_by(members.c.id)
+ACTIVE_MEMBERS = select(*_record_columns).where(
+    members.c.active == true()
+).order_by(members.c.id)
+CHECKED_IN_MEMBERS = select(*_record_columns).where(
+    members.c.checked_in == true(), members.c.active == true()
+).order_by(members.c.id)
+MEMBER_BY_ID = select(*_record_columns).where(members.c.id == bindparam('member_id'))
+MEMBER_BY_IDHASH = select(*_record_columns).where(
+    members.c.idhash == bindparam('idhash'))
+ACTIVE_IDHASHES = select(members.c.idhash).where(
+    members.c.active == true()
+).order_by(members.c.idhash)
+
+POSITIONS = select(
+    positions.c.id, positions.c.name, positions.c.description
+).order_by(positions.c.id)
+MEMBER_COUNTS = select(
+    members.c.position_id, func.count(members.c.id)
+).group_by(members.c.position_id)
+
+# Conditional check-in/out (Member._set_checked_in). Parameters: ``key``
+# (member id or idhash), ``state`` (the new checked_in value) and ``now``.
+_state_columns = (members.c.id, members.c.first_name, members.c.last_name,
+                  members.c.active)
+_member_keys = {
+    'id': members.c.id == bindparam('key'),
+    # Badge scans only check in active members
+    'idhash': and_(members.c.idhash == bindparam('key'), members.c.active == true()),
+}
+_changes_state = members.c.checked_in != bindparam('state')
+_set_state = update(members).values(checked_in=bindparam('state'),
+                                    last_updated=bindparam('now'))
+
+SET_STATE_RETURNING = {
+    by: _set_state.where(key, _changes_state).returning(*_state_columns)
+    for by, key in _member_keys.items()
+}
+PENDING_STATE = {by: select(*_state_columns).where(key, _changes_state)
+                 for by, key in _member_keys.items()}
+CURRENT_STATE = {by: select(*_state_columns).where(key)
+                 for by, key in _member_keys.items()}
+SET_STATE_BY_ID = _set_state.where(_member_keys['id'], _changes_state)
+
+
+def _per_call(func, number):
+    func()
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def benchmark(number=2000):
+    """Return ``[(query, built_us, prebuilt_us)]`` per-call timings in microseconds."""
+    session = db.session
+    idhash = session.execute(select(members.c.idhash).limit(1)).scalar() or 0
+    cases = [
+        ('idhash lookup',
+         lambda: Member.query.filter_by(idhash=idhash).first(),
+         lambda: session.execute(MEMBER_BY_IDHASH, {'idhash': idhash}).first()),
+        ('active members',
+         lambda: session.execute(select(*_record_columns).where(
+             members.c.active == true()
+         ).order_by(members.c.id)).all(),
+         lambda: session.execute(ACTIVE_MEMBERS).all()),
+        ('checked-in members',
+         lambda: session.execute(select(*_record_columns).where(
+             members.c.checked_in == true(), members.c.active == true()
+         ).order_by(members.c.id)).all(),
+         lambda: session.execute(CHECKED_IN_MEMBERS).all()),
+        ('positions',
+         lambda: session.execute(select(
+             Position.id, Position.name, Position.description
+         ).order_by(Position.id)).all(),
+         lambda: session.execute(POSITIONS).all()),
+    ]
+    results = []
+    for name, built, prebuilt in cases:
+        with session.no_autoflush:
+            results.append((name, _per_call(built, number),
+                            _per_call(prebuilt, number)))
+        session.expunge_all()
+    return results
+
+
+@click.command()
+@click.option('--number', default=2000, help='Calls per measurement.')
+@with_appcontext
+def benchmark_queries_command(number):
+    """Compare per-call overhead of prebuilt and freshly built hot-path queries."""
+    click.echo(f'{"query":<20}{"built":>12}{"prebuilt":>12}')
+    for name, built, prebuilt in benchmark(number):
+        click.echo(f'{name:<20}{built:>10.1f}us{prebuilt:>10.1f}us')
+
+
+def init_app(app):
+    """Register the benchmark command."""
+    app.cli.add_command(benchmark_queries_command, name='benchmark-queries')
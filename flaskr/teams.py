@@ -0,0 +1,124 @@
+"""Team-scoped database routing for multi-team deployments.
+
+Each team listed in the ``TEAMS`` config gets its own database, registered
+as a SQLAlchemy bind (and therefore its own engine and connection pool).
+The team for a request is picked from an explicit ``TEAM_HOSTS`` host
+mapping or from the first label of the host name
+(``997.teamlog.example.org``). Requests that do not name a team use the
+default database, so single-team deployments are unaffected.
+
+The ``X-Team`` header is client-controlled, so it is only honoured when
+``TEAM_HEADER_ENABLED`` is set, e.g. for kiosks on a private network that
+all talk to one host name. Otherwise any client could reach another
+team's database from its own team's host.
+"""
+
+import os
+from contextlib import contextmanager
+
+from flask import abort, current_app, g, has_app_context, request
+
+from .db import db, team_bind_key
+
+TEAM_HEADER = 'X-Team'
+
+
+def configure_binds(app):
+    """Register a SQLAlchemy bind for every configured team.
+
+    ``TEAMS`` may be a list of team names or a mapping of team name to
+    database URI. Teams without a URI get their own SQLite file under
+    ``instance/teams/``. Raises ValueError if ``TEAM_HOSTS`` maps a host
+    to a team that is not configured.
+    """
+    teams = app.config.get('TEAMS') or {}
+    if not isinstance(teams, dict):
+        teams = {team: None for team in teams}
+    teams = {str(team): uri for team, uri in teams.items()}
+    app.config['TEAMS'] = teams
+
+    hosts = {}
+    for host, team in (app.config.get('TEAM_HOSTS') or {}).items():
+        if str(team) not in teams:
+            raise ValueError(f'TEAM_HOSTS maps {host} to unknown team {team!r}')
+        hosts[host.lower()] = str(team)
+    app.config['TEAM_HOSTS'] = hosts
+
+    if not teams:
+        return
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    team_dir = os.path.join(app.instance_path, 'teams')
+    for team, uri in teams.items():
+        if uri is None:
+            os.makedirs(team_dir, exist_ok=True)
+            uri = f'sqlite:///{os.path.join(team_dir, f"{team}.sqlite")}'
+        binds[team_bind_key(team)] = uri
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def get_teams(app=None):
+    """Return the names of all configured teams."""
+    app = app or current_app
+    return list(app.config.get('TEAMS', {}))
+
+
+def team_databases(app=None):
+    """Return every database to visit: the default (``None``) and then each team's."""
+    return [None] + get_teams(app)
+
+
+def current_team():
+    """Return the team selected for the current app context, if any."""
+    if not has_app_context():
+        return None
+    return g.get('team')
+
+
+def team_from_request():
+    """Work out which team the current request is for."""
+    teams = current_app.config.get('TEAMS', {})
+    if not teams:
+        return None
+
+    team = request.headers.get(TEAM_HEADER)
+    if team and current_app.config['TEAM_HEADER_ENABLED']:
+        if team not in teams:
+            abort(404)
+        return team
+
+    host = request.host.split(':')[0].lower()
+    team = current_app.config.get('TEAM_HOSTS', {}).get(host)
+    if team is not None:
+        return team
+
+    label = host.split('.')[0]
+    if label in teams:
+        return label
+    return None
+
+
+def select_team():
+    """Select the team database before each request."""
+    g.team = team_from_request()
+
+
+@contextmanager
+def team_context(team):
+    """Run a block of code against a single team's database."""
+    if team is not None and team not in current_app.config.get('TEAMS', {}):
+        raise KeyError(f'Unknown team: {team}')
+
+    previous = g.get('team')
+    db.session.remove()
+    g.team = team
+    try:
+        yield team
+    finally:
+        db.session.remove()
+        g.team = previous
+
+
+def init_app(app):
+    """Register team selection with the Flask app."""
+    app.before_request(select_team)
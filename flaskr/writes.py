@@ -0,0 +1,166 @@
+"""Write coordination for SQLite's single-writer model.
+
+SQLite allows one writer per database file. When several threads and
+worker processes write at once, commits fail with ``database is locked``
+instead of queueing. Functions wrapped in :func:`write_transaction`:
+
+* take a per-database writer lock on SQLite, so writers queue instead of
+  fighting over the database's own lock: a thread lock within the process
+  plus an ``flock`` on a sidecar file (``<database>.lock``) across worker
+  processes (server databases such as PostgreSQL handle concurrent
+  writers themselves);
+* retry the whole unit of work with jittered exponential backoff when the
+  database still reports a transient lock error (e.g. a writer that does
+  not take the lock, such as the ``sqlite3`` shell);
+* count contention, retries, failures and time spent waiting in the app
+  metrics.
+
+The wrapped function must contain the complete unit of work, including
+setting any attributes, because a failed attempt is rolled back.
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+
+from .db import db, get_engine
+from .metrics import incr
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+TRANSIENT_MESSAGES = (
+    # SQLite
+    'database is locked', 'database table is locked', 'database is busy',
+    # PostgreSQL
+    'deadlock detected', 'could not serialize access',
+)
+
+_writer_locks = {}
+_writer_locks_guard = threading.Lock()
+_local = threading.local()
+
+
+def is_transient(exc):
+    """Return True for errors that a retry may resolve."""
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc.orig).lower()
+    return any(text in message for text in TRANSIENT_MESSAGES)
+
+
+class WriterLock:
+    """Reentrant writer lock shared by the threads and processes using a database.
+
+    ``path`` names the sidecar file to ``flock``; without one (in-memory
+    databases, or no ``fcntl``) only the threads of this process are
+    coordinated.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        if path is not None and fcntl is not None:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking=blocking):
+            return False
+        if self._depth == 0 and self._fd is not None:
+            try:
+                mode = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(self._fd, mode)
+            except BlockingIOError:
+                self._lock.release()
+                return False
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def writer_lock(engine):
+    """Return the writer lock for a database (None if not SQLite)."""
+    if engine.dialect.name != 'sqlite':
+        return None
+    database = engine.url.database
+    # Keyed by process: a forked worker must not share its parent's
+    # file descriptor, since flock only excludes separate open files
+    key = (os.getpid(), str(engine.url))
+    with _writer_locks_guard:
+        lock = _writer_locks.get(key)
+        if lock is None:
+            path = None if database in (None, '', ':memory:') else f'{database}.lock'
+            lock = _writer_locks[key] = WriterLock(path)
+        return lock
+
+
+def backoff_delays(retries, base, cap):
+    """Yield ``retries`` jittered exponential backoff delays ("full jitter")."""
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def run_write(func, *args, **kwargs):
+    """Run ``func`` as a coordinated, retried write transaction."""
+    # Nested writes join the outer unit of work and its retries
+    if getattr(_local, 'depth', 0):
+        return func(*args, **kwargs)
+
+    config = current_app.config
+    lock = writer_lock(get_engine())
+    start = time.perf_counter()
+    if lock is not None and not lock.acquire(blocking=False):
+        incr('writes.contention')
+        lock.acquire()
+    waited = time.perf_counter() - start
+
+    _local.depth = 1
+    try:
+        delays = backoff_delays(config['WRITE_RETRIES'],
+                                config['WRITE_RETRY_BASE_DELAY'],
+                                config['WRITE_RETRY_MAX_DELAY'])
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                db.session.rollback()
+                delay = next(delays, None)
+                if not is_transient(exc) or delay is None:
+                    incr('writes.failures')
+                    raise
+                incr('writes.retries')
+                time.sleep(delay)
+                waited += delay
+    finally:
+        _local.depth = 0
+        if lock is not None:
+            lock.release()
+        incr('writes.wait_ms', waited * 1000)
+
+
+def write_transaction(func):
+    """Decorator running a function through :func:`run_write`."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_write(func, *args, **kwargs)
+    return wrapper
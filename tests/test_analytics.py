@@ -0,0 +1,127 @@
+"""
+Tests for the vectorized attendance reports.
+"""
+
+from datetime import datetime
+
+import pytest
+from flaskr.archive import archive_season
+from flaskr.db import db
+from flaskr.models import Attendance
+
+np = pytest.importorskip('numpy')
+
+from flaskr.analytics import (  # noqa: E402
+    Intervals, member_stats, naive_member_stats, position_stats, week_stats)
+
+START = datetime(2024, 1, 1)
+END = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def visits(app, multiple_members):
+    """Visits over two weeks of the 2024 season."""
+    with app.app_context():
+        app.config['REQUIRED_HOURS'] = 10
+        rows = [
+            (0, datetime(2024, 2, 5, 18, 0), datetime(2024, 2, 5, 21, 0)),
+            (0, datetime(2024, 2, 5, 21, 30), datetime(2024, 2, 5, 22, 0)),
+            (0, datetime(2024, 2, 12, 18, 0), datetime(2024, 2, 12, 20, 0)),
+            (1, datetime(2024, 2, 6, 17, 0), datetime(2024, 2, 6, 18, 30)),
+            (2, datetime(2024, 2, 13, 18, 0), datetime(2024, 2, 13, 19, 0)),
+        ]
+        for index, checked_in_at, checked_out_at in rows:
+            db.session.add(Attendance(member_id=multiple_members[index],
+                                      checked_in_at=checked_in_at,
+                                      checked_out_at=checked_out_at))
+        db.session.commit()
+    return multiple_members
+
+
+def test_member_stats_match_naive_loop(app, visits):
+    """Test that the vectorized report agrees with the ORM loop."""
+    with app.app_context():
+        vectorized = member_stats(Intervals(START, END))
+        assert vectorized == naive_member_stats(START, END)
+
+        first = vectorized[0]
+        assert first['member_id'] == visits[0]
+        assert first['total_hours'] == 5.5
+        assert first['visits'] == 3
+        assert first['meetings_attended'] == 2
+        assert first['percent_required'] == 55.0
+
+
+def test_position_and_week_stats(app, visits):
+    """Test the per-position and per-week aggregates."""
+    with app.app_context():
+        intervals = Intervals(START, END)
+        assert sum(row['total_hours'] for row in position_stats(intervals)) == 8.0
+        assert sum(row['members'] for row in position_stats(intervals)) == 3
+
+        weeks = week_stats(intervals)
+        assert [row['week_start'] for row in weeks] == ['2024-02-05', '2024-02-12']
+        assert [row['total_hours'] for row in weeks] == [5.0, 3.0]
+        assert [row['members'] for row in weeks] == [2, 2]
+
+
+def test_reports_include_archived_visits(app, visits, tmp_path):
+    """Test that archived seasons are included in the reports."""
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    with app.app_context():
+        before = member_stats(Intervals(START, END))
+        assert archive_season(2024) == 5
+        assert member_stats(Intervals(START, END)) == before
+        assert naive_member_stats(START, END) == before
+
+
+def test_report_api(client, visits):
+    """Test the report endpoints."""
+    response = client.get('/api/reports/members?start=2024-01-01&end=2025-01-01')
+    assert response.status_code == 200
+    assert len(response.get_json()['members']) == 3
+
+    response = client.get('/api/reports/weeks?start=2024-01-01&end=2025-01-01')
+    assert len(response.get_json()['weeks']) == 2
+
+    # Current season by default
+    response = client.get('/api/reports/positions')
+    assert response.get_json()['positions'] == []
+
+    assert client.get('/api/reports/members?start=bogus&end=x').status_code == 400
+
+
+def test_reports_commands(runner, visits):
+    """Test the reports CLI."""
+    result = runner.invoke(args=['reports', 'show', 'members',
+                                 '--start', '2024-01-01', '--end', '2025-01-01'])
+    assert result.exit_code == 0
+    assert 'total_hours' in result.output
+    assert '5.5' in result.output
+
+    result = runner.invoke(args=['reports', 'benchmark', '--repeat', '1',
+                                 '--start', '2024-01-01', '--end', '2025-01-01'])
+    assert result.exit_code == 0
+    assert '5 visit(s)' in result.output
+    assert 'speed-up' in result.output
+
+    # Aware bounds are converted to the naive UTC of the stored timestamps
+    result = runner.invoke(args=['reports', 'show', 'members',
+                                 '--start', '2024-01-01T00:00:00+02:00',
+                                 '--end', '2025-01-01T00:00:00-05:00'])
+    assert result.exit_code == 0, result.output
+    assert '5.5' in result.output
+
+    result = runner.invoke(args=['reports', 'show', 'members',
+                                 '--start', 'bogus', '--end', '2025-01-01'])
+    assert result.exit_code == 2
+
+
+def test_open_visits_count_until_now(app, multiple_members):
+    """Test that a visit without a check-out is counted up to now."""
+    with app.app_context():
+        db.session.add(Attendance(member_id=multiple_members[0],
+                                  checked_in_at=datetime(2024, 3, 1, 18, 0)))
+        db.session.commit()
+        intervals = Intervals(START, END, now=datetime(2024, 3, 1, 20, 30))
+        assert member_stats(intervals)[0]['total_hours'] == 2.5
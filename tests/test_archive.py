@@ -0,0 +1,127 @@
+"""
+Tests for archiving closed seasons into segments.
+"""
+
+import json
+import os
+from datetime import date, datetime
+
+import pytest
+from flaskr import archive
+from flaskr.archive import Segment, archive_dir, archive_season, load_visits, read_index
+from flaskr.db import db
+from flaskr.models import Attendance
+
+
+@pytest.fixture
+def old_visits(app, multiple_members, tmp_path):
+    """Finished visits in the 2024 season plus one in the current season."""
+    app.config['ARCHIVE_DIR'] = str(tmp_path)
+    with app.app_context():
+        for day in (3, 10, 17):
+            for member_id in multiple_members[:2]:
+                db.session.add(Attendance(
+                    member_id=member_id,
+                    checked_in_at=datetime(2024, 2, day, 18, 0),
+                    checked_out_at=datetime(2024, 2, day, 21, 0)
+                ))
+        db.session.add(Attendance(
+            member_id=multiple_members[0],
+            checked_in_at=datetime(date.today().year, 1, 1, 18, 0),
+            checked_out_at=datetime(date.today().year, 1, 1, 20, 0)
+        ))
+        db.session.commit()
+    return multiple_members
+
+
+def test_archive_command(runner, app, old_visits, tmp_path):
+    """Test that closed seasons move out of the database."""
+    result = runner.invoke(args=['archive'])
+    assert result.exit_code == 0
+    assert 'Archived 6 visit(s) from season 2024.' in result.output
+
+    with app.app_context():
+        assert Attendance.query.count() == 1
+        directory = archive_dir()
+
+    with open(os.path.join(directory, 'index.json')) as f:
+        index = json.load(f)
+    assert [(entry['season'], entry['rows']) for entry in index] == [(2024, 6)]
+
+    segment = Segment(os.path.join(directory, index[0]['file']))
+    assert segment.rows == 6
+    assert list(segment.checked_in) == sorted(segment.checked_in)
+    segment.close()
+
+    # Nothing left to archive the second time round
+    result = runner.invoke(args=['archive'])
+    assert 'Archived' not in result.output
+
+
+def test_load_visits_reads_archive_transparently(runner, app, old_visits):
+    """Test that range queries combine the database and archived segments."""
+    runner.invoke(args=['archive'])
+
+    with app.app_context():
+        visits = load_visits(datetime(2024, 2, 5), datetime(2024, 2, 18))
+        assert len(visits) == 4
+        assert visits[0][1] == datetime(2024, 2, 10, 18, 0)
+        assert visits[0][2] == datetime(2024, 2, 10, 21, 0)
+
+        visits = load_visits(datetime(2000, 1, 1), datetime(2100, 1, 1))
+        assert len(visits) == 7
+
+
+def test_visits_api(client, runner, old_visits):
+    """Test the visits report endpoint."""
+    runner.invoke(args=['archive'])
+    response = client.get('/api/reports/visits?start=2024-02-01&end=2024-03-01')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 6
+
+    response = client.get('/api/reports/visits?start=nope')
+    assert response.status_code == 400
+
+
+def test_interrupted_archive_is_not_archived_twice(app, old_visits, monkeypatch):
+    """Test that the next run deletes rows whose delete failed, not archive them."""
+    def fail(func):
+        raise RuntimeError('database is locked')
+
+    with app.app_context():
+        with monkeypatch.context() as patch:
+            patch.setattr(archive, 'run_write', fail)
+            with pytest.raises(RuntimeError):
+                archive_season(2024)
+        assert Attendance.query.count() == 7
+
+        assert archive_season(2024) == 0
+        assert Attendance.query.count() == 1
+        assert len(read_index(archive_dir())) == 1
+        assert len(load_visits(datetime(2000, 1, 1), datetime(2100, 1, 1))) == 7
+
+
+def test_visit_closed_after_archiving_gets_its_own_segment(app, old_visits):
+    """Test that a visit left open inside an archived id range is archived later."""
+    with app.app_context():
+        visit = Attendance.query.order_by(Attendance.id).all()[2]
+        visit.checked_out_at = None
+        db.session.commit()
+
+        assert archive_season(2024) == 5
+        assert read_index(archive_dir())[0]['open_ids'] == [visit.id]
+
+        visit = db.session.get(Attendance, visit.id)
+        visit.checked_out_at = datetime(2024, 2, 10, 21, 0)
+        db.session.commit()
+
+        assert archive_season(2024) == 1
+        assert [entry['rows'] for entry in read_index(archive_dir())] == [5, 1]
+        assert Attendance.query.count() == 1
+        assert len(load_visits(datetime(2000, 1, 1), datetime(2100, 1, 1))) == 7
+
+
+def test_archive_rejects_open_season(runner):
+    """Test that the current season cannot be archived."""
+    result = runner.invoke(args=['archive', '--season', str(date.today().year)])
+    assert result.exit_code != 0
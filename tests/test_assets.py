@@ -0,0 +1,70 @@
+"""
+Tests for fingerprinted static assets.
+"""
+
+import gzip
+import os
+
+import pytest
+from flaskr.assets import build_assets
+
+
+@pytest.fixture
+def built_app(app, tmp_path):
+    """An app whose assets have been built into a temporary directory."""
+    app.config['ASSETS_BUILD_DIR'] = str(tmp_path)
+    build_assets(app)
+    return app
+
+
+def test_pages_use_static_urls_before_build(client):
+    """Test that templates fall back to plain static URLs."""
+    response = client.get('/')
+    assert b'/static/css/styles.css' in response.data
+
+
+def test_build_assets_command(runner, app, tmp_path):
+    """Test the build-assets CLI command."""
+    app.config['ASSETS_BUILD_DIR'] = str(tmp_path)
+    result = runner.invoke(args=['build-assets'])
+    assert result.exit_code == 0
+    assert os.path.isfile(tmp_path / 'manifest.json')
+
+    manifest = app.extensions['asset_manifest']
+    hashed = manifest['css/styles.css']
+    assert hashed.startswith('css/styles.') and hashed.endswith('.css')
+    assert os.path.isfile(tmp_path / (hashed + '.gz'))
+    # Images are already compressed
+    assert not os.path.isfile(tmp_path / (manifest['images/997_logo.png'] + '.gz'))
+
+
+def test_pages_use_fingerprinted_urls(built_app):
+    """Test that templates link to the fingerprinted assets."""
+    hashed = built_app.extensions['asset_manifest']['css/styles.css']
+    response = built_app.test_client().get('/')
+    assert f'/assets/{hashed}'.encode() in response.data
+
+
+def test_asset_served_precompressed_and_immutable(built_app):
+    """Test cache headers and encoding negotiation."""
+    hashed = built_app.extensions['asset_manifest']['css/styles.css']
+    client = built_app.test_client()
+
+    response = client.get(f'/assets/{hashed}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert b'body' in gzip.decompress(response.data)
+
+    response = client.get(f'/assets/{hashed}')
+    assert 'Content-Encoding' not in response.headers
+    assert b'body' in response.data
+
+
+def test_unknown_asset(built_app):
+    """Test that unknown assets return 404."""
+    response = built_app.test_client().get('/assets/css/missing.css')
+    assert response.status_code == 404
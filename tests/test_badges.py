@@ -0,0 +1,83 @@
+"""
+Tests for the in-memory badge filter.
+"""
+
+from sqlalchemy import event, update
+
+from flaskr.badges import get_filter
+from flaskr.db import db, get_engine
+from flaskr.metrics import get_metrics
+from flaskr.models import Member
+from flaskr import roster
+
+
+def _count_queries(app):
+    statements = []
+    with app.app_context():
+        event.listen(get_engine(), 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_unknown_badge_is_rejected_without_queries(client, app, sample_member):
+    """Test that unknown idhashes never reach the database."""
+    client.post('/quick-checkin', data={'member_name': '12345'})
+    statements = _count_queries(app)
+    response = client.post('/quick-checkin', data={'member_name': '99999'})
+    assert response.status_code == 302
+    assert statements == []
+    with app.app_context():
+        metrics = get_metrics()
+        assert metrics.get('badge_filter.passed') == 1
+        assert metrics.get('badge_filter.rejected') == 1
+        assert db.session.get(Member, sample_member).checked_in is True
+
+
+def test_filter_follows_member_changes(app, sample_member, sample_positions):
+    """Test that adding, re-badging and deactivating members rebuilds the filter."""
+    with app.app_context():
+        badges = get_filter()
+        assert 12345 in badges and 555 not in badges
+
+        db.session.add(Member(first_name='New', last_name='Kid', idhash=555,
+                              position_id=sample_positions['member'].id))
+        db.session.commit()
+        assert 555 in badges
+
+        db.session.get(Member, sample_member).idhash = 777
+        db.session.commit()
+        assert 777 in badges and 12345 not in badges
+
+        roster.bulk_update([{'id': sample_member, 'active': False}])
+        assert 777 not in badges
+
+        # Check-ins leave the filter alone
+        rebuilds = get_metrics().get('badge_filter.rebuilds')
+        Member.check_in_by_idhash(555)
+        assert 555 in badges
+        assert get_metrics().get('badge_filter.rebuilds') == rebuilds
+
+
+def test_stale_filter_counts_false_positives(client, app, sample_member):
+    """Test the metric for scans let through by a stale filter."""
+    app.config['CHECKIN_DEBOUNCE_SECONDS'] = 0
+    with app.app_context():
+        assert 12345 in get_filter()
+        # Another worker deactivates the member
+        db.session.execute(update(Member.__table__).values(active=False))
+        db.session.commit()
+
+    client.post('/quick-checkin', data={'member_name': '12345'})
+    with app.app_context():
+        assert get_metrics().get('badge_filter.false_positives') == 1
+        get_filter().max_age = 0
+    client.post('/quick-checkin', data={'member_name': '12345'})
+    with app.app_context():
+        assert get_metrics().get('badge_filter.rejected') == 1
+
+
+def test_filter_can_be_disabled(make_app):
+    """Test BADGE_FILTER_ENABLED."""
+    app = make_app({'BADGE_FILTER_ENABLED': False})
+    with app.app_context():
+        assert get_filter() is None
@@ -0,0 +1,52 @@
+"""
+Tests for the in-process TTL cache.
+"""
+
+import pytest
+from flaskr.cache import TTLCache
+
+
+class FakeTimer:
+    """A controllable clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire():
+    """Test that entries disappear after their time to live."""
+    timer = FakeTimer()
+    cache = TTLCache(ttl=2.0, timer=timer)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+    timer.now = 2.5
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_add_only_stores_missing_keys():
+    """Test that add refuses keys that are still live."""
+    timer = FakeTimer()
+    cache = TTLCache(ttl=1.0, timer=timer)
+    assert cache.add('scan', True)
+    assert not cache.add('scan', True)
+
+    timer.now = 1.5
+    assert cache.add('scan', True)
+
+
+def test_cache_is_bounded():
+    """Test that the oldest entries are evicted when full."""
+    cache = TTLCache(maxsize=2, ttl=60.0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert 'a' not in cache
+    assert cache.get('b') == 2
+    assert cache.get('c') == 3
+    assert cache.pop('c') == 3
+    assert len(cache) == 1
@@ -2,8 +2,11 @@
 Tests for CLI commands.
 """
 
+from datetime import datetime, timedelta, timezone
+
 import pytest
-from flaskr.models import Member, Position
+from flaskr.db import db
+from flaskr.models import Attendance, Member, Position
 
 
 def test_init_db_command(runner, app):
@@ -66,4 +69,31 @@ def test_seed_db_creates_positions_if_missing(runner, app):
         assert len(positions) == 4
         
         members = Member.query.all()
-        assert len(members) == 10
\ No newline at end of file
+        assert len(members) == 10
+
+
+def test_auto_checkout_command(runner, app, multiple_members):
+    """Test the auto-checkout CLI command."""
+    # A visit that began three hours ago; cut-offs are whole hours back, so
+    # they never wrap around midnight relative to it
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        Member.query.get(multiple_members[0]).check_in()
+        Attendance.query.update({'checked_in_at': now - timedelta(hours=3)})
+        db.session.commit()
+
+    cutoff = (now - timedelta(hours=4)).astimezone().strftime('%H:%M')
+    result = runner.invoke(args=['auto-checkout', '--at', cutoff])
+    assert result.exit_code == 0
+    assert 'Checked out 0 member(s)' in result.output
+
+    cutoff = (now - timedelta(hours=1)).astimezone().strftime('%H:%M')
+    result = runner.invoke(args=['auto-checkout', '--at', cutoff])
+    assert result.exit_code == 0
+    assert 'Checked out 1 member(s)' in result.output
+
+    with app.app_context():
+        assert Member.query.get(multiple_members[0]).checked_in is False
+        visit = Attendance.query.one()
+        assert visit.checked_out_at is not None
+        assert visit.auto_checkout is True
@@ -0,0 +1,84 @@
+"""
+Tests for cross-worker cache invalidation.
+"""
+
+import pytest
+
+from flaskr.badges import get_filter
+from flaskr.coherence import get_caches
+from flaskr.db import db
+from flaskr.metrics import get_metrics
+from flaskr.models import CacheVersion, Member, Position
+from flaskr.positions import get_registry
+
+
+@pytest.fixture
+def workers(make_app):
+    """Two apps sharing one database, standing in for two gunicorn workers."""
+    first = make_app()
+    with first.app_context():
+        Position.create_default_positions()
+        db.session.add(Member(first_name='John', last_name='Doe', idhash=12345,
+                              position_id=1))
+        db.session.commit()
+    second = make_app()
+    yield first, second
+    for app in (first, second):
+        with app.app_context():
+            get_caches().close()
+
+
+def test_changes_bump_versions(app, sample_member):
+    """Test that cached data changes bump their counters in the same transaction."""
+    with app.app_context():
+        before = dict(db.session.query(CacheVersion.name, CacheVersion.version))
+        db.session.get(Member, sample_member).idhash = 54321
+        db.session.get(Position, 1).description = 'Renamed'
+        db.session.commit()
+        versions = dict(db.session.query(CacheVersion.name, CacheVersion.version))
+        changes = {name: versions[name] - before[name] for name in versions}
+        assert changes == {'members': 1, 'positions': 1}
+
+        # Check-ins touch neither
+        Member.check_in_by_idhash(54321)
+        after = dict(db.session.query(CacheVersion.name, CacheVersion.version))
+        assert after == versions
+
+
+def test_other_workers_drop_stale_caches(workers):
+    """Test that a change committed by one worker reaches the other's caches."""
+    first, second = workers
+    client = second.test_client()
+    client.get('/api/positions')
+    with second.app_context():
+        assert 12345 in get_filter()
+        assert get_registry().name_of(1) == 'member'
+
+    with first.app_context():
+        db.session.get(Position, 1).name = 'rookie'
+        db.session.get(Member, 1).active = False
+        db.session.commit()
+
+    positions = client.get('/api/positions').get_json()
+    assert positions[0]['name'] == 'rookie'
+    with second.app_context():
+        assert 12345 not in get_filter()
+        assert get_metrics().get('caches.invalidations') >= 2
+
+
+def test_unchanged_database_is_not_reread(workers):
+    """Test that only the caches whose data changed are invalidated."""
+    first, second = workers
+    with second.test_request_context():
+        caches = get_caches()
+        caches.check()
+        assert caches.check() == []
+
+        with first.app_context():
+            Member.check_in_by_idhash(12345)
+        assert caches.check() == []
+
+        with first.app_context():
+            db.session.get(Position, 2).description = 'Changed'
+            db.session.commit()
+        assert caches.check() == ['positions']
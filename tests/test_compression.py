@@ -0,0 +1,61 @@
+"""
+Tests for negotiated response compression.
+"""
+
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Response, stream_with_context
+
+
+def test_json_compressed_when_accepted(client, app, multiple_members):
+    """Test that large JSON responses are gzipped."""
+    app.config['COMPRESS_MIN_SIZE'] = 100
+    response = client.get('/api/members', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    members = json.loads(gzip.decompress(response.data))
+    assert len(members) == 4
+
+    metrics = client.get('/api/metrics').get_json()
+    assert metrics['compression.bytes_saved'] > 0
+    assert metrics['compression.responses.gzip'] == 1
+
+
+def test_not_compressed_without_accept_encoding(client, multiple_members):
+    """Test that clients that do not ask for compression get plain bodies."""
+    response = client.get('/api/members')
+    assert 'Content-Encoding' not in response.headers
+    assert len(response.get_json()) == 4
+
+
+def test_small_responses_not_compressed(client):
+    """Test the size threshold."""
+    response = client.get('/hello', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == b'Hello, World!'
+
+
+def test_streamed_response_compressed_incrementally(app):
+    """Test that streamed responses are compressed chunk by chunk."""
+    @app.route('/stream')
+    def stream():
+        def generate():
+            for i in range(100):
+                yield f'line {i}\n'
+        return Response(stream_with_context(generate()), mimetype='text/plain')
+
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    body = zlib.decompress(response.data, 31).decode()
+    assert body.splitlines()[-1] == 'line 99'
+
+
+def test_compression_can_be_disabled(client, app, multiple_members):
+    """Test the COMPRESS_ENABLED switch."""
+    app.config['COMPRESS_ENABLED'] = False
+    response = client.get('/api/members', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
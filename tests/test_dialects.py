@@ -0,0 +1,95 @@
+"""
+Tests for database configuration and dialect-specific fast paths.
+"""
+
+from types import SimpleNamespace
+
+from flask import Flask
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+
+from flaskr import dialects
+from flaskr.db import configure_engines, db, normalize_url
+from flaskr.models import Member, OccupancyCount
+from flaskr.writes import is_transient, writer_lock
+
+
+def make_config(uri, binds=None):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=uri,
+        SQLALCHEMY_BINDS=binds or {},
+        DB_POOL_SIZE=20,
+        DB_MAX_OVERFLOW=5,
+        DB_POOL_RECYCLE=300,
+        DB_POOL_PRE_PING=True,
+    )
+    configure_engines(app)
+    return app.config
+
+
+def test_pool_options_only_for_server_databases():
+    """Test that pool settings reach PostgreSQL engines but not SQLite ones."""
+    config = make_config('postgres://u:p@db/teamlog', {
+        'team:1': 'sqlite:///team1.sqlite',
+        'team:2': {'url': 'postgresql://u:p@db/team2', 'pool_size': 2},
+    })
+    assert config['SQLALCHEMY_DATABASE_URI'] == 'postgresql+psycopg://u:p@db/teamlog'
+    assert config['SQLALCHEMY_ENGINE_OPTIONS'] == {
+        'pool_size': 20, 'max_overflow': 5, 'pool_recycle': 300, 'pool_pre_ping': True
+    }
+    assert config['SQLALCHEMY_BINDS']['team:1'] == {'url': 'sqlite:///team1.sqlite'}
+    assert config['SQLALCHEMY_BINDS']['team:2']['pool_size'] == 2
+    assert config['SQLALCHEMY_BINDS']['team:2']['pool_pre_ping'] is True
+
+    config = make_config('sqlite:///:memory:')
+    assert 'SQLALCHEMY_ENGINE_OPTIONS' not in config
+
+
+def test_normalize_url():
+    """Test that PostgreSQL URLs without a driver use psycopg."""
+    assert normalize_url('postgres://host/db') == 'postgresql+psycopg://host/db'
+    assert (normalize_url('postgresql://u:p@host/db')
+            == 'postgresql+psycopg://u:p@host/db')
+    assert (normalize_url('postgresql+psycopg://host/db')
+            == 'postgresql+psycopg://host/db')
+    assert normalize_url('sqlite:///x.sqlite') == 'sqlite:///x.sqlite'
+
+
+def test_upsert_increment(app, monkeypatch):
+    """Test the ON CONFLICT upsert and the portable fallback."""
+    table = OccupancyCount.__table__
+    with app.app_context():
+        for _ in range(2):
+            dialects.upsert_increment(db.session, table, {'weekday': 1, 'hour': 18},
+                                      {'checkins': 1, 'seconds': 60})
+        monkeypatch.setattr(dialects, 'UPSERT_INSERTS', {})
+        dialects.upsert_increment(db.session, table, {'weekday': 1, 'hour': 18},
+                                  {'checkins': 1, 'seconds': 60})
+        dialects.upsert_increment(db.session, table, {'weekday': 2, 'hour': 9},
+                                  {'checkins': 1, 'seconds': 0})
+        db.session.commit()
+
+        rows = db.session.query(
+            OccupancyCount.weekday, OccupancyCount.checkins, OccupancyCount.seconds
+        ).order_by(OccupancyCount.weekday).all()
+        assert [tuple(row) for row in rows] == [(1, 3, 180), (2, 1, 0)]
+
+
+def test_postgresql_bulk_update_uses_values_list():
+    """Test that PostgreSQL bulk updates compile to one UPDATE ... FROM (VALUES ...)."""
+    rows = [{'id': 1, 'active': False}, {'id': 2, 'active': True}]
+    stmt = dialects.values_update(Member.__table__, ('active', 'id'), rows)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.startswith('UPDATE members SET active=changes.active')
+    assert 'FROM (VALUES (' in sql
+    assert 'AS changes (active, id)' in sql
+    assert sql.endswith('WHERE members.id = changes.id')
+
+
+def test_server_databases_skip_writer_lock():
+    """Test that only SQLite writes are serialized in-process."""
+    engine = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'),
+                             url='postgresql://db/x')
+    assert writer_lock(engine) is None
+    assert is_transient(OperationalError('UPDATE', {}, Exception('deadlock detected')))
@@ -6,10 +6,10 @@ import pytest
 from flaskr import create_app
 
 
-def test_config():
+def test_config(tmp_path):
     """Test that the app can be created with test configuration."""
-    assert not create_app().testing
-    assert create_app({'TESTING': True}).testing
+    assert not create_app(instance_path=str(tmp_path)).testing
+    assert create_app({'TESTING': True}, instance_path=str(tmp_path)).testing
 
 
 def test_hello_route(client):
@@ -19,9 +19,9 @@ def test_hello_route(client):
     assert b'Hello, World!' in response.data
 
 
-def test_app_creation():
+def test_app_creation(tmp_path):
     """Test that app factory creates app correctly."""
-    app = create_app({'TESTING': True})
+    app = create_app({'TESTING': True}, instance_path=str(tmp_path))
     assert app is not None
     assert app.testing is True
 
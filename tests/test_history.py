@@ -0,0 +1,100 @@
+"""
+Tests for bitmap attendance history and season analytics.
+"""
+
+import pytest
+from datetime import date
+from flaskr.db import db
+from flaskr.history import (LANE_BYTES, co_attendance, longest_streak, longest_streaks,
+                            meeting_dates, season_stats)
+from flaskr.models import AttendanceBitmap, Member
+
+
+@pytest.fixture
+def season_history(app, multiple_members):
+    """Record three meetings in the 2025 season."""
+    jane, bob, alice, charlie = multiple_members
+    attendance = {
+        date(2025, 1, 4): [jane, bob, alice],
+        date(2025, 1, 11): [jane, bob],
+        date(2025, 1, 18): [jane, alice],
+    }
+    with app.app_context():
+        for day, member_ids in attendance.items():
+            for member_id in member_ids:
+                AttendanceBitmap.mark(member_id, day)
+        db.session.commit()
+    return multiple_members
+
+
+def test_check_in_marks_today(app, sample_member):
+    """Test that checking in sets today's attendance bit."""
+    with app.app_context():
+        member = db.session.get(Member, sample_member)
+        member.check_in()
+
+        season, index = AttendanceBitmap.season_of(date.today())
+        bitmap = AttendanceBitmap.query.filter_by(member_id=member.id,
+                                                  season=season).one()
+        assert bitmap.bits == 1 << index
+
+
+def test_season_of_respects_start_month(app):
+    """Test that seasons can start part way through the year."""
+    app.config['SEASON_START_MONTH'] = 9
+    with app.app_context():
+        assert AttendanceBitmap.season_of(date(2025, 9, 1)) == (2025, 0)
+        assert AttendanceBitmap.season_of(date(2026, 1, 1)) == (2025, 122)
+
+
+def test_season_stats(app, season_history):
+    """Test attendance counts, rates and streaks."""
+    jane, bob, alice, charlie = season_history
+    with app.app_context():
+        stats = season_stats(2025)
+
+    assert stats['meetings'] == 3
+    by_member = {s['member_id']: s for s in stats['members']}
+    assert by_member[jane]['meetings_attended'] == 3
+    assert by_member[jane]['attendance_rate'] == 1.0
+    assert by_member[jane]['longest_streak'] == 3
+    assert by_member[bob]['longest_streak'] == 2
+    assert by_member[alice]['longest_streak'] == 1
+    assert charlie not in by_member
+
+
+def test_streaks_count_meetings_not_days():
+    """Test that days without a meeting do not break a streak."""
+    meetings = 0b1010_1010_1011
+    assert longest_streak(0b1010_1000_0011, meetings) == 3
+    assert longest_streak(0, meetings) == 0
+
+    # Lanes are independent, including the last day of the season
+    last = 1 << 365
+    lanes = [0b1010_1010_1011, 0b0000_0010_1000, last, 0]
+    blobs = b''.join(bits.to_bytes(LANE_BYTES, 'little') for bits in lanes)
+    packed = int.from_bytes(blobs, 'little')
+    assert longest_streaks(packed, 4, meetings | last) == [7, 2, 1, 0]
+
+
+def test_co_attendance_and_meeting_dates(app, season_history):
+    """Test shared meeting counts and the list of meeting days."""
+    jane, bob, alice, charlie = season_history
+    with app.app_context():
+        assert co_attendance(jane, 2025) == {bob: 2, alice: 2}
+        assert co_attendance(charlie, 2025) == {}
+        assert meeting_dates(2025) == [date(2025, 1, 4), date(2025, 1, 11),
+                                       date(2025, 1, 18)]
+
+
+def test_season_attendance_api(client, season_history):
+    """Test the season attendance API endpoint."""
+    response = client.get('/api/seasons/2025/attendance')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['meetings'] == 3
+    assert data['meeting_dates'][0] == '2025-01-04'
+
+    response = client.get(f'/api/seasons/2025/co-attendance/{season_history[0]}')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
@@ -0,0 +1,118 @@
+"""
+Tests for Idempotency-Key handling on check-in requests.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from flaskr.db import db
+from flaskr.idempotency import claim, prune, request_fingerprint
+from flaskr.metrics import get_metrics
+from flaskr.models import Attendance, IdempotencyKey, Member
+
+
+def test_retried_check_in_runs_once(client, app, sample_member):
+    """Test that a retry replays the stored response instead of writing again."""
+    headers = {'Idempotency-Key': 'scan-1'}
+    first = client.post('/quick-checkin', data={'member_name': '12345'},
+                        headers=headers)
+    assert first.status_code == 302
+
+    with app.app_context():
+        # Someone checks the member out before the kiosk's retry arrives
+        Member.check_out_by_id(sample_member)
+
+    app.extensions['scan_debounce'].clear()
+    retry = client.post('/quick-checkin', data={'member_name': '12345'},
+                        headers=headers)
+    assert retry.status_code == 302
+    assert retry.headers['Location'] == first.headers['Location']
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+
+    with app.app_context():
+        assert db.session.get(Member, sample_member).checked_in is False
+        assert Attendance.query.count() == 1
+        assert get_metrics().get('idempotency.replays') == 1
+
+
+def test_requests_without_key_are_not_stored(client, app, sample_member):
+    """Test that plain requests behave as before."""
+    client.get(f'/members/{sample_member}/checkin')
+    with app.app_context():
+        assert IdempotencyKey.query.count() == 0
+
+
+def test_key_reuse_and_in_progress(client, app, sample_member):
+    """Test the conflict responses."""
+    client.get(f'/members/{sample_member}/checkin', headers={'Idempotency-Key': 'k1'})
+    checkout = f'/members/{sample_member}/checkout'
+    response = client.get(checkout, headers={'Idempotency-Key': 'k1'})
+    assert response.status_code == 422
+
+    with app.test_request_context(checkout):
+        fingerprint = request_fingerprint()
+        assert claim('k2', fingerprint)
+        assert not claim('k2', fingerprint)
+    response = client.get(checkout, headers={'Idempotency-Key': 'k2'})
+    assert response.status_code == 409
+
+    response = client.get(checkout, headers={'Idempotency-Key': 'x' * 300})
+    assert response.status_code == 400
+
+
+def test_key_reused_with_another_body(client, app, sample_member, multiple_members):
+    """Test that a key resent with a different body is refused, not replayed."""
+    headers = {'Idempotency-Key': 'scan-2'}
+    first = client.post('/quick-checkin', data={'member_name': '12345'},
+                        headers=headers)
+    assert first.status_code == 302
+
+    app.extensions['scan_debounce'].clear()
+    response = client.post('/quick-checkin', data={'member_name': '67890'},
+                           headers=headers)
+    assert response.status_code == 422
+    with app.app_context():
+        assert Attendance.query.count() == 1
+
+
+def test_errors_are_not_stored(client, app):
+    """Test that the key is released when the view aborts."""
+    for _ in range(2):
+        response = client.get('/members/999/checkin',
+                              headers={'Idempotency-Key': 'missing'})
+        assert response.status_code == 404
+        assert 'Idempotent-Replayed' not in response.headers
+    with app.app_context():
+        assert IdempotencyKey.query.count() == 0
+
+
+def test_keys_expire_and_are_bounded(client, app, sample_member):
+    """Test TTL expiry and the size limit."""
+    app.config['IDEMPOTENCY_MAX_KEYS'] = 3
+    with app.app_context():
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        two_days_ago = now - timedelta(days=2)
+        db.session.add(IdempotencyKey(key='old', fingerprint='GET /x', status=200,
+                                      created_at=two_days_ago))
+        db.session.commit()
+        # An expired key can be claimed again
+        assert claim('old', 'GET /y')
+        assert db.session.get(IdempotencyKey, 'old').fingerprint == 'GET /y'
+        for n in range(5):
+            assert claim(f'key-{n}', 'GET /x')
+        # Claims leave pruning to prune()
+        assert IdempotencyKey.query.count() == 6
+        prune()
+        keys = {entry.key for entry in IdempotencyKey.query}
+        assert keys == {'key-2', 'key-3', 'key-4'}
+
+
+def test_prune_expired_keys(app):
+    """Test that prune() drops keys older than the TTL."""
+    two_days_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=2)
+    with app.app_context():
+        db.session.add(IdempotencyKey(key='old', fingerprint='GET /x', status=200,
+                                      created_at=two_days_ago))
+        db.session.commit()
+        assert claim('new', 'GET /x')
+        prune()
+        assert [entry.key for entry in IdempotencyKey.query] == ['new']
@@ -0,0 +1,55 @@
+"""
+Tests for scheduled batch jobs.
+"""
+
+import pytest
+from datetime import datetime, time, timedelta, timezone
+from flaskr.db import db
+from flaskr.jobs import auto_checkout, last_occurrence
+from flaskr.models import Attendance, Member
+from flaskr.presence import get_snapshot
+
+
+def test_last_occurrence():
+    """Test finding the most recent cut-off time."""
+    now = datetime.now().astimezone().replace(hour=12, minute=0, second=0,
+                                              microsecond=0)
+    assert last_occurrence(time(9, 30), now) == now.replace(hour=9, minute=30)
+    assert last_occurrence(time(22, 0), now) == now.replace(hour=22) - timedelta(days=1)
+
+
+def test_auto_checkout(app, multiple_members):
+    """Test that stragglers are checked out at the cut-off time."""
+    with app.app_context():
+        for member_id in multiple_members[:2]:
+            db.session.get(Member, member_id).check_in()
+
+    now = datetime.now(timezone.utc) + timedelta(hours=1)
+    cutoff, counts = auto_checkout(app, now.astimezone().strftime('%H:%M'), now=now)
+    assert counts == {None: 2}
+
+    with app.app_context():
+        assert Member.query.filter_by(checked_in=True).count() == 0
+        assert get_snapshot().summary()['checked_in'] == 0
+        visits = Attendance.query.all()
+        assert len(visits) == 2
+        for visit in visits:
+            assert visit.auto_checkout is True
+            assert visit.checked_out_at == cutoff.replace(tzinfo=None)
+
+    # Running again (e.g. on another worker) finds nothing left to do
+    cutoff = now.astimezone().strftime('%H:%M')
+    assert auto_checkout(app, cutoff, now=now)[1] == {None: 0}
+
+
+def test_auto_checkout_skips_later_visits(app, multiple_members):
+    """Test that members who arrived after the cut-off stay checked in."""
+    with app.app_context():
+        db.session.get(Member, multiple_members[0]).check_in()
+
+    earlier = datetime.now(timezone.utc) - timedelta(hours=1)
+    cutoff, counts = auto_checkout(app, earlier.astimezone().strftime('%H:%M'))
+    assert counts == {None: 0}
+
+    with app.app_context():
+        assert db.session.get(Member, multiple_members[0]).checked_in is True
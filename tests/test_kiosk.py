@@ -0,0 +1,128 @@
+"""
+Tests for the headless kiosk client.
+"""
+
+import io
+from datetime import datetime, timezone
+
+import pytest
+
+from flaskr import kiosk
+from flaskr.kiosk import Kiosk, Rejected, RetryLater, ScanBuffer
+from flaskr.models import Attendance
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    buffer = ScanBuffer(str(tmp_path / 'scans.sqlite'))
+    yield buffer
+    buffer.close()
+
+
+@pytest.fixture
+def server(client, monkeypatch):
+    """Send batches to the test app; ``server.down`` simulates an outage.
+
+    ``server.status`` makes it refuse every batch, like a misconfigured URL.
+    """
+    class Server:
+        down = False
+        status = None
+        batches = []
+
+    def send_batch(url, key, scans, team=None, timeout=10):
+        if Server.down:
+            raise RetryLater('connection refused')
+        if Server.status:
+            raise Rejected(Server.status)
+        Server.batches.append(len(scans))
+        response = client.post('/api/scans', json={'scans': scans},
+                               headers={'Idempotency-Key': key})
+        if response.status_code != 200:
+            raise Rejected(response.status_code, response.get_json()['errors'])
+        return response.get_json()['results']
+
+    monkeypatch.setattr(kiosk, 'send_batch', send_batch)
+    return Server
+
+
+def test_buffer_keeps_batch_until_acknowledged(buffer):
+    """Test that an unacknowledged batch is offered again under the same key."""
+    kiosk_ = Kiosk(buffer, 'http://teamlog', batch_size=2, echo=lambda message: None)
+    for idhash in ('1', '2', '3', 'oops', '3'):
+        kiosk_.scan(idhash)
+    assert buffer.pending() == 3
+
+    key, scans = buffer.next_batch(2)
+    assert [scan['idhash'] for scan in scans] == [1, 2]
+    assert buffer.next_batch(2)[0] == key
+    buffer.acknowledge(key)
+    assert [scan['idhash'] for scan in buffer.next_batch(2)[1]] == [3]
+
+
+def test_scans_survive_an_outage(app, buffer, server, multiple_members):
+    """Test that scans stay buffered while the server is down and are sent later."""
+    messages = []
+    server.down = True
+    left = Kiosk(buffer, 'http://teamlog', linger=0, retry_base=0.01,
+                 echo=messages.append).run(io.StringIO('67890\n11111\n'))
+    assert left == 2
+    assert any('buffered' in message for message in messages)
+
+    server.down = False
+    kiosk_ = Kiosk(buffer, 'http://teamlog', linger=0, echo=messages.append)
+    left = kiosk_.run(io.StringIO('22222\n'))
+    assert left == 0
+    assert 'Checked in Alice Johnson' in messages
+    with app.app_context():
+        assert Attendance.query.count() == 3
+
+
+def test_refused_batches_stay_buffered(app, buffer, server, multiple_members):
+    """Test that a batch refused as a whole (wrong URL or team) is kept, not dropped."""
+    messages = []
+    server.status = 404
+    left = Kiosk(buffer, 'http://teamlog', linger=0, retry_base=0.01,
+                 echo=messages.append).run(io.StringIO('67890\n11111\n'))
+    assert left == 2
+    assert any('check --server and --team' in message for message in messages)
+
+    server.status = None
+    kiosk_ = Kiosk(buffer, 'http://teamlog', linger=0, echo=messages.append)
+    assert kiosk_.run(io.StringIO('')) == 0
+    with app.app_context():
+        assert Attendance.query.count() == 2
+
+
+def test_batches_shrink_to_the_server_limit(app, buffer, server, multiple_members):
+    """Test that batches larger than SCAN_BATCH_MAX are split, not dropped."""
+    app.config['SCAN_BATCH_MAX'] = 2
+    kiosk_ = Kiosk(buffer, 'http://teamlog', batch_size=10000,
+                   echo=lambda message: None)
+    assert kiosk_.batch_size == 500
+
+    kiosk_ = Kiosk(buffer, 'http://teamlog', batch_size=10, echo=lambda message: None)
+    for idhash in ('67890', '11111', '22222'):
+        kiosk_.scan(idhash)
+    assert kiosk_.send_pending() == 3
+    assert kiosk_.batch_size == 2
+    # The first, oversized batch was refused and resent in two parts
+    assert server.batches == [3, 2, 1]
+    with app.app_context():
+        assert Attendance.query.count() == 3
+
+
+def test_invalid_scans_move_to_rejected_table(app, buffer, server, multiple_members):
+    """Test that only scans the server flags one by one leave the queue."""
+    buffer.add(67890, datetime.now(timezone.utc))
+    buffer._conn.execute(
+        "INSERT INTO scans (idhash, scanned_at) VALUES (11111, 'garbage')")
+
+    kiosk_ = Kiosk(buffer, 'http://teamlog', echo=lambda message: None)
+    assert kiosk_.send_pending() == 1
+    assert buffer.pending() == 0
+    assert buffer.rejected() == 1
+    row = buffer._conn.execute('SELECT idhash, error FROM rejected').fetchone()
+    assert row == (11111, 'scanned_at must be an ISO 8601 timestamp')
+    with app.app_context():
+        assert Attendance.query.count() == 1
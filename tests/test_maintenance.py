@@ -0,0 +1,106 @@
+"""
+Tests for the database maintenance command.
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from flaskr import create_app, maintenance
+from flaskr.db import db
+from flaskr.maintenance import SQLiteMaintenance, maintain, maintain_idle_teams
+from flaskr.models import Member, Position
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    url = f'sqlite:///{tmp_path / "teamlog.sqlite"}'
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': url},
+                     instance_path=str(tmp_path))
+    with app.app_context():
+        Position.create_default_positions()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.mark.sqlite_only
+def test_db_maintain_reports_steps(runner):
+    """Test the command output."""
+    result = runner.invoke(args=['db-maintain', '--skip', 'vacuum'])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert ([line.split()[0] for line in lines]
+            == ['analyze', 'checkpoint', 'check', 'Size:'])
+    assert lines[2].endswith('ok')
+
+
+@pytest.mark.sqlite_only
+def test_incremental_vacuum_releases_pages(file_app):
+    """Test converting a database and giving deleted pages back."""
+    with file_app.app_context():
+        report = maintain(enable_wal=True, enable_incremental_vacuum=True)
+        assert [step.name for step in report.steps][:2] == ['wal', 'autovacuum']
+
+        db.session.add_all([Member(first_name='x' * 200, last_name='y', idhash=n,
+                                   position_id=1)
+                            for n in range(2000)])
+        db.session.commit()
+        db.session.execute(db.delete(Member.__table__))
+        db.session.commit()
+
+        report = maintain(vacuum_pages=50, truncate_wal=True)
+        assert db.session.execute(db.text("PRAGMA freelist_count")).scalar() == 0
+        steps = {step.name: step.result for step in report.steps}
+        assert steps['vacuum'].startswith('released')
+        assert steps['vacuum'] != 'released 0 page(s)'
+        assert report.ok and report.size_after < report.size_before
+
+
+@pytest.mark.sqlite_only
+def test_failed_integrity_check_fails_command(runner, monkeypatch):
+    """Test that corruption is reported with a non-zero exit status."""
+    monkeypatch.setattr(SQLiteMaintenance, 'check',
+                        lambda self, full=False: (False, 'page 7: corrupt'))
+    result = runner.invoke(args=['db-maintain'])
+    assert result.exit_code == 1
+    assert 'Integrity check failed: default' in result.output
+
+
+def test_scheduled_run_skips_busy_teams(app, sample_member, monkeypatch):
+    """Test that the idle-time job leaves a database alone while members are here."""
+    calls = []
+    monkeypatch.setattr(maintenance, 'maintain',
+                        lambda: calls.append(1) or maintenance.Report([], 0, 0, True))
+    with app.app_context():
+        Member.check_in_by_id(sample_member)
+    maintenance._maintain_idle_teams(app)
+    assert calls == []
+
+    with app.app_context():
+        Member.check_out_by_id(sample_member)
+    maintenance._maintain_idle_teams(app)
+    assert calls == [1]
+
+
+def test_scheduled_run_happens_once_across_workers(app, tmp_path, monkeypatch):
+    """Test that only the first worker to claim the day's run does it."""
+    app.instance_path = str(tmp_path)
+    calls = []
+    monkeypatch.setattr(maintenance, '_maintain_idle_teams', calls.append)
+
+    # Another worker is still running it
+    with maintenance.claim_scheduled_run(app, date.today()) as claimed:
+        assert claimed
+        maintain_idle_teams(app)
+    assert calls == []
+
+    # That worker finished; a late worker waking up finds the day taken
+    maintain_idle_teams(app)
+    assert calls == []
+
+    yesterday = date.today() - timedelta(days=1)
+    (tmp_path / 'db-maintain.lock').write_text(yesterday.isoformat())
+    maintain_idle_teams(app)
+    maintain_idle_teams(app)
+    assert calls == [app]
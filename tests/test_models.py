@@ -110,6 +110,53 @@ class TestMember:
             assert member.checked_in is False
             assert member.last_updated >= old_updated
     
+    def test_check_in_out_records_visit(self, app, sample_member):
+        """Test that a check-in/out pair records one attendance visit."""
+        with app.app_context():
+            member = Member.query.get(sample_member)
+            member.check_in()
+            member.check_in()  # Already checked in: no second visit
+            member.check_out()
+            
+            assert len(member.visits) == 1
+            visit = member.visits[0]
+            assert visit.checked_out_at >= visit.checked_in_at
+            assert visit.auto_checkout is False
+    
+    def test_check_in_by_id(self, app, sample_member):
+        """Test the single-statement check-in reports real state changes."""
+        with app.app_context():
+            result = Member.check_in_by_id(sample_member)
+            assert result.changed is True
+            assert result.full_name == 'John Doe'
+            assert Member.query.get(sample_member).checked_in is True
+            assert len(Member.query.get(sample_member).visits) == 1
+            
+            # Already checked in: nothing changes
+            assert Member.check_in_by_id(sample_member).changed is False
+            assert len(Member.query.get(sample_member).visits) == 1
+            
+            assert Member.check_out_by_id(sample_member).changed is True
+            assert Member.query.get(sample_member).checked_in is False
+            assert Member.check_in_by_id(99999) is None
+    
+    def test_check_in_by_idhash_requires_active(self, app, sample_member):
+        """Test that inactive members cannot be checked in by idhash."""
+        with app.app_context():
+            Member.query.get(sample_member).toggle_active_status()
+            assert Member.check_in_by_idhash(12345) is None
+            Member.query.get(sample_member).toggle_active_status()
+            assert Member.check_in_by_idhash(12345).changed is True
+    
+    def test_check_in_without_returning(self, app, sample_member, monkeypatch):
+        """Test the fallback for backends without UPDATE ... RETURNING."""
+        with app.app_context():
+            dialect = db.session.get_bind().dialect
+            monkeypatch.setattr(dialect, 'update_returning', False)
+            assert Member.check_in_by_id(sample_member).changed is True
+            assert Member.check_in_by_id(sample_member).changed is False
+            assert Member.query.get(sample_member).checked_in is True
+    
     def test_toggle_active_status(self, app, sample_member):
         """Test toggling member active status."""
         with app.app_context():
@@ -0,0 +1,75 @@
+"""
+Tests for the occupancy heatmap counters.
+"""
+
+from datetime import datetime, timedelta
+
+from flaskr.db import db
+from flaskr.models import Attendance, Member, OccupancyCount
+from flaskr.occupancy import occupancy_grid, rebuild_occupancy
+
+
+def test_buckets_split_visits_by_hour():
+    """Test that a visit is spread over the local hours it spans."""
+    start = datetime(2024, 2, 5, 18, 30).astimezone()
+    end = start + timedelta(hours=1, minutes=45)
+    buckets = list(OccupancyCount.buckets(start, end))
+    assert buckets == [(0, 18, 1800), (0, 19, 3600), (0, 20, 900)]
+
+
+def test_counters_follow_check_ins_and_outs(app, sample_member):
+    """Test that checking in and out updates the counters incrementally."""
+    with app.app_context():
+        Member.check_in_by_id(sample_member)
+        arrival = OccupancyCount.local(Attendance.query.one().checked_in_at)
+        grid = occupancy_grid()
+        assert grid['checkins'][arrival.weekday()][arrival.hour] == 1
+        assert sum(map(sum, grid['checkins'])) == 1
+
+        # Re-scanning while checked in is not another arrival
+        Member.check_in_by_id(sample_member)
+        assert sum(map(sum, occupancy_grid()['checkins'])) == 1
+
+        visit = Attendance.query.one()
+        visit.checked_in_at -= timedelta(hours=2)
+        db.session.commit()
+        Member.check_out_by_id(sample_member)
+        assert round(sum(map(sum, occupancy_grid()['person_hours']))) == 2
+
+
+def test_rebuild_matches_incremental_counts(app, multiple_members):
+    """Test that a rebuild from history gives the incrementally kept counts."""
+    with app.app_context():
+        start = datetime(2024, 2, 5, 17, 45)
+        for offset, member_id in enumerate(multiple_members):
+            arrival = start + timedelta(minutes=20 * offset)
+            db.session.add(Attendance(member_id=member_id, checked_in_at=arrival))
+            OccupancyCount.record_checkin(arrival)
+        db.session.commit()
+        Member.check_out_all(at=start + timedelta(hours=3))
+
+        incremental = occupancy_grid()
+        assert sum(map(sum, incremental['checkins'])) == 4
+        assert sum(map(sum, incremental['person_hours'])) == 10.0
+
+        db.session.query(OccupancyCount).delete()
+        db.session.commit()
+        assert rebuild_occupancy() == 4
+        assert occupancy_grid() == incremental
+
+
+def test_occupancy_api(client, sample_member):
+    """Test the heatmap endpoint."""
+    client.get(f'/members/{sample_member}/checkin')
+    data = client.get('/api/reports/occupancy').get_json()
+    assert data['weekdays'][0] == 'Monday'
+    assert len(data['checkins']) == 7
+    assert all(len(row) == 24 for row in data['person_hours'])
+    assert sum(map(sum, data['checkins'])) == 1
+
+
+def test_rebuild_occupancy_command(runner, app):
+    """Test the rebuild command."""
+    result = runner.invoke(args=['rebuild-occupancy'])
+    assert result.exit_code == 0
+    assert 'Rebuilt occupancy from 0 visit(s).' in result.output
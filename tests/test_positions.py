@@ -0,0 +1,72 @@
+"""
+Tests for the process-wide position registry.
+"""
+
+import pytest
+from sqlalchemy import event
+from flaskr.db import db, get_engine
+from flaskr.models import Member, Position
+from flaskr.positions import get_registry
+
+
+@pytest.fixture
+def statements(app):
+    """Record the SQL statements executed during a test."""
+    executed = []
+    with app.app_context():
+        engine = get_engine()
+
+    def record(conn, cursor, statement, *args):
+        executed.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_lookups_are_served_from_memory(app, sample_member, statements):
+    """Test that position names resolve without SQL once loaded."""
+    with app.app_context():
+        registry = get_registry()
+        registry.all()
+        member = db.session.get(Member, sample_member)
+        statements.clear()
+
+        assert member.position == 'member'
+        assert registry.by_name('coach').name == 'coach'
+        lead = registry.get(registry.by_name('lead').id)
+        assert lead.description.startswith('Team lead')
+        assert statements == []
+
+
+def test_registry_refreshes_after_changes(app):
+    """Test that inserts, updates and deletes invalidate the registry."""
+    with app.app_context():
+        registry = get_registry()
+        assert len(registry.all()) == 4
+
+        position = Position(name='alumni', description='Former member')
+        db.session.add(position)
+        db.session.commit()
+        assert registry.by_name('alumni') is not None
+
+        position.name = 'alum'
+        db.session.commit()
+        assert registry.by_name('alumni') is None
+        assert registry.name_of(position.id) == 'alum'
+
+        db.session.delete(position)
+        db.session.commit()
+        assert registry.by_name('alum') is None
+
+        Position.query.filter_by(name='coach').delete()
+        db.session.commit()
+        assert len(registry.all()) == 3
+
+
+def test_api_positions_member_counts(client, multiple_members):
+    """Test that member counts come back with the cached positions."""
+    positions = client.get('/api/positions').get_json()
+    assert {p['name']: p['member_count'] for p in positions} == {
+        'member': 1, 'lead': 1, 'mentor': 1, 'coach': 1
+    }
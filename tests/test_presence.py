@@ -0,0 +1,246 @@
+"""
+Tests for the shared presence snapshot.
+"""
+
+from functools import partial
+
+import pytest
+from sqlalchemy import update
+
+from flaskr import create_app, presence
+from flaskr.db import db
+from flaskr.models import Member, Position
+from flaskr.presence import PresenceSnapshot, get_snapshot
+
+
+def test_snapshot_follows_check_in_and_out(app, multiple_members):
+    """Test that commits update the snapshot counts."""
+    with app.app_context():
+        snapshot = get_snapshot()
+        assert snapshot.summary() == {'checked_in': 0, 'total_active': 4,
+                                      'total_members': 4}
+
+        member = db.session.get(Member, multiple_members[0])
+        version = snapshot.version
+        member.check_in()
+        assert snapshot.version > version
+        assert snapshot.summary()['checked_in'] == 1
+        assert snapshot.is_present(member.id)
+        assert snapshot.present_ids() == [member.id]
+
+        member.check_out()
+        assert snapshot.summary()['checked_in'] == 0
+        assert not snapshot.is_present(member.id)
+
+
+def test_snapshot_tracks_active_and_deleted(app, multiple_members):
+    """Test that inactive and deleted members drop out of the counts."""
+    with app.app_context():
+        snapshot = get_snapshot()
+        first = db.session.get(Member, multiple_members[0])
+        second = db.session.get(Member, multiple_members[1])
+        first.check_in()
+        second.check_in()
+
+        first.toggle_active_status()
+        assert snapshot.summary() == {'checked_in': 1, 'total_active': 3,
+                                      'total_members': 4}
+
+        db.session.delete(second)
+        db.session.commit()
+        assert snapshot.summary() == {'checked_in': 0, 'total_active': 2,
+                                      'total_members': 3}
+
+
+def test_snapshot_follows_single_statement_check_in(app, sample_member):
+    """Test that the UPDATE ... RETURNING path publishes to the snapshot."""
+    with app.app_context():
+        Member.check_in_by_id(sample_member)
+        assert get_snapshot().present_ids() == [sample_member]
+        Member.check_out_by_id(sample_member)
+        assert get_snapshot().present_ids() == []
+
+
+def test_snapshot_ignores_rolled_back_changes(app, multiple_members):
+    """Test that flushed but rolled back changes are not published."""
+    with app.app_context():
+        member = db.session.get(Member, multiple_members[0])
+        member.checked_in = True
+        db.session.flush()
+        db.session.rollback()
+        assert get_snapshot().summary()['checked_in'] == 0
+
+
+def test_snapshot_rebuilds_after_bulk_delete(app, multiple_members):
+    """Test that bulk deletes trigger a rebuild."""
+    with app.app_context():
+        Member.query.delete()
+        db.session.commit()
+        assert get_snapshot().summary()['total_members'] == 0
+
+
+def test_snapshot_shared_between_processes(tmp_path):
+    """Test that two mappings of one file see each other's writes."""
+    path = str(tmp_path / 'presence.bin')
+    writer = PresenceSnapshot(path)
+    reader = PresenceSnapshot(path)
+
+    writer.apply({3: (True, True), 5: (True, False)})
+    assert reader.summary() == {'checked_in': 1, 'total_active': 2, 'total_members': 2}
+    assert reader.version == writer.version
+
+    # Growing the bitsets remaps the other side transparently
+    writer.apply({100000: (True, True)})
+    assert reader.present_ids() == [3, 100000]
+
+    writer.close()
+    reader.close()
+
+
+@pytest.mark.sqlite_only
+def test_snapshot_file_follows_database(tmp_path):
+    """Test that apps on different databases in one instance folder keep apart."""
+    apps = [create_app({'TESTING': True,
+                        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / name}'},
+                       instance_path=str(tmp_path))
+            for name in ('one.sqlite', 'two.sqlite')]
+    with apps[0].app_context():
+        Position.create_default_positions()
+        db.session.add(Member(first_name='John', last_name='Doe', idhash=1,
+                              position_id=1))
+        db.session.commit()
+        assert get_snapshot().summary()['total_members'] == 1
+    with apps[1].app_context():
+        assert get_snapshot().summary()['total_members'] == 0
+
+    assert (tmp_path / 'one.sqlite.presence').exists()
+    assert (tmp_path / 'two.sqlite.presence').exists()
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+
+
+def file_apps(tmp_path, count=2):
+    """Create apps sharing one SQLite file, standing in for workers."""
+    config = {'TESTING': True,
+              'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "teamlog.sqlite"}'}
+    apps = [create_app(config, instance_path=str(tmp_path)) for _ in range(count)]
+    with apps[0].app_context():
+        Position.create_default_positions()
+        db.session.add(Member(first_name='John', last_name='Doe', idhash=1,
+                              position_id=1))
+        db.session.commit()
+    return apps
+
+
+@pytest.mark.sqlite_only
+def test_snapshot_follows_database_order_not_update_order(tmp_path):
+    """Test that a late update from one worker cannot undo a newer commit."""
+    first, second = file_apps(tmp_path)
+    with first.app_context():
+        Member.check_in_by_id(1)
+        first_snapshot = get_snapshot()
+    with second.app_context():
+        Member.check_out_by_id(1)
+        # The first worker's update for its check-in only arrives now
+        first_snapshot.sync(partial(presence._member_rows, db.engine), [1])
+        assert get_snapshot().present_ids() == []
+    for app in (first, second):
+        with app.app_context():
+            db.engine.dispose()
+
+
+@pytest.mark.sqlite_only
+def test_snapshot_reconciled_on_a_timer(tmp_path):
+    """Test that an update lost by a dead worker is caught up with."""
+    (app,) = file_apps(tmp_path, count=1)
+    app.config['PRESENCE_RECONCILE_INTERVAL'] = 60
+    with app.app_context():
+        # A worker commits a check-in but dies before updating the snapshot
+        db.session.execute(update(Member).values(checked_in=True))
+        db.session.commit()
+        assert get_snapshot().present_ids() == []
+
+    client = app.test_client()
+    assert client.get('/api/status').get_json()['checked_in'] == 0
+    app.extensions['presence_reconciled'][None] -= 60
+    assert client.get('/api/status').get_json()['checked_in'] == 1
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_snapshot_kept_in_database_for_server_databases(make_app, tmp_path,
+                                                       monkeypatch):
+    """Test that workers on a server database agree without a shared file."""
+    # Two apps on one database stand in for workers on two hosts; on SQLite
+    # they are made to treat it as a server database
+    monkeypatch.setattr(presence, '_in_database', lambda engine: True)
+    first = make_app(instance_path=str(tmp_path / 'first'))
+    second = make_app(instance_path=str(tmp_path / 'second'))
+    with first.app_context():
+        Position.create_default_positions()
+        db.session.add(Member(first_name='John', last_name='Doe', idhash=1,
+                              position_id=1))
+        db.session.commit()
+
+    assert second.test_client().get('/api/status').get_json()['total_members'] == 1
+    first.test_client().get('/members/1/checkin')
+
+    statuses = [app.test_client().get('/api/status').get_json()
+                for app in (first, second)]
+    assert [status['checked_in'] for status in statuses] == [1, 1]
+    assert statuses[0]['version'] == statuses[1]['version']
+    assert not list(tmp_path.glob('**/*.presence'))
+
+
+def test_dashboard_uses_snapshot(client, app, multiple_members):
+    """Test that the title-bar counter reflects the snapshot."""
+    with app.app_context():
+        db.session.get(Member, multiple_members[0]).check_in()
+
+    response = client.get('/members')
+    assert b'1/4 Present' in response.data
+
+
+def test_status_endpoint(client, app, multiple_members):
+    """Test the compact status document and its revalidation."""
+    client.get(f'/members/{multiple_members[2]}/checkin')
+    client.get(f'/members/{multiple_members[0]}/checkin')
+
+    response = client.get('/api/status')
+    assert response.status_code == 200
+    data = response.get_json()
+    counts = data['checked_in'], data['total_active'], data['total_members']
+    assert counts == (2, 4, 4)
+    assert data['present'] == [
+        {'id': multiple_members[2], 'name': 'Alice Johnson'},
+        {'id': multiple_members[0], 'name': 'Jane Smith'},
+    ]
+
+    # Unchanged snapshot: the display's cached copy is still good
+    etag = response.headers['ETag']
+    assert client.get('/api/status', headers={'If-None-Match': etag}).status_code == 304
+
+    # Renames and check-outs publish a new version
+    with app.app_context():
+        db.session.get(Member, multiple_members[2]).first_name = 'Alicia'
+        db.session.commit()
+    response = client.get('/api/status', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['present'][0]['name'] == 'Alicia Johnson'
+
+    client.get(f'/members/{multiple_members[0]}/checkout')
+    data = client.get('/api/status').get_json()
+    assert data['checked_in'] == 1
+    assert [member['id'] for member in data['present']] == [multiple_members[2]]
+
+
+def test_status_is_cached_per_version(app, multiple_members):
+    """Test that polling an unchanged snapshot does not query the database."""
+    from flaskr.presence import status_json
+
+    with app.app_context():
+        first = status_json()
+        assert status_json() is first
+        Member.check_in_by_id(multiple_members[1])
+        assert status_json()[0] > first[0]
@@ -0,0 +1,115 @@
+"""
+Tests for the opt-in request profiler.
+"""
+
+import json
+import os
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def profiled_app(make_app, tmp_path):
+    """An app with profiling enabled and profiles written to a temp dir."""
+    return make_app({
+        'PROFILE_ENABLED': True,
+        'PROFILE_DIR': str(tmp_path),
+        'PROFILE_ENDPOINTS': r'^main\.api_positions$'
+    })
+
+
+def profiles(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.prof'))
+
+
+def test_profiling_disabled_by_default(client, app, tmp_path):
+    """Test that nothing is profiled unless enabled."""
+    app.config['PROFILE_DIR'] = str(tmp_path)
+    client.get('/hello', headers={'X-Profile': '1'})
+    assert profiles(tmp_path) == []
+
+
+def test_profile_by_header_and_endpoint(profiled_app, tmp_path):
+    """Test that header and endpoint matches are profiled with metadata."""
+    client = profiled_app.test_client()
+    client.get('/hello')
+    assert profiles(tmp_path) == []
+
+    client.get('/hello', headers={'X-Profile': '1'})
+    client.get('/api/positions')
+    names = profiles(tmp_path)
+    assert len(names) == 2
+
+    with open(tmp_path / names[1].replace('.prof', '.json')) as f:
+        meta = json.load(f)
+    assert meta['endpoint'] == 'main.api_positions'
+    assert meta['status'] == 200
+    assert meta['latency_ms'] >= 0
+
+
+def test_sample_rate(profiled_app, tmp_path):
+    """Test 1-in-N sampling."""
+    profiled_app.config['PROFILE_ENDPOINTS'] = None
+    profiled_app.config['PROFILE_SAMPLE_RATE'] = 2
+    client = profiled_app.test_client()
+    for _ in range(4):
+        client.get('/hello')
+    assert len(profiles(tmp_path)) == 2
+
+
+def test_profile_summary_command(profiled_app, tmp_path):
+    """Test summarising the collected profiles."""
+    runner = profiled_app.test_cli_runner()
+    result = runner.invoke(args=['profile-summary'])
+    assert 'No profiles found.' in result.output
+
+    profiled_app.test_client().get('/api/positions')
+    result = runner.invoke(args=['profile-summary', '--limit', '5'])
+    assert result.exit_code == 0
+    assert '1 profile(s)' in result.output
+    assert 'main.api_positions: 1 request(s)' in result.output
+    assert 'function calls' in result.output
+
+
+def test_overlapping_requests_profile_one_at_a_time(profiled_app, tmp_path):
+    """Test that a request sampled while another is profiled runs unprofiled."""
+    entered, release = threading.Event(), threading.Event()
+
+    @profiled_app.route('/slow')
+    def slow():
+        entered.set()
+        release.wait(5)
+        return 'done'
+
+    responses = []
+    worker = threading.Thread(target=lambda: responses.append(
+        profiled_app.test_client().get('/slow', headers={'X-Profile': '1'})))
+    worker.start()
+    assert entered.wait(5)
+
+    response = profiled_app.test_client().get('/hello', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert profiles(tmp_path) == []
+
+    release.set()
+    worker.join(5)
+    assert responses[0].status_code == 200
+    assert len(profiles(tmp_path)) == 1
+
+    # The profiler is free again afterwards
+    profiled_app.test_client().get('/hello', headers={'X-Profile': '1'})
+    assert len(profiles(tmp_path)) == 2
+
+
+def test_failed_request_releases_profiler(profiled_app, tmp_path):
+    """Test that a view raising an error does not leave the profiler running."""
+    @profiled_app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    client = profiled_app.test_client()
+    with pytest.raises(RuntimeError):
+        client.get('/boom', headers={'X-Profile': '1'})
+    client.get('/hello', headers={'X-Profile': '1'})
+    assert len(profiles(tmp_path)) == 1
@@ -0,0 +1,73 @@
+"""
+Tests for the read-only member records.
+"""
+
+import pytest
+from flaskr.db import db
+from flaskr.models import Member
+from flaskr.records import (MemberRecord, active_members, all_members,
+                            checked_in_members, member_by_idhash, member_record,
+                            read_only_connection)
+from sqlalchemy import update
+from sqlalchemy.exc import DBAPIError
+
+
+def test_records_match_orm_objects(app, multiple_members):
+    """Test that records expose the same data as Member objects."""
+    with app.app_context():
+        records = all_members()
+        assert [record.id for record in records] == multiple_members
+        for record in records:
+            assert record.to_dict() == db.session.get(Member, record.id).to_dict()
+        assert records[0].full_name == 'Jane Smith'
+        assert records[0].position == 'lead'
+
+
+def test_records_are_not_tracked(app, multiple_members):
+    """Test that reading records leaves nothing in the session."""
+    with app.app_context():
+        db.session.expunge_all()
+        records = active_members()
+        assert len(records) == 4
+        assert len(db.session.identity_map) == 0
+        assert not hasattr(records[0], '__dict__')
+
+
+def test_records_use_a_read_only_connection(app, sample_member):
+    """Test that the read connection refuses writes and the session can still write."""
+    with app.app_context():
+        with read_only_connection() as conn:
+            with pytest.raises(DBAPIError):
+                conn.execute(update(Member.__table__).values(first_name='Changed'))
+            conn.rollback()
+
+        member = db.session.get(Member, sample_member)
+        member.first_name = 'Jack'
+        db.session.commit()
+        assert member_record(sample_member).first_name == 'Jack'
+
+
+def test_member_record_lookup(app, sample_member):
+    """Test fetching a single record."""
+    with app.app_context():
+        assert isinstance(member_record(sample_member), MemberRecord)
+        assert member_record(999) is None
+        assert member_by_idhash(12345).id == sample_member
+        assert member_by_idhash(1) is None
+
+
+def test_checked_in_members(app, multiple_members):
+    """Test that only active, checked-in members are listed."""
+    with app.app_context():
+        assert checked_in_members() == []
+        Member.check_in_by_id(multiple_members[1])
+        assert [record.id for record in checked_in_members()] == [multiple_members[1]]
+
+
+def test_api_members_uses_records(client, multiple_members):
+    """Test the member API responses."""
+    data = client.get('/api/members').get_json()
+    assert [member['id'] for member in data] == multiple_members
+    response = client.get(f'/api/members/{multiple_members[0]}')
+    assert response.get_json()['full_name'] == 'Jane Smith'
+    assert client.get('/api/members/999').status_code == 404
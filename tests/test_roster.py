@@ -0,0 +1,124 @@
+"""
+Tests for bulk roster updates.
+"""
+
+import json
+
+import pytest
+from flaskr.db import db
+from flaskr.models import Member
+from flaskr.presence import get_snapshot
+from flaskr.roster import RosterError, bulk_update, validate
+
+
+def test_bulk_update_applies_all_changes(app, multiple_members, sample_positions):
+    """Test that a batch updates every member in one go."""
+    with app.app_context():
+        coach = sample_positions['coach'].id
+        count = bulk_update([
+            {'id': multiple_members[0], 'active': False},
+            {'id': multiple_members[1], 'position_id': coach, 'first_name': 'Robert'},
+            {'id': multiple_members[2], 'idhash': 99999},
+        ])
+        assert count == 3
+
+        db.session.expire_all()
+        assert db.session.get(Member, multiple_members[0]).active is False
+        assert db.session.get(Member, multiple_members[1]).full_name == 'Robert Wilson'
+        assert db.session.get(Member, multiple_members[1]).position_id == coach
+        assert db.session.get(Member, multiple_members[2]).idhash == 99999
+        assert get_snapshot().summary()['total_active'] == 3
+
+
+def test_validation_reports_every_problem(app, multiple_members):
+    """Test that validation collects all errors and nothing is applied."""
+    with app.app_context():
+        with pytest.raises(RosterError) as exc:
+            bulk_update([
+                {'id': multiple_members[0], 'first_name': 'Janet'},
+                {'id': 999, 'active': False},
+                {'id': multiple_members[1], 'position_id': 42},
+                {'id': multiple_members[2], 'idhash': 67890},
+            ])
+        assert [(e['index'], e['error']) for e in exc.value.errors] == [
+            (1, 'member 999 does not exist'),
+            (2, 'position 42 does not exist'),
+            (3, f'idhash 67890 already belongs to member {multiple_members[0]}'),
+        ]
+
+        # The valid change was not applied either
+        assert db.session.get(Member, multiple_members[0]).first_name == 'Jane'
+
+
+def test_validation_checks_fields_and_types(app, multiple_members):
+    """Test that malformed changes are rejected before touching the database."""
+    with app.app_context():
+        with pytest.raises(RosterError) as exc:
+            validate([
+                {'id': multiple_members[0], 'active': 'no', 'nickname': 'Chuck'},
+                {'id': multiple_members[1], 'idhash': True, 'last_name': ' '},
+                {'id': multiple_members[1]},
+                {'active': True},
+            ])
+        assert [(e['index'], e['error']) for e in exc.value.errors] == [
+            (0, 'unknown field(s): nickname'),
+            (0, 'active must be bool'),
+            (1, 'idhash must be int'),
+            (1, 'last_name cannot be empty'),
+            (2, f'member {multiple_members[1]} is changed more than once'),
+            (3, 'each change needs an integer "id"'),
+        ]
+
+
+def test_idhash_can_move_within_batch(app, multiple_members):
+    """Test that a member may keep its own idhash and duplicates are rejected."""
+    with app.app_context():
+        validate([{'id': multiple_members[0], 'idhash': 67890}])
+        with pytest.raises(RosterError, match='invalid'):
+            validate([{'id': multiple_members[0], 'idhash': 5},
+                      {'id': multiple_members[1], 'idhash': 5}])
+
+
+def test_patch_api(client, app, multiple_members):
+    """Test the bulk PATCH endpoint."""
+    response = client.patch('/api/members', json=[
+        {'id': member_id, 'active': False} for member_id in multiple_members
+    ])
+    assert response.status_code == 200
+    assert response.get_json() == {'updated': 4}
+    with app.app_context():
+        assert Member.query.filter_by(active=True).count() == 0
+
+    response = client.patch('/api/members', json=[{'id': 'x'}])
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['index'] == 0
+
+    response = client.patch('/api/members', data='not json')
+    assert response.status_code == 400
+
+
+def test_update_members_command(runner, app, multiple_members, tmp_path):
+    """Test the CSV and JSON bulk update command."""
+    roster_csv = tmp_path / 'roster.csv'
+    roster_csv.write_text(
+        'id,active,last_name\n'
+        f'{multiple_members[0]},no,\n'
+        f'{multiple_members[1]},,Wilson-Smith\n'
+    )
+    result = runner.invoke(args=['update-members', '--dry-run', str(roster_csv)])
+    assert '2 change(s) are valid.' in result.output
+    with app.app_context():
+        assert Member.query.filter_by(active=False).count() == 0
+
+    result = runner.invoke(args=['update-members', str(roster_csv)])
+    assert result.exit_code == 0
+    assert 'Updated 2 member(s).' in result.output
+    with app.app_context():
+        assert db.session.get(Member, multiple_members[0]).active is False
+        assert db.session.get(Member, multiple_members[1]).last_name == 'Wilson-Smith'
+
+    roster_json = tmp_path / 'roster.json'
+    roster_json.write_text(json.dumps([{'id': 12345678}]))
+    result = runner.invoke(args=['update-members', str(roster_json)])
+    assert result.exit_code != 0
+    assert 'member 12345678 does not exist' in result.output
@@ -5,7 +5,8 @@ Tests for web routes and views.
 import pytest
 import json
 from flaskr.db import db
-from flaskr.models import Member, Position
+from sqlalchemy.exc import OperationalError
+from flaskr.models import Attendance, Member, Position
 
 
 class TestDashboardRoutes:
@@ -173,6 +174,37 @@ class TestAttendanceActions:
         # Should redirect back to dashboard without error
         assert response.status_code == 302
     
+    def test_quick_checkin_debounces_repeat_scans(self, client, app, sample_member):
+        """Test that repeated scans within the window are suppressed."""
+        client.post('/quick-checkin', data={'member_name': '12345'})
+        
+        with app.app_context():
+            Member.query.get(sample_member).check_out()
+        
+        response = client.post('/quick-checkin', data={'member_name': '12345'})
+        assert response.status_code == 302
+        
+        with app.app_context():
+            assert Member.query.get(sample_member).checked_in is False
+        
+        response = client.get('/api/metrics')
+        assert response.get_json()['quick_checkin.suppressed_scans'] == 1
+    
+    def test_quick_checkin_failed_scan_is_not_debounced(
+            self, client, app, sample_member, monkeypatch):
+        """Test that a rescan after a failed check-in is not suppressed."""
+        def fail(idhash):
+            raise OperationalError('UPDATE', {}, Exception('database is locked'))
+        
+        with monkeypatch.context() as patch:
+            patch.setattr(Member, 'check_in_by_idhash', staticmethod(fail))
+            with pytest.raises(OperationalError):
+                client.post('/quick-checkin', data={'member_name': '12345'})
+        
+        client.post('/quick-checkin', data={'member_name': '12345'})
+        with app.app_context():
+            assert Member.query.get(sample_member).checked_in is True
+    
     def test_activate_deactivate_member(self, client, app, sample_member):
         """Test activating and deactivating members."""
         # Deactivate
@@ -208,6 +240,21 @@ class TestAttendanceActions:
                 member = Member.query.get(member_id)
                 assert member.checked_in is False
 
+    def test_checkout_all_skips_inactive_members(self, client, app, multiple_members):
+        """Test that deactivated members are left alone and not counted."""
+        with app.app_context():
+            for member_id in multiple_members[:2]:
+                Member.query.get(member_id).check_in()
+            Member.query.get(multiple_members[1]).toggle_active_status()
+
+        response = client.get('/members/checkout-all', follow_redirects=True)
+        assert b'Successfully checked out 1 member(s).' in response.data
+
+        with app.app_context():
+            assert Member.query.get(multiple_members[1]).checked_in is True
+            assert Attendance.query.filter_by(member_id=multiple_members[1],
+                                              checked_out_at=None).count() == 1
+
 
 class TestMemberCRUD:
     """Tests for member CRUD operations."""
@@ -0,0 +1,68 @@
+"""
+Tests for batched kiosk scans.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from flaskr.db import db
+from flaskr.models import Attendance, Member
+
+
+def _scans(*idhashes, at=None):
+    return [{'idhash': idhash, 'scanned_at': at} for idhash in idhashes]
+
+
+def test_batch_checks_in_at_scan_time(client, app, multiple_members):
+    """Test that a batch is applied at once with the scanned times."""
+    earlier = (datetime.now(timezone.utc) - timedelta(hours=2)).replace(microsecond=0)
+    response = client.post('/api/scans', json={'scans': [
+        {'idhash': 67890, 'scanned_at': earlier.isoformat()},
+        {'idhash': 11111},
+        {'idhash': 67890},
+        {'idhash': 4242},
+    ]})
+    assert response.status_code == 200
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == ['checked_in', 'checked_in', 'already_checked_in', 'unknown']
+    assert response.get_json()['results'][0]['name'] == 'Jane Smith'
+
+    with app.app_context():
+        visit = Attendance.query.filter_by(member_id=multiple_members[0]).one()
+        assert visit.checked_in_at == earlier.replace(tzinfo=None)
+        assert Member.query.filter_by(checked_in=True).count() == 2
+        assert client.get('/api/status').get_json()['checked_in'] == 2
+
+
+def test_already_present_and_expired_scans(client, app, sample_member):
+    """Test scans of present members and scans older than SCAN_MAX_AGE."""
+    client.get(f'/members/{sample_member}/checkin')
+    stale = (datetime.now(timezone.utc) - timedelta(days=3)).isoformat()
+    results = client.post('/api/scans', json={'scans': [
+        {'idhash': 12345}, {'idhash': 12345, 'scanned_at': stale},
+    ]}).get_json()['results']
+    assert [result['status'] for result in results] == ['already_checked_in', 'expired']
+    with app.app_context():
+        assert Attendance.query.count() == 1
+
+
+def test_invalid_batches(client, app):
+    """Test validation errors."""
+    app.config['SCAN_BATCH_MAX'] = 2
+    assert client.post('/api/scans', json={'scans': _scans(1, 2, 3)}).status_code == 400
+    scans = [{'idhash': 'x'}, {'idhash': 1, 'scanned_at': 'soon'}]
+    response = client.post('/api/scans', json={'scans': scans})
+    assert response.status_code == 400
+    assert [error['index'] for error in response.get_json()['errors']] == [0, 1]
+    assert client.post('/api/scans', data='nope').status_code == 400
+
+
+def test_retried_batch_is_applied_once(client, app, sample_member):
+    """Test that batches honour Idempotency-Key."""
+    headers = {'Idempotency-Key': 'batch-1'}
+    first = client.post('/api/scans', json={'scans': _scans(12345)}, headers=headers)
+    with app.app_context():
+        Member.check_out_by_id(sample_member)
+    retry = client.post('/api/scans', json={'scans': _scans(12345)}, headers=headers)
+    assert retry.get_json() == first.get_json()
+    with app.app_context():
+        assert db.session.get(Member, sample_member).checked_in is False
@@ -0,0 +1,123 @@
+"""
+Tests for the parallel end-of-season report build.
+"""
+
+import csv
+import json
+import os
+from datetime import datetime
+
+import pytest
+from flaskr.db import db, get_engine, init_db
+from flaskr.models import Attendance, Member, Position
+
+np = pytest.importorskip('numpy')
+
+from flaskr.analytics import (  # noqa: E402
+    Intervals, member_stats, member_totals, merge_member_totals, stats_from_totals)
+from flaskr.archive import archive_dir  # noqa: E402
+from flaskr.season_reports import (  # noqa: E402
+    build_reports, load_intervals, month_ranges)
+
+
+def add_visits(member_ids):
+    """Visits across three months of the 2024 season."""
+    for month, hours in ((2, 3), (3, 2), (5, 1)):
+        for member_id in member_ids:
+            db.session.add(Attendance(
+                member_id=member_id,
+                checked_in_at=datetime(2024, month, 6, 18, 0),
+                checked_out_at=datetime(2024, month, 6, 18 + hours, 0)))
+    db.session.commit()
+
+
+def test_month_ranges():
+    """Test that ranges are split at month boundaries."""
+    ranges = month_ranges(datetime(2024, 11, 15), datetime(2025, 2, 1))
+    assert ranges == [
+        (datetime(2024, 11, 15), datetime(2024, 12, 1)),
+        (datetime(2024, 12, 1), datetime(2025, 1, 1)),
+        (datetime(2025, 1, 1), datetime(2025, 2, 1)),
+    ]
+
+
+def test_monthly_intervals_match_whole_range(app, multiple_members):
+    """Test that concatenated monthly ranges give the same stats as the whole range."""
+    start, end = datetime(2024, 1, 1), datetime(2025, 1, 1)
+    with app.app_context():
+        add_visits(multiple_members[:2])
+        with get_engine().connect() as connection:
+            parts = [load_intervals(connection, archive_dir(), *bounds, None)
+                     for bounds in month_ranges(start, end)]
+        assert [len(part) for part in parts if len(part)] == [2, 2, 2]
+        whole = Intervals(start, end)
+        assert member_stats(Intervals.concatenate(parts)) == member_stats(whole)
+        merged = merge_member_totals([member_totals(part) for part in parts])
+        assert stats_from_totals(merged) == member_stats(Intervals(start, end))
+        assert len(Intervals.concatenate([])) == 0
+
+
+def test_build_command(runner, app, multiple_members, tmp_path):
+    """Test building a season's reports in-process."""
+    app.config['REQUIRED_HOURS'] = 12
+    with app.app_context():
+        add_visits(multiple_members[:2])
+
+    result = runner.invoke(args=['reports', 'build', '--season', '2024',
+                                 '--output', str(tmp_path)])
+    assert result.exit_code == 0, result.output
+    assert '[12/12] season 2024' in result.output
+    assert 'Wrote season 2024 report' in result.output
+
+    directory = tmp_path / 'default' / 'season-2024'
+    report = json.loads((directory / 'summary.json').read_text())
+    assert report['meeting_days'] == 3
+    assert [m['total_hours'] for m in report['members']] == [6.0, 6.0]
+    assert report['members'][0]['name'] == 'Jane Smith'
+    assert report['members'][0]['percent_required'] == 50.0
+
+    with open(directory / 'summary.csv') as f:
+        assert len(list(csv.DictReader(f))) == 2
+
+    summary = (directory / 'members' / f'{multiple_members[0]}.txt').read_text()
+    assert 'Jane Smith' in summary
+    assert 'Meetings attended: 3 of 3' in summary
+
+    # Rebuilding swaps the link to a new version and keeps only the previous one
+    for _ in range(3):
+        runner.invoke(args=['reports', 'build', '--season', '2024',
+                            '--output', str(tmp_path)])
+    entries = sorted(os.listdir(tmp_path / 'default'))
+    assert entries[0] == 'season-2024' and len(entries) == 3
+    assert os.readlink(directory) == entries[-1]
+    assert json.loads((directory / 'summary.json').read_text())['meeting_days'] == 3
+
+
+@pytest.fixture
+def file_app(make_app, tmp_path):
+    """An app on a database file (or server), so worker processes can open it."""
+    app = make_app({'ARCHIVE_DIR': str(tmp_path / 'archive')})
+    with app.app_context():
+        init_db()
+        Position.create_default_positions()
+        members = [Member(first_name='M', last_name=str(i), idhash=500 + i,
+                          position_id=1)
+                   for i in range(3)]
+        db.session.add_all(members)
+        db.session.commit()
+        add_visits([member.id for member in members])
+    return app
+
+
+def test_parallel_build_matches_serial(file_app, tmp_path):
+    """Test that worker processes produce the same report as a serial build."""
+    with file_app.app_context():
+        build_reports([None], [2024], workers=2, output=str(tmp_path / 'parallel'))
+        build_reports([None], [2024], workers=1, output=str(tmp_path / 'serial'))
+
+    def members(name):
+        path = tmp_path / name / 'default' / 'season-2024' / 'summary.json'
+        return json.loads(path.read_text())['members']
+
+    assert members('parallel') == members('serial')
+    assert [m['visits'] for m in members('parallel')] == [3, 3, 3]
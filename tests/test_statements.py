@@ -0,0 +1,36 @@
+"""
+Tests for the prebuilt hot-path statements.
+"""
+
+from sqlalchemy.engine.default import CACHE_HIT
+
+from flaskr import statements
+from flaskr.db import db
+from flaskr.models import Member
+
+
+def test_statements_hit_the_compiled_cache(app, sample_member):
+    """Test that repeated executions reuse the compiled SQL."""
+    with app.app_context():
+        for _ in range(2):
+            result = db.session.execute(statements.MEMBER_BY_IDHASH, {'idhash': 12345})
+        assert result.context.cache_hit is CACHE_HIT
+        assert result.first().id == sample_member
+
+
+def test_idhash_check_in_without_returning(app, sample_member, monkeypatch):
+    """Test the select-then-update path keyed by idhash."""
+    with app.app_context():
+        monkeypatch.setattr(db.session.get_bind().dialect, 'update_returning', False)
+        assert Member.check_in_by_idhash(12345).changed is True
+        assert Member.check_in_by_idhash(12345).changed is False
+        assert Member.check_in_by_idhash(1) is None
+        assert db.session.get(Member, sample_member).checked_in is True
+
+
+def test_benchmark_queries_command(runner, sample_member):
+    """Test that the benchmark reports every query."""
+    result = runner.invoke(args=['benchmark-queries', '--number', '5'])
+    assert result.exit_code == 0
+    for name in ('idhash lookup', 'active members', 'checked-in members', 'positions'):
+        assert name in result.output
@@ -0,0 +1,136 @@
+"""
+Tests for multi-team database routing.
+"""
+
+import pytest
+from flaskr import create_app
+from flaskr.db import db, init_db
+from flaskr.models import Member, Position
+from flaskr.teams import team_context
+
+# Team databases are in-memory SQLite binds
+pytestmark = pytest.mark.sqlite_only
+
+
+@pytest.fixture
+def team_app():
+    """Create an app with two team databases."""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        'TEAMS': {'997': 'sqlite:///:memory:', '1425': 'sqlite:///:memory:'},
+        'TEAM_HOSTS': {'spartans.example.org': '997'},
+        'SECRET_KEY': 'test-key'
+    })
+
+    with app.app_context():
+        init_db()
+        Position.create_default_positions()
+        for team in ('997', '1425'):
+            with team_context(team):
+                init_db()
+                Position.create_default_positions()
+
+    yield app
+
+
+def add_member(team, first_name, idhash):
+    """Add a member to a team's database."""
+    with team_context(team):
+        position = Position.query.filter_by(name='member').first()
+        db.session.add(Member(first_name=first_name, last_name='Team', idhash=idhash,
+                              position_id=position.id))
+        db.session.commit()
+
+
+def test_team_databases_are_isolated(team_app):
+    """Test that each team only sees its own members."""
+    with team_app.app_context():
+        add_member('997', 'Spartan', 1)
+        add_member('1425', 'Error', 1)
+
+        with team_context('997'):
+            assert [m.first_name for m in Member.query.all()] == ['Spartan']
+        with team_context('1425'):
+            assert [m.first_name for m in Member.query.all()] == ['Error']
+        assert Member.query.count() == 0
+
+
+def test_team_selected_from_header(team_app):
+    """Test that the X-Team header routes requests when it is enabled."""
+    with team_app.app_context():
+        add_member('1425', 'Error', 7)
+
+    client = team_app.test_client()
+    response = client.get('/api/members', headers={'X-Team': '1425'},
+                          base_url='http://spartans.example.org')
+    assert response.get_json() == []
+
+    team_app.config['TEAM_HEADER_ENABLED'] = True
+    response = client.get('/api/members', headers={'X-Team': '1425'})
+    assert [m['first_name'] for m in response.get_json()] == ['Error']
+
+    response = client.get('/api/members')
+    assert response.get_json() == []
+
+
+def test_team_selected_from_host(team_app):
+    """Test that teams are selected from mapped hosts and subdomains."""
+    with team_app.app_context():
+        add_member('997', 'Spartan', 1)
+        add_member('1425', 'Error', 2)
+
+    client = team_app.test_client()
+    response = client.get('/api/members', base_url='http://spartans.example.org')
+    assert [m['first_name'] for m in response.get_json()] == ['Spartan']
+
+    response = client.get('/api/members', base_url='http://1425.example.org')
+    assert [m['first_name'] for m in response.get_json()] == ['Error']
+
+
+def test_unknown_team_header(team_app):
+    """Test that an unknown team is rejected."""
+    team_app.config['TEAM_HEADER_ENABLED'] = True
+    response = team_app.test_client().get('/api/members', headers={'X-Team': 'nope'})
+    assert response.status_code == 404
+
+
+def test_team_hosts_must_name_configured_teams(tmp_path):
+    """Test that a TEAM_HOSTS typo stops the app at startup."""
+    with pytest.raises(ValueError, match='unknown team'):
+        create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+                    'TEAMS': ['997'], 'TEAM_HOSTS': {'spartans.example.org': '979'}},
+                   instance_path=str(tmp_path))
+
+
+def test_seed_db_single_team(team_app):
+    """Test seeding only one team's database."""
+    result = team_app.test_cli_runner().invoke(args=['seed-db', '--team', '997'])
+    assert result.exit_code == 0
+    assert '[997] Added 10 sample members to the database.' in result.output
+
+    with team_app.app_context():
+        with team_context('997'):
+            assert Member.query.count() == 10
+        with team_context('1425'):
+            assert Member.query.count() == 0
+
+
+def test_seed_db_all_teams(team_app):
+    """Test seeding every team's database and the default one."""
+    result = team_app.test_cli_runner().invoke(args=['seed-db', '--all-teams'])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0] == 'Added 10 sample members to the database.'
+    assert '[997]' in result.output
+    assert '[1425]' in result.output
+
+    with team_app.app_context():
+        for team in (None, '997', '1425'):
+            with team_context(team):
+                assert Member.query.count() == 10
+
+
+def test_seed_db_unknown_team(team_app):
+    """Test that an unknown team name is rejected by the CLI."""
+    result = team_app.test_cli_runner().invoke(args=['seed-db', '--team', 'nope'])
+    assert result.exit_code != 0
@@ -0,0 +1,111 @@
+"""
+Tests for write coordination and lock retries.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from flaskr.db import get_engine
+from flaskr.metrics import get_metrics
+from flaskr.writes import WriterLock, is_transient, run_write, writer_lock
+
+
+def locked_error(message='database is locked'):
+    return OperationalError('COMMIT', {}, sqlite3.OperationalError(message))
+
+
+@pytest.fixture
+def fast_retries(app):
+    app.config['WRITE_RETRY_BASE_DELAY'] = 0.001
+    app.config['WRITE_RETRY_MAX_DELAY'] = 0.002
+    return app
+
+
+def test_is_transient():
+    """Test recognising lock errors."""
+    assert is_transient(locked_error())
+    assert not is_transient(locked_error('no such table: members'))
+    assert not is_transient(ValueError('database is locked'))
+
+
+def test_retries_transient_lock_errors(fast_retries):
+    """Test that lock errors are retried until the write succeeds."""
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise locked_error()
+        return 'done'
+
+    with fast_retries.app_context():
+        assert run_write(write) == 'done'
+        assert get_metrics().get('writes.retries') == 2
+    assert len(attempts) == 3
+
+
+def test_gives_up_after_retries(fast_retries):
+    """Test that persistent lock errors are eventually raised."""
+    fast_retries.config['WRITE_RETRIES'] = 2
+
+    def write():
+        raise locked_error()
+
+    with fast_retries.app_context():
+        with pytest.raises(OperationalError):
+            run_write(write)
+        assert get_metrics().get('writes.retries') == 2
+        assert get_metrics().get('writes.failures') == 1
+
+
+def test_other_errors_are_not_retried(fast_retries):
+    """Test that non-transient errors are raised at once."""
+    attempts = []
+
+    def write():
+        attempts.append(1)
+        raise locked_error('disk I/O error')
+
+    with fast_retries.app_context():
+        with pytest.raises(OperationalError):
+            run_write(write)
+    assert len(attempts) == 1
+
+
+@pytest.mark.sqlite_only
+def test_writers_are_serialized(app):
+    """Test that a second writer waits for the writer lock and is counted."""
+    with app.app_context():
+        lock = writer_lock(get_engine())
+
+    lock.acquire()
+    done = threading.Event()
+
+    def other_writer():
+        with app.app_context():
+            run_write(lambda: None)
+        done.set()
+
+    thread = threading.Thread(target=other_writer)
+    thread.start()
+    assert not done.wait(0.05)
+    lock.release()
+    thread.join()
+
+    with app.app_context():
+        assert get_metrics().get('writes.contention') == 1
+
+
+def test_writer_lock_spans_processes(tmp_path):
+    """Test that two holders of the sidecar file exclude each other."""
+    # Separate instances open the file separately, like two worker processes
+    path = str(tmp_path / 'teamlog.sqlite.lock')
+    first, second = WriterLock(path), WriterLock(path)
+    with first:
+        with first:
+            assert not second.acquire(blocking=False)
+        assert not second.acquire(blocking=False)
+    assert second.acquire(blocking=False)
+    second.release()